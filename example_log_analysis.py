@@ -3,7 +3,7 @@ from functools import partial
 import pm4py
 
 from special4pm.estimation import SpeciesEstimator
-from special4pm.species import retrieve_species_n_gram
+from special4pm.species import retrieve_species_n_gram_family, TraceVariant
 from special4pm.visualization import plot_rank_abundance, plot_completeness_profile, plot_diversity_profile
 
 #Estimates completeness profiles and species richness for different species retrieval functions on the provided
@@ -14,11 +14,10 @@ PATH_TO_XES = "logs/BPI_Challenge_2018.xes"
 log = pm4py.read_xes(PATH_TO_XES, return_legacy_log_object=True)
 
 estimator = SpeciesEstimator(step_size=None)
-estimator.register("1-gram", partial(retrieve_species_n_gram, n=1))
-estimator.register("2-gram", partial(retrieve_species_n_gram, n=2))
-estimator.register("3-gram", partial(retrieve_species_n_gram, n=3))
-estimator.register("4-gram", partial(retrieve_species_n_gram, n=4))
-estimator.register("5-gram", partial(retrieve_species_n_gram, n=5))
+#all n-grams up to length 5 are retrieved together, while each length keeps its own profile
+estimator.register_family(["1-gram", "2-gram", "3-gram", "4-gram", "5-gram"],
+                          partial(retrieve_species_n_gram_family, ns=[1, 2, 3, 4, 5]))
+estimator.register("trace variant", TraceVariant())
 
 estimator.apply(log)
 estimator.print_metrics()
@@ -1,11 +1,14 @@
 import math
 import statistics
+from functools import partial
 
 import numpy as np
+from scipy.sparse import csr_matrix
 
 from special4pm.estimation.metrics import get_singletons, get_doubletons, get_total_species_count, \
     hill_number_asymptotic, completeness, \
     coverage
+from special4pm.estimation import batch_metrics
 
 
 def generate_bootstrap_samples_abundance(reference_sample, n):
@@ -54,6 +57,69 @@ def get_bootstrap_ci_incidence(reference_sample, sample_size, no_samples):
     return [statistics.stdev(x)*1.96 for x in (d0,d1,d2,c0,c1)]
 
 
+def get_nonparametric_bootstrap_ci_incidence(matrix, no_samples, seed=None, batch_size=None):
+    """
+    derives confidence intervals of the incidence-based estimates by resampling the traces of the log with
+    replacement, as a nonparametric alternative to get_bootstrap_ci_incidence. The replicates of each batch are scored
+    at once by the vectorized metric kernels, see batch_metrics
+    :param matrix: the trace x species matrix of the log, see SpeciesMatrix
+    :param no_samples: the number of bootstrap replicates
+    :param seed: the seed of the random number generator
+    :param batch_size: the number of replicates computed at once, by default bounding the weight matrix to 10^7 entries
+    :return: the half-widths of the 95% confidence intervals of D0, D1, D2, C0 and C1
+    """
+    estimates = [[] for _ in range(5)]
+    for stats in generate_nonparametric_bootstrap_batches_incidence(matrix, no_samples, seed, batch_size):
+        for values, kernel in zip(estimates, (partial(batch_metrics.batch_hill_number_estimate, 0),
+                                              partial(batch_metrics.batch_hill_number_estimate, 1),
+                                              partial(batch_metrics.batch_hill_number_estimate, 2),
+                                              batch_metrics.batch_completeness, batch_metrics.batch_coverage)):
+            values.append(kernel(stats))
+
+    return [float(np.std(np.concatenate(x), ddof=1)) * 1.96 for x in estimates]
+
+
+def generate_nonparametric_bootstrap_batches_incidence(matrix, no_samples, seed=None, batch_size=None):
+    """
+    generates bootstrap replicates of the incidence reference sample by resampling traces with replacement. The
+    replicates of a batch are computed at once as the product of their multinomial trace weights and the incidence
+    matrix
+    :param matrix: the trace x species matrix of the log, see SpeciesMatrix
+    :param no_samples: the number of bootstrap replicates
+    :param seed: the seed of the random number generator
+    :param batch_size: the number of replicates computed at once
+    :return: generator of the replicates of each batch as (replicates x species) incidence counts, whose sample sizes
+    are the numbers of non-empty traces
+    """
+    rng = np.random.default_rng(seed)
+    n = len(matrix)
+    batch_size = max(1, 10 ** 7 // max(n, 1)) if batch_size is None else batch_size
+    incidence = matrix.incidence_matrix()
+    non_empty = (np.diff(matrix.indptr) > 0).astype(np.int64)
+    p = np.full(n, 1 / max(n, 1))
+
+    for start in range(0, no_samples, batch_size):
+        size = min(batch_size, no_samples - start)
+        # the number of times each trace is drawn, i.e. one multinomial weight vector per replicate
+        weights = csr_matrix(rng.multinomial(n, p, size=size))
+        counts = (weights @ incidence).tocsr()
+        counts.eliminate_zeros()
+        yield batch_metrics.BatchStatistics(counts, weights @ non_empty, False)
+
+
+def generate_nonparametric_bootstrap_samples_incidence(matrix, no_samples, seed=None, batch_size=None):
+    """
+    generates bootstrap replicates of the incidence reference sample one by one, see
+    generate_nonparametric_bootstrap_batches_incidence
+    :return: generator of the incidence counts of each replicate and its number of non-empty traces
+    """
+    for stats in generate_nonparametric_bootstrap_batches_incidence(matrix, no_samples, seed, batch_size):
+        for i in range(len(stats)):
+            start, stop = stats.matrix.indptr[i], stats.matrix.indptr[i + 1]
+            yield dict(zip(stats.matrix.indices[start:stop].tolist(), stats.counts[start:stop].tolist())), \
+                int(stats.sample_size[i])
+
+
 def generate_bootstrap_samples_incidence(reference_sample, sample_size, no_bs_samples):
     #get bootstrap distribution of species
     f_0 = 0
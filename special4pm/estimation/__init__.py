@@ -1 +1,2 @@
-from special4pm.estimation.species_estimator import SpeciesEstimator
\ No newline at end of file
+from special4pm.estimation.species_estimator import SpeciesEstimator
+from special4pm.estimation.multi_log import MultiLogEstimator
@@ -0,0 +1,215 @@
+import math
+from functools import cached_property, partial
+from typing import Callable
+
+import numpy as np
+from numpy import euler_gamma
+from scipy.sparse import csr_matrix
+from scipy.special import digamma
+
+from special4pm.estimation.metric_registry import Metric, _sample_size, _total_species_count, _singletons, \
+    _doubletons, _coverage, _hill_number_estimate
+from special4pm.estimation.metrics import SampleStatistics, entropy_exp, simpson_diversity, completeness
+
+# exact harmonic numbers up to 100, summed in the same order as metrics.harmonic
+_HARMONIC = np.concatenate([[0.0], np.cumsum(1 / np.arange(1, 101))])
+
+
+def harmonic(n: np.ndarray) -> np.ndarray:
+    """
+    vectorized version of metrics.harmonic
+    :param n: array of non-negative integers
+    :return: the n-th harmonic numbers
+    """
+    n = np.asarray(n, dtype=np.int64)
+    return np.where(n <= 100, _HARMONIC[np.minimum(n, 100)], digamma(np.maximum(n, 1) + 1) + euler_gamma)
+
+
+class BatchStatistics:
+    """
+    The reference samples of several logs as rows of a (logs x species) count matrix, computing each sufficient
+    statistic at most once for all rows. Counterpart of SampleStatistics for the vectorized metric kernels, see
+    batch_kernel
+    """
+
+    def __init__(self, counts: csr_matrix, sample_size: np.ndarray, abundance: bool) -> None:
+        """
+        :param counts: the abundance or incidence counts of each species in each log
+        :param sample_size: the sample size associated with the species counts of each log
+        :param abundance: flag indicating the data type
+        """
+        self.matrix = counts
+        self.sample_size = np.asarray(sample_size, dtype=np.int64)
+        self.abundance = abundance
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @cached_property
+    def rows(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self)), np.diff(self.matrix.indptr))
+
+    @cached_property
+    def counts(self) -> np.ndarray:
+        return self.matrix.data.astype(np.int64)
+
+    def row_sum(self, values: np.ndarray) -> np.ndarray:
+        """
+        :param values: a value per non-zero count
+        :return: the sum of the values of each row
+        """
+        return np.bincount(self.rows, weights=values, minlength=len(self))
+
+    @cached_property
+    def observed(self) -> np.ndarray:
+        return np.diff(self.matrix.indptr)
+
+    @cached_property
+    def total(self) -> np.ndarray:
+        return self.row_sum(self.counts).astype(np.int64)
+
+    @property
+    def total_species_count(self) -> np.ndarray:
+        return self.total
+
+    @cached_property
+    def f_1(self) -> np.ndarray:
+        return self.row_sum(self.counts == 1).astype(np.int64)
+
+    @cached_property
+    def f_2(self) -> np.ndarray:
+        return self.row_sum(self.counts == 2).astype(np.int64)
+
+    def statistics(self, i: int) -> SampleStatistics:
+        """
+        :param i: the row
+        :return: the reference sample of a single row, for metrics without vectorized kernel
+        """
+        start, stop = self.matrix.indptr[i], self.matrix.indptr[i + 1]
+        return SampleStatistics(dict(zip(self.matrix.indices[start:stop].tolist(), self.counts[start:stop].tolist())),
+                                int(self.sample_size[i]), self.abundance, int(self.total[i]))
+
+
+def _divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    # element-wise division yielding 0 where the denominator is 0, which is handled separately by all callers
+    numerator, denominator = np.broadcast_arrays(np.asarray(numerator, dtype=float),
+                                                 np.asarray(denominator, dtype=float))
+    return np.divide(numerator, denominator, out=np.zeros(numerator.shape), where=denominator != 0)
+
+
+def batch_chao(stats: BatchStatistics) -> np.ndarray:
+    """
+    vectorized version of metrics.estimate_species_richness_chao
+    """
+    f_1, f_2 = stats.f_1, stats.f_2
+    return np.where(f_2 != 0, stats.observed + _divide(f_1 ** 2, 2 * f_2), stats.observed + f_1 * (f_1 - 1) / 2)
+
+
+def batch_entropy_exp(stats: BatchStatistics) -> np.ndarray:
+    """
+    vectorized version of metrics.entropy_exp
+    """
+    p = stats.counts / np.repeat(stats.total, stats.observed)
+    return np.exp(-stats.row_sum(p * np.log(p)))
+
+
+def batch_simpson_diversity(stats: BatchStatistics) -> np.ndarray:
+    """
+    vectorized version of metrics.simpson_diversity
+    """
+    a = stats.row_sum((stats.counts / np.repeat(stats.total, stats.observed)) ** 2)
+    return np.where(a > 0, _divide(1, a), 1)
+
+
+def batch_entropy(stats: BatchStatistics) -> np.ndarray:
+    """
+    vectorized version of metrics.estimate_entropy
+    """
+    n, f_1, f_2 = stats.sample_size, stats.f_1, stats.f_2
+    x = stats.counts
+    n_x = np.repeat(n, stats.observed)
+    known = stats.row_sum(np.where(x <= n_x - 1, _divide(x, n_x) * (harmonic(n_x) - harmonic(np.maximum(x - 1, 0))),
+                                   0))
+    a = np.where(f_2 > 0, _divide(2 * f_2, (n - 1) * f_1 + 2 * f_2),
+                 np.where(f_1 > 0, _divide(2, (n - 1) * (f_1 - 1) + 2), 1))
+
+    entropy = known.copy()
+    # the estimated entropy of unseen species, whose series is evaluated per log
+    for i in np.flatnonzero((n > 1) & (a != 1) & ~((f_1 == 1) & (f_2 >= 20))):
+        r = np.arange(1, n[i])
+        entropy[i] = known[i] + (f_1[i] / n[i]) * (1 - a[i]) ** (-n[i] + 1) * (
+                -math.log(a[i]) - np.sum(1 / r * (1 - a[i]) ** r))
+    return np.where(n <= 1, 0.0, entropy)
+
+
+def batch_hill_number_estimate(d: int, stats: BatchStatistics) -> np.ndarray:
+    """
+    vectorized version of metrics.hill_number_asymptotic
+    """
+    n, u = stats.sample_size, stats.total
+    if d == 0:
+        return batch_chao(stats)
+    if d == 1:
+        h = batch_entropy(stats)
+        if stats.abundance:
+            return np.where((u == 0) | (n == 0), 0.0, np.exp(h))
+        with np.errstate(divide="ignore"):
+            return np.where(u == 0, 0.0, np.exp(_divide(n, u) * h + np.log(_divide(u, n))))
+    if d == 2:
+        s = stats.row_sum(stats.counts * (stats.counts - 1))
+        if stats.abundance:
+            return np.where(s == 0, 0.0, _divide(n * (n - 1), s))
+        return np.where((u == 0) | (s == 0), 0.0, _divide(((1 - _divide(1, n)) * u) ** 2, s))
+
+
+def batch_completeness(stats: BatchStatistics) -> np.ndarray:
+    """
+    vectorized version of metrics.completeness
+    """
+    return _divide(stats.observed, batch_chao(stats))
+
+
+def batch_coverage(stats: BatchStatistics) -> np.ndarray:
+    """
+    vectorized version of metrics.coverage
+    """
+    n, f_1, f_2 = stats.sample_size, stats.f_1, stats.f_2
+    value = 1 - _divide(f_1, stats.total) * _divide((n - 1) * f_1, (n - 1) * f_1 + 2 * f_2)
+    value = np.where((f_1 == 0) & (f_2 == 0), 1.0, value)
+    return np.where((n == 0) | ((f_2 == 0) & (n == 1)), 0.0, value)
+
+
+def batch_kernel(metric: Metric) -> Callable | None:
+    """
+    returns the vectorized kernel of a default metric per data type, computing the metric for all rows of a
+    BatchStatistics at once
+    :param metric: the metric
+    :return: the kernel, or None if the metric has to be computed row by row from SampleStatistics
+    """
+    function = metric.function
+    if isinstance(function, partial) and function.func is _hill_number_estimate:
+        return partial(batch_hill_number_estimate, *function.args)
+    return {
+        _sample_size: lambda stats: stats.sample_size,
+        _total_species_count: lambda stats: stats.total_species_count,
+        _singletons: lambda stats: stats.f_1,
+        _doubletons: lambda stats: stats.f_2,
+        len: lambda stats: stats.observed,
+        entropy_exp: batch_entropy_exp,
+        simpson_diversity: batch_simpson_diversity,
+        completeness: batch_completeness,
+        _coverage: batch_coverage,
+    }.get(function)
+
+
+def batch_metric(metric: Metric, stats: BatchStatistics) -> np.ndarray:
+    """
+    computes a metric per data type for all rows of a BatchStatistics, by its vectorized kernel if available
+    :param metric: the metric
+    :param stats: the reference samples
+    :return: the value of the metric for each row
+    """
+    kernel = batch_kernel(metric)
+    if kernel is not None:
+        return np.asarray(kernel(stats), dtype=float)
+    return np.array([metric.function(stats.statistics(i)) for i in range(len(stats))], dtype=float)
@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from scipy.sparse import csr_matrix
+
+from special4pm.estimation.batch_metrics import BatchStatistics, batch_chao, _divide
+
+
+def align_counts(reference_samples: list) -> (csr_matrix, list):
+    """
+    aligns the reference samples of several logs on their shared vocabulary
+    :param reference_samples: the species with corresponding abundance or incidence counts of each log
+    :return: the (logs x species) count matrix and the species of its columns
+    """
+    vocabulary = {}
+    indptr = [0]
+    indices = []
+    data = []
+    for reference_sample in reference_samples:
+        observed = sorted((vocabulary.setdefault(s, len(vocabulary)), c) for s, c in reference_sample.items() if c > 0)
+        indices.extend(j for j, _ in observed)
+        data.extend(c for _, c in observed)
+        indptr.append(len(indices))
+    return csr_matrix((np.asarray(data, dtype=np.int64), np.asarray(indices, dtype=np.int64),
+                       np.asarray(indptr, dtype=np.int64)), shape=(len(reference_samples), len(vocabulary))), \
+        list(vocabulary.keys())
+
+
+def _indicator(counts: csr_matrix, mask: np.ndarray) -> csr_matrix:
+    # the binary matrix of the entries selected by mask, a condition over the non-zero counts
+    matrix = csr_matrix((mask.astype(np.int64), counts.indices.copy(), counts.indptr.copy()), shape=counts.shape)
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def _pairwise(a: csr_matrix, b: csr_matrix) -> np.ndarray:
+    # the inner products of all rows of a with all rows of b, i.e. sums over the species of each pair of logs
+    return np.asarray((a @ b.T).todense(), dtype=float)
+
+
+def _unseen_term(f_1: np.ndarray, f_2: np.ndarray, divisor: int) -> np.ndarray:
+    # the Chao term f_1^2/(divisor*f_2), using the bias-corrected f_1(f_1-1)/divisor if there are no doubletons
+    return np.where(f_2 > 0, _divide(f_1 ** 2, divisor * f_2), f_1 * (f_1 - 1) / divisor)
+
+
+def shared_species_observed(counts: csr_matrix) -> np.ndarray:
+    """
+    counts the observed species shared by every pair of logs
+    :param counts: the (logs x species) abundance or incidence counts, see align_counts
+    :return: the (logs x logs) matrix of the number of shared species
+    """
+    observed = _indicator(counts, counts.data > 0)
+    return _pairwise(observed, observed)
+
+
+def estimate_shared_species_chao(counts: csr_matrix, sample_size: np.ndarray) -> np.ndarray:
+    """
+    estimates the number of species shared by every pair of logs, including shared species not observed in both logs,
+    using Chao's shared-species estimator (Pan, Chao and Foo, 2009). For a pair of logs, it adds to the number of
+    observed shared species the terms (n-1)/n*f_1+^2/(2f_2+), (m-1)/m*f_+1^2/(2f_+2) and
+    (n-1)/n*(m-1)/m*f_11^2/(4f_22), where f_1+ is the number of shared species that are singletons in the first log,
+    f_+1 the number of shared species that are singletons in the second log and f_11 the number of shared species that
+    are singletons in both logs, and f_2+, f_+2 and f_22 the respective numbers of doubletons. For incidence data,
+    n and m are the numbers of traces
+    :param counts: the (logs x species) abundance or incidence counts, see align_counts
+    :param sample_size: the sample size of each log
+    :return: the (logs x logs) matrix of the estimated number of shared species, with the estimated species richness
+    of each log on the diagonal
+    """
+    observed = _indicator(counts, counts.data > 0)
+    singletons = _indicator(counts, counts.data == 1)
+    doubletons = _indicator(counts, counts.data == 2)
+    f_1x = _pairwise(singletons, observed)
+    f_2x = _pairwise(doubletons, observed)
+    f_11 = _pairwise(singletons, singletons)
+    f_22 = _pairwise(doubletons, doubletons)
+    factor = _divide(np.asarray(sample_size) - 1, sample_size)[:, None]
+
+    shared = _pairwise(observed, observed) + factor * _unseen_term(f_1x, f_2x, 2) + \
+        factor.T * _unseen_term(f_1x.T, f_2x.T, 2) + factor * factor.T * _unseen_term(f_11, f_22, 4)
+    np.fill_diagonal(shared, batch_chao(BatchStatistics(counts, sample_size, True)))
+    return shared
+
+
+def sorensen(counts: csr_matrix) -> np.ndarray:
+    """
+    computes the classic Sørensen similarity 2*S_12/(S_1+S_2) of the observed species of every pair of logs
+    :param counts: the (logs x species) abundance or incidence counts, see align_counts
+    :return: the (logs x logs) similarity matrix
+    """
+    shared = shared_species_observed(counts)
+    richness = np.diag(shared)
+    return _divide(2 * shared, richness[:, None] + richness[None, :])
+
+
+def jaccard(counts: csr_matrix) -> np.ndarray:
+    """
+    computes the classic Jaccard similarity S_12/(S_1+S_2-S_12) of the observed species of every pair of logs
+    :param counts: the (logs x species) abundance or incidence counts, see align_counts
+    :return: the (logs x logs) similarity matrix
+    """
+    shared = shared_species_observed(counts)
+    richness = np.diag(shared)
+    return _divide(shared, richness[:, None] + richness[None, :] - shared)
+
+
+def _shared_relative_counts(counts: csr_matrix, sample_size: np.ndarray) -> np.ndarray:
+    """
+    estimates the total relative count U of the species of each log shared with each other log, including the shared
+    species not observed in the other log (Chao, Chazdon, Colwell and Shen, 2005). The entry (i, j) is the sum of the
+    relative counts in log i of the species observed in both logs, plus (m-1)/m*f_+1/(2f_+2) times the sum of the
+    relative counts in log i of the shared species that are singletons in log j, capped at 1
+    """
+    observed = _indicator(counts, counts.data > 0)
+    singletons = _indicator(counts, counts.data == 1)
+    doubletons = _indicator(counts, counts.data == 2)
+    totals = np.asarray(counts.sum(axis=1), dtype=float).ravel()
+    relative = csr_matrix((counts.data / np.repeat(totals, np.diff(counts.indptr)), counts.indices, counts.indptr),
+                          shape=counts.shape)
+    f_x1 = _pairwise(observed, singletons)
+    # without shared doubletons in log j, a single one is assumed
+    f_x2 = np.maximum(_pairwise(observed, doubletons), 1)
+    factor = _divide(np.asarray(sample_size) - 1, sample_size)[None, :]
+    return np.minimum(_pairwise(relative, observed) + factor * f_x1 / (2 * f_x2) * _pairwise(relative, singletons),
+                      1)
+
+
+def chao_sorensen(counts: csr_matrix, sample_size: np.ndarray) -> np.ndarray:
+    """
+    computes Chao's abundance-based Sørensen similarity 2UV/(U+V) of every pair of logs, corrected for unseen shared
+    species, see _shared_relative_counts. Applies to incidence counts as well
+    :param counts: the (logs x species) abundance or incidence counts, see align_counts
+    :param sample_size: the sample size of each log
+    :return: the (logs x logs) similarity matrix
+    """
+    u = _shared_relative_counts(counts, sample_size)
+    return _divide(2 * u * u.T, u + u.T)
+
+
+def chao_jaccard(counts: csr_matrix, sample_size: np.ndarray) -> np.ndarray:
+    """
+    computes Chao's abundance-based Jaccard similarity UV/(U+V-UV) of every pair of logs, corrected for unseen shared
+    species, see _shared_relative_counts. Applies to incidence counts as well
+    :param counts: the (logs x species) abundance or incidence counts, see align_counts
+    :param sample_size: the sample size of each log
+    :return: the (logs x logs) similarity matrix
+    """
+    u = _shared_relative_counts(counts, sample_size)
+    return _divide(u * u.T, u + u.T - u * u.T)
+
+
+def morisita_horn(counts: csr_matrix, corrected: bool = True) -> np.ndarray:
+    """
+    computes the Morisita-Horn similarity 2*sum(x_k*y_k)/(n*m)/(sum(x_k^2)/n^2+sum(y_k^2)/m^2) of every pair of logs.
+    If corrected, the squared relative counts in the denominator are replaced by their unbiased estimates
+    sum(x_k(x_k-1))/(n(n-1)), such that the similarity does not depend on the sample sizes. As these estimates may
+    exceed 1 for small samples, the similarity is capped at 1, and the similarity of each log to itself is 1
+    :param counts: the (logs x species) abundance or incidence counts, see align_counts
+    :param corrected: flag indicating if the bias-corrected estimator should be used
+    :return: the (logs x logs) similarity matrix
+    """
+    totals = np.asarray(counts.sum(axis=1), dtype=float).ravel()
+    values = counts.data.astype(float)
+    rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+    relative = csr_matrix((values / totals[rows], counts.indices, counts.indptr), shape=counts.shape)
+    if corrected:
+        concentration = _divide(np.bincount(rows, weights=values * (values - 1), minlength=counts.shape[0]),
+                                totals * (totals - 1))
+    else:
+        concentration = np.bincount(rows, weights=(values / totals[rows]) ** 2, minlength=counts.shape[0])
+    similarity = np.minimum(_divide(2 * _pairwise(relative, relative), concentration[:, None] + concentration[None, :]),
+                            1)
+    np.fill_diagonal(similarity, np.where(totals > 0, 1.0, 0.0))
+    return similarity
+
+
+def beta_diversity(counts: csr_matrix, sample_size: np.ndarray, index: str = "sorensen") -> np.ndarray:
+    """
+    computes a shared-species estimator or similarity index for every pair of logs
+    :param counts: the (logs x species) abundance or incidence counts, see align_counts
+    :param sample_size: the sample size of each log
+    :param index: one of INDICES
+    :return: the (logs x logs) matrix
+    """
+    if index not in INDICES:
+        raise RuntimeError('Unknown index ' + index + ', expected one of ' + str(list(INDICES.keys())))
+    return INDICES[index](counts, np.asarray(sample_size))
+
+
+INDICES = {
+    "shared_observed": lambda counts, sample_size: shared_species_observed(counts),
+    "shared_chao": estimate_shared_species_chao,
+    "sorensen": lambda counts, sample_size: sorensen(counts),
+    "jaccard": lambda counts, sample_size: jaccard(counts),
+    "chao_sorensen": chao_sorensen,
+    "chao_jaccard": chao_jaccard,
+    "morisita_horn": lambda counts, sample_size: morisita_horn(counts),
+}
+
+
+def compare_logs(estimators: dict, indices: list = ["shared_chao", "sorensen", "chao_sorensen", "morisita_horn"],
+                 abundance: bool = False) -> DataFrame:
+    """
+    compares the species of every pair of several logs profiled by species estimators
+    :param estimators: the species estimators of the logs, keyed by log name
+    :param indices: the shared-species estimators and similarity indices, see INDICES
+    :param abundance: flag indicating if abundance-based or incidence-based data is compared
+    :returns: a data frame containing the value of each index for each pair of logs and species definition
+    """
+    names = list(estimators.keys())
+    species_ids = list(dict.fromkeys(s for estimator in estimators.values() for s in estimator.metrics.keys()
+                                     if all(s in e.metrics for e in estimators.values())))
+    frames = []
+    for species_id in species_ids:
+        metrics = [estimators[name].metrics[species_id] for name in names]
+        counts, _ = align_counts([m.reference_sample_abundance if abundance else m.reference_sample_incidence
+                                  for m in metrics])
+        sample_size = np.array([m.abundance_sample_size if abundance else m.incidence_sample_size for m in metrics])
+        for index in indices:
+            values = beta_diversity(counts, sample_size, index)
+            frames.append(pd.DataFrame({"log_a": np.repeat(names, len(names)), "log_b": np.tile(names, len(names)),
+                                        "species": species_id, "index": index, "value": values.ravel()}))
+    if len(frames) == 0:
+        return pd.DataFrame(columns=["log_a", "log_b", "species", "index", "value"])
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,135 @@
+import math
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from typing import Callable
+
+
+class CheckpointSchedule(ABC):
+    """
+    Base class of checkpoint schedules, determining after how many added traces the profiles are updated
+    """
+
+    @abstractmethod
+    def next_checkpoint(self, n: int, limit: int) -> int | None:
+        """
+        returns the first checkpoint after n added traces, if any is reached until limit
+        :param n: the number of traces added so far
+        :param limit: the maximum number of traces considered
+        :return: the smallest checkpoint in (n, limit], or None
+        """
+
+    def is_checkpoint(self, n: int) -> bool:
+        """
+        :param n: the number of traces added so far
+        :return: True if profiles are updated after n added traces
+        """
+        return n > 0 and self.next_checkpoint(n - 1, n) == n
+
+
+class StepSchedule(CheckpointSchedule):
+    """
+    checkpoints after every step_size many traces
+    """
+
+    def __init__(self, step_size: int) -> None:
+        """
+        :param step_size: the number of traces between two checkpoints
+        """
+        if step_size < 1:
+            raise RuntimeError('Cannot create checkpoints with step size ' + str(step_size))
+        self.step_size = step_size
+
+    def next_checkpoint(self, n: int, limit: int) -> int | None:
+        checkpoint = n + self.step_size - n % self.step_size
+        return checkpoint if checkpoint <= limit else None
+
+    def is_checkpoint(self, n: int) -> bool:
+        return n > 0 and n % self.step_size == 0
+
+
+class GeometricSchedule(CheckpointSchedule):
+    """
+    log-spaced checkpoints after ceil(start*factor^k) traces for k=0,1,..., i.e. dense while profiles change fast
+    early on and sparse later, using only logarithmically many checkpoints in the size of the log
+    """
+
+    def __init__(self, start: int = 1, factor: float = 1.1) -> None:
+        """
+        :param start: the number of traces of the first checkpoint
+        :param factor: the growth factor between consecutive checkpoints
+        """
+        if start < 1 or factor <= 1:
+            raise RuntimeError('Cannot create geometric checkpoints with start ' + str(start) + ' and factor ' +
+                               str(factor))
+        self.start = start
+        self.factor = factor
+
+    def next_checkpoint(self, n: int, limit: int) -> int | None:
+        # skip ahead to the exponent just below n, then step up to the first checkpoint above it
+        k = max(0, math.floor(math.log(max(n, 1) / self.start, self.factor)) - 1)
+        checkpoint = math.ceil(self.start * self.factor ** k)
+        while checkpoint <= n:
+            k = k + 1
+            checkpoint = math.ceil(self.start * self.factor ** k)
+        return checkpoint if checkpoint <= limit else None
+
+
+class ListSchedule(CheckpointSchedule):
+    """
+    checkpoints after explicitly given numbers of traces
+    """
+
+    def __init__(self, checkpoints: list) -> None:
+        """
+        :param checkpoints: the numbers of traces after which profiles are updated
+        """
+        self.checkpoints = sorted(set(int(c) for c in checkpoints if c > 0))
+
+    def next_checkpoint(self, n: int, limit: int) -> int | None:
+        i = bisect_right(self.checkpoints, n)
+        if i == len(self.checkpoints) or self.checkpoints[i] > limit:
+            return None
+        return self.checkpoints[i]
+
+
+class CallableSchedule(CheckpointSchedule):
+    """
+    checkpoints after all numbers of traces for which a predicate holds
+    """
+
+    def __init__(self, predicate: Callable) -> None:
+        """
+        :param predicate: function of the number of traces added so far, returning True if profiles shall be updated
+        """
+        self.predicate = predicate
+
+    def next_checkpoint(self, n: int, limit: int) -> int | None:
+        for checkpoint in range(n + 1, limit + 1):
+            if self.predicate(checkpoint):
+                return checkpoint
+        return None
+
+    def is_checkpoint(self, n: int) -> bool:
+        return n > 0 and bool(self.predicate(n))
+
+
+def checkpoint_schedule(checkpoints) -> CheckpointSchedule | None:
+    """
+    converts a checkpoint specification into a checkpoint schedule
+    :param checkpoints: None for a single update after all traces, an int step size, "geometric" for the default
+    geometric schedule, a list of numbers of traces, a predicate over the number of traces or a CheckpointSchedule
+    :return: the schedule, or None if profiles are only updated once
+    """
+    if checkpoints is None or isinstance(checkpoints, CheckpointSchedule):
+        return checkpoints
+    if isinstance(checkpoints, str):
+        if checkpoints == "geometric":
+            return GeometricSchedule()
+        raise RuntimeError('Unknown checkpoint schedule ' + checkpoints)
+    if isinstance(checkpoints, int):
+        return StepSchedule(checkpoints)
+    if isinstance(checkpoints, (list, tuple, range)):
+        return ListSchedule(list(checkpoints))
+    if callable(checkpoints):
+        return CallableSchedule(checkpoints)
+    raise RuntimeError('Cannot create checkpoints from ' + str(type(checkpoints)))
@@ -0,0 +1,57 @@
+import ast
+import operator
+import re
+from typing import Callable
+
+from pm4py.objects.log.obj import Trace
+
+OPERATORS = {">=": operator.ge, "<=": operator.le, "==": operator.eq, "!=": operator.ne, ">": operator.gt,
+             "<": operator.lt}
+
+_CONDITION = re.compile(r"^\s*(.+?)\s*(>=|<=|==|!=|>|<)\s*(.+?)\s*$")
+
+
+def trace_attribute(trace: Trace, key: str):
+    """
+    returns the value of an attribute of a trace, looking up the trace attributes first and the attributes of its
+    first event otherwise, e.g. for case attributes recorded on every event
+    :param trace: the trace
+    :param key: the attribute key, optionally prefixed by "case:"
+    :return: the value, or None if the attribute is missing
+    """
+    for k in (key, key[len("case:"):] if key.startswith("case:") else None):
+        if k is not None and k in trace.attributes:
+            return trace.attributes[k]
+    if len(trace) > 0 and key in trace[0]:
+        return trace[0][key]
+    return None
+
+
+def _literal(value: str):
+    # numbers, booleans and quoted strings are parsed, anything else is compared as string
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def group_function(group_by: str | Callable) -> Callable:
+    """
+    converts a grouping specification into a function assigning each trace its stratum
+    :param group_by: a function of the trace returning its stratum, an attribute key whose value is the stratum, or a
+    condition on an attribute like "Age>=60", whose truth value is the stratum
+    :return: the function, returning None for traces lacking the attribute
+    """
+    if callable(group_by):
+        return group_by
+    if not isinstance(group_by, str):
+        raise RuntimeError('Cannot group traces by ' + str(type(group_by)))
+    condition = _CONDITION.match(group_by)
+    if condition is None:
+        return lambda trace: trace_attribute(trace, group_by)
+    key, op, value = condition.group(1), OPERATORS[condition.group(2)], _literal(condition.group(3))
+
+    def satisfies(trace: Trace) -> bool | None:
+        attribute = trace_attribute(trace, key)
+        return None if attribute is None else op(attribute, value)
+    return satisfies
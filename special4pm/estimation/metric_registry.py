@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable
+
+from special4pm.estimation.metrics import SampleStatistics, hill_number_asymptotic, entropy_exp, simpson_diversity, \
+    completeness, coverage, sampling_effort_abundance, sampling_effort_incidence
+
+
+@dataclass(frozen=True)
+class Metric:
+    """
+    A metric recorded at every checkpoint of a species profile. Metrics per data type are stored once for abundance
+    and once for incidence data as '<data type>_<name>' and computed from the SampleStatistics of the respective
+    reference sample, which share their sufficient statistics among all metrics. Other metrics are stored as '<name>'
+    and computed from the MetricManager itself
+    """
+    function: Callable
+    per_data_type: bool = True
+    bootstrap_ci: bool = False
+
+
+# the default metrics are module-level functions or partials of them, such that registries can be pickled
+
+def _sample_size(stats: SampleStatistics) -> int:
+    return stats.sample_size
+
+
+def _total_species_count(stats: SampleStatistics) -> int:
+    return stats.total_species_count
+
+
+def _co_occurrence(manager) -> float:
+    return manager.current_co_occurrence
+
+
+def _singletons(stats: SampleStatistics) -> int:
+    return stats.f_1
+
+
+def _doubletons(stats: SampleStatistics) -> int:
+    return stats.f_2
+
+
+def _coverage(stats: SampleStatistics) -> float:
+    return coverage(stats, stats.sample_size)
+
+
+def _sampling_effort(g: float, stats: SampleStatistics) -> float:
+    if stats.abundance:
+        return sampling_effort_abundance(g, stats, stats.sample_size)
+    return sampling_effort_incidence(g, stats, stats.sample_size)
+
+
+def _hill_number_estimate(d: int, stats: SampleStatistics) -> float:
+    return hill_number_asymptotic(d, stats, stats.sample_size, stats.abundance)
+
+
+def default_metrics(d0: bool = True, d1: bool = True, d2: bool = True, c0: bool = True, c1: bool = True,
+                    l_n: list = [.9, .95, .99]) -> dict:
+    """
+    returns the metrics of the diversity and completeness profiles, keyed by name in the order they are recorded
+    :param d0: flag indicating if D0(=species richness) should be included
+    :param d1: flag indicating if D1(=exponential Shannon entropy) should be included
+    :param d2: flag indicating if D2(=Simpson diversity index) should be included
+    :param c0: flag indicating if C0(=completeness) should be included
+    :param c1: flag indicating if C1(=coverage) should be included
+    :param l_n: list of desired completeness values for estimation additional sampling effort
+    :return: the metrics
+    """
+    metrics = {
+        "no_observations": Metric(_sample_size),
+        "sum_species_counts": Metric(_total_species_count),
+        "degree_of_co_occurrence": Metric(_co_occurrence, per_data_type=False),
+        "singletons": Metric(_singletons),
+        "doubletons": Metric(_doubletons),
+    }
+    for d, included, sample_metric in [(0, d0, len), (1, d1, entropy_exp), (2, d2, simpson_diversity)]:
+        if included:
+            metrics["sample_d" + str(d)] = Metric(sample_metric)
+            metrics["estimate_d" + str(d)] = Metric(partial(_hill_number_estimate, d), bootstrap_ci=True)
+    if c0:
+        metrics["c0"] = Metric(completeness, bootstrap_ci=True)
+    if c1:
+        metrics["c1"] = Metric(_coverage, bootstrap_ci=True)
+    for l in l_n:
+        metrics["l_" + str(l)] = Metric(partial(_sampling_effort, l), bootstrap_ci=True)
+    return metrics
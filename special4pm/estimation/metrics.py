@@ -1,4 +1,7 @@
 import math
+from collections import Counter
+from collections.abc import Mapping
+from functools import cached_property
 from random import sample
 
 import mpmath
@@ -8,6 +11,80 @@ from scipy.special import digamma
 from cachetools import cached
 
 
+class SampleStatistics(Mapping):
+    """
+    A read-only view of a reference sample at a single checkpoint, computing each sufficient statistic at most once.
+    Can be passed to all metric functions in place of the reference sample, such that statistics like the number of
+    singletons are shared by all metrics evaluated at the checkpoint
+    """
+
+    def __init__(self, reference_sample: Mapping, sample_size: int, abundance: bool,
+                 total_species_count: int | None = None) -> None:
+        """
+        :param reference_sample: the species with corresponding abundance or incidence counts
+        :param sample_size: the sample size associated with the species counts
+        :param abundance: flag indicating the data type
+        :param total_species_count: the tracked total of all species counts, the sum of counts if not given
+        """
+        self.reference_sample = reference_sample
+        self.sample_size = sample_size
+        self.abundance = abundance
+        self.total_species_count = self.total if total_species_count is None else total_species_count
+
+    def __getitem__(self, species) -> int:
+        return self.reference_sample[species]
+
+    def __iter__(self):
+        return iter(self.reference_sample)
+
+    def __len__(self) -> int:
+        return self.observed
+
+    def values(self) -> list:
+        return self.counts
+
+    @cached_property
+    def counts(self) -> list:
+        return list(self.reference_sample.values())
+
+    @cached_property
+    def frequencies(self) -> dict:
+        if hasattr(self.reference_sample, "frequencies"):
+            return self.reference_sample.frequencies()
+        return Counter(self.reference_sample.values())
+
+    @cached_property
+    def observed(self) -> int:
+        return len(self.reference_sample)
+
+    @cached_property
+    def total(self) -> int:
+        return sum(k * f for k, f in self.frequencies.items())
+
+    @cached_property
+    def f_1(self) -> int:
+        return self.frequencies.get(1, 0)
+
+    @cached_property
+    def f_2(self) -> int:
+        return self.frequencies.get(2, 0)
+
+
+def get_frequency_counts(obs_species_counts: dict) -> dict:
+    """
+    returns the frequency counts of the reference sample, i.e. the number of species f_k with count k. All metrics
+    summing over species are computed from them, such that species sharing a count are evaluated once and sketched
+    reference samples are not expanded, see SpeciesSketch.frequencies
+    :param obs_species_counts: the species with corresponding incidence counts
+    :return: the number of species with each count
+    """
+    if isinstance(obs_species_counts, SampleStatistics):
+        return obs_species_counts.frequencies
+    if hasattr(obs_species_counts, "frequencies"):
+        return obs_species_counts.frequencies()
+    return Counter(obs_species_counts.values())
+
+
 #TODO unify incidence and abundance-based methods in one function
 def get_incidence_count(obs_species_counts: dict, i: int) -> int:
     """
@@ -16,7 +93,7 @@ def get_incidence_count(obs_species_counts: dict, i: int) -> int:
     :param i: the incidence count
     :return: the number of species with incidence count i
     """
-    return list(obs_species_counts.values()).count(i)
+    return get_frequency_counts(obs_species_counts).get(i, 0)
 
 
 def get_singletons(obs_species_counts: dict) -> int:
@@ -25,7 +102,9 @@ def get_singletons(obs_species_counts: dict) -> int:
     :param obs_species_counts: the species with corresponding incidence counts
     :return: the number of species with incidence count 1
     """
-    return list(obs_species_counts.values()).count(1)
+    if isinstance(obs_species_counts, SampleStatistics):
+        return obs_species_counts.f_1
+    return get_incidence_count(obs_species_counts, 1)
 
 
 def get_doubletons(obs_species_counts: dict) -> int:
@@ -34,7 +113,9 @@ def get_doubletons(obs_species_counts: dict) -> int:
     :param obs_species_counts: the species with corresponding incidence counts
     :return: the number of species with incidence count 2
     """
-    return list(obs_species_counts.values()).count(2)
+    if isinstance(obs_species_counts, SampleStatistics):
+        return obs_species_counts.f_2
+    return get_incidence_count(obs_species_counts, 2)
 
 
 def get_number_observed_species(obs_species_counts: dict) -> int:
@@ -43,7 +124,7 @@ def get_number_observed_species(obs_species_counts: dict) -> int:
     :param obs_species_counts: the species with corresponding incidence counts
     :return: the number of observed species
     """
-    return len(obs_species_counts.keys())
+    return len(obs_species_counts)
 
 
 def get_total_species_count(obs_species_counts):
@@ -52,7 +133,9 @@ def get_total_species_count(obs_species_counts):
     :param obs_species_counts: the species with corresponding incidence counts
     :return: the sum of species incidences
     """
-    return sum(obs_species_counts.values())
+    if isinstance(obs_species_counts, SampleStatistics):
+        return obs_species_counts.total
+    return sum(k * f for k, f in get_frequency_counts(obs_species_counts).items())
 
 
 def hill_number(d: int, obs_species_counts: dict) -> float:
@@ -85,7 +168,8 @@ def entropy_exp(obs_species_counts: dict) -> float:
     total_species_count = get_total_species_count(obs_species_counts)
     # total = sum([obs_species_counts.values])
     return math.exp(-1 * sum(
-        [x / total_species_count * math.log(x / total_species_count) for x in obs_species_counts.values()]))
+        [f * x / total_species_count * math.log(x / total_species_count)
+         for x, f in get_frequency_counts(obs_species_counts).items()]))
 
 
 def simpson_diversity(obs_species_counts: dict) -> float:
@@ -96,7 +180,7 @@ def simpson_diversity(obs_species_counts: dict) -> float:
     """
     total_species_count = get_total_species_count(obs_species_counts)
 
-    a = sum([(x / total_species_count) ** 2 for x in obs_species_counts.values()])
+    a = sum([f * (x / total_species_count) ** 2 for x, f in get_frequency_counts(obs_species_counts).items()])
     # TODO check if return 1 is reasonable
     return a ** (1 / (1 - 2)) if a > 0 else 1
 
@@ -183,7 +267,7 @@ def estimate_exp_shannon_entropy_abundance(obs_species_counts: dict, sample_size
     :param sample_size: the sample size associated with the species incidence counts
     :return: the estimated exponential of Shannon entropy
     """
-    if sum(obs_species_counts.values())==0 or sample_size==0:
+    if get_total_species_count(obs_species_counts)==0 or sample_size==0:
         return 0.0
     return math.exp(estimate_entropy(obs_species_counts, sample_size))
 
@@ -196,7 +280,7 @@ def estimate_exp_shannon_entropy_incidence(obs_species_counts: dict, sample_size
     :return: the estimated exponential of Shannon entropy
     """
     # term h_o is structurally equivalent to abundance based entropy estimation, see eq H7 in appendix H of Hill number paper
-    u = sum(obs_species_counts.values())
+    u = get_total_species_count(obs_species_counts)
     h_o = estimate_entropy(obs_species_counts, sample_size)
     if u == 0:
         return 0.0
@@ -220,9 +304,9 @@ def estimate_entropy(obs_species_counts: dict, sample_size: int) -> float:
 
     entropy_known_species = 0
 
-    for x_i in obs_species_counts.values():
+    for x_i, f_x in get_frequency_counts(obs_species_counts).items():
         if x_i <= sample_size - 1:
-            norm_factor = x_i / sample_size
+            norm_factor = f_x * x_i / sample_size
 
             #decompose sum(1/x_i,...,1/sample_size) to um(1/1,...,1/sample_size)-sum(1/1,...,1/x_i-1)
             entropy_known_species = entropy_known_species + norm_factor * (harmonic(sample_size) - harmonic(x_i-1))
@@ -287,9 +371,9 @@ def estimate_simpson_diversity_abundance(obs_species_counts: dict, sample_size:
     """
     # TODO make this understandable
     denom = 0
-    for x_i in obs_species_counts.values():
+    for x_i, f_x in get_frequency_counts(obs_species_counts).items():
         if x_i >= 2:
-            denom = denom + (x_i * (x_i - 1))
+            denom = denom + f_x * (x_i * (x_i - 1))
     if denom == 0:
         return 0
     return (sample_size * (sample_size - 1)) / denom
@@ -309,10 +393,10 @@ def estimate_simpson_diversity_incidence(obs_species_counts: dict, sample_size:
         return 0.0
     nom = ((1 - (1 / sample_size)) * u) ** 2
 
-    for y_i in obs_species_counts.values():
+    for y_i, f_y in get_frequency_counts(obs_species_counts).items():
         if y_i > 1:
             #    s = s + (sample_size ** 2 * y_i ** 2) / (u ** 2 * sample_size ** 2)
-            s = s + (y_i * (y_i - 1))
+            s = s + f_y * (y_i * (y_i - 1))
     if s == 0:
         return 0
     # return s ** (1 / (1 - 2))
@@ -0,0 +1,262 @@
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from pm4py.objects.log.obj import EventLog
+from scipy.sparse import csr_matrix
+
+from special4pm.estimation.batch_metrics import BatchStatistics, batch_metric
+from special4pm.estimation.beta_diversity import beta_diversity
+from special4pm.estimation.species_estimator import SpeciesEstimator
+from special4pm.species.specs import SpeciesSpec
+
+
+class MultiLogEstimator:
+    """
+    Profiles several event logs, or partitions of a single log, at once. The species of all logs are interned into one
+    shared vocabulary per species definition and counted into a sparse (logs x species) matrix per data type, from
+    which the final diversity and completeness profiles of all logs are computed by vectorized kernels, see
+    batch_metrics. Aligned on the shared vocabulary, the species shared by or unique to logs are set operations on the
+    rows of the matrix
+    """
+
+    def __init__(self, d0: bool = True, d1: bool = True, d2: bool = True, c0: bool = True, c1: bool = True,
+                 l_n: list = [.9, .95, .99], abundance: bool = True, incidence: bool = True) -> None:
+        """
+        :param d0: flag indicating if D0(=species richness) should be included
+        :param d1: flag indicating if D1(=exponential Shannon entropy) should be included
+        :param d2: flag indicating if D2(=Simpson diversity index) should be included
+        :param c0: flag indicating if C0(=completeness) should be included
+        :param c1: flag indicating if C1(=coverage) should be included
+        :param l_n: list of desired completeness values for estimation additional sampling effort
+        :param abundance: flag indicating if abundance-based metrics should be included
+        :param incidence: flag indicating if incidence-based metrics should be included
+        """
+        # holds species definitions and metrics, and retrieves the species matrices of each log
+        self.estimator = SpeciesEstimator(d0, d1, d2, c0, c1, l_n, abundance=abundance, incidence=incidence)
+        self.logs = []
+        self.no_traces = []
+        self.vocabulary = {}
+        self.rows = {}
+        self.empty_traces = {}
+        self.__matrices = {}
+
+    def register(self, species_id: str, function: Callable | SpeciesSpec) -> None:
+        """
+        registers a species definition, see SpeciesEstimator.register. Species definitions should be registered before
+        any logs are added
+        """
+        self.estimator.register(species_id, function)
+        self.__add_species_id(species_id)
+
+    def register_family(self, species_ids: list, function: Callable) -> None:
+        """
+        registers a family of species definitions retrieved together, see SpeciesEstimator.register_family
+        """
+        self.estimator.register_family(species_ids, function)
+        for species_id in species_ids:
+            self.__add_species_id(species_id)
+
+    def register_metric(self, name: str, function: Callable, per_data_type: bool = True) -> None:
+        """
+        registers a custom metric, see SpeciesEstimator.register_metric. Custom metrics per data type are computed log
+        by log from the SampleStatistics of each reference sample
+        """
+        self.estimator.register_metric(name, function, per_data_type)
+
+    def __add_species_id(self, species_id: str) -> None:
+        self.vocabulary[species_id] = {}
+        self.rows[species_id] = []
+        self.empty_traces[species_id] = []
+
+    def add_log(self, name: str, data: pd.DataFrame | EventLog, verbose=True) -> None:
+        """
+        retrieves the species of a log and adds its counts as a new row of the count matrices
+        :param name: the name of the log
+        :param data: the event log
+        """
+        self.add_matrices(name, self.estimator.derive().build_matrices(data, verbose=verbose))
+
+    def add_partitions(self, data: pd.DataFrame | EventLog, labels, verbose=True) -> list:
+        """
+        retrieves the species of a log once and adds each partition of its traces as a new row of the count matrices
+        :param data: the event log
+        :param labels: the partition of each trace, in the order of the traces
+        :return: the names of the added partitions, i.e. the distinct labels in order of first occurrence
+        """
+        matrices = self.estimator.derive().build_matrices(data, verbose=verbose)
+        labels = np.asarray(labels)
+        if len(labels) != len(next(iter(matrices.values()), [])):
+            raise RuntimeError('Expected one label per trace, got ' + str(len(labels)))
+        names = pd.unique(labels).tolist()
+        for name in names:
+            rows = np.flatnonzero(labels == name)
+            self.add_matrices(name, {species_id: matrix.select(rows) for species_id, matrix in matrices.items()})
+        return names
+
+    def add_matrices(self, name: str, matrices: dict) -> None:
+        """
+        adds the counts of the species matrices of a log as a new row of the count matrices, interning its species
+        into the shared vocabulary
+        :param name: the name of the log
+        :param matrices: the species matrices of all registered species definitions, keyed by species id
+        """
+        if name in self.logs:
+            raise RuntimeError('Log ' + str(name) + ' has already been added')
+        if set(matrices.keys()) != set(self.vocabulary.keys()):
+            raise RuntimeError('Expected the species matrices of ' + str(list(self.vocabulary.keys())))
+        for species_id, matrix in matrices.items():
+            vocabulary = self.vocabulary[species_id]
+            codes = np.fromiter((vocabulary.setdefault(s, len(vocabulary)) for s in matrix.species.tolist()),
+                                dtype=np.int64, count=len(matrix.species))
+            indices = np.asarray(matrix.indices)
+            abundance = np.bincount(indices, weights=np.asarray(matrix.abundance), minlength=len(codes))
+            incidence = np.bincount(indices, minlength=len(codes))
+            observed = np.flatnonzero(incidence)
+            self.rows[species_id].append((codes[observed], abundance[observed].astype(np.int64),
+                                          incidence[observed]))
+            self.empty_traces[species_id].append(int(np.count_nonzero(np.diff(matrix.indptr) == 0)))
+        self.logs.append(name)
+        self.no_traces.append(len(next(iter(matrices.values()))) if len(matrices) > 0 else 0)
+        self.__matrices = {}
+
+    def __index(self, name) -> int:
+        if name not in self.logs:
+            raise RuntimeError('Unknown log ' + str(name))
+        return self.logs.index(name)
+
+    def species(self, species_id: str) -> list:
+        """
+        :param species_id: the species definition
+        :return: the shared vocabulary, i.e. the species of all logs in the order of the columns of the count matrices
+        """
+        return list(self.vocabulary[species_id].keys())
+
+    def count_matrix(self, species_id: str, abundance: bool = False) -> csr_matrix:
+        """
+        returns the (logs x species) matrix of the abundance or incidence counts of all logs, aligned on the shared
+        vocabulary
+        :param species_id: the species definition
+        :param abundance: flag indicating the data type
+        :return: the count matrix, with rows in the order logs were added
+        """
+        key = (species_id, abundance)
+        if key not in self.__matrices:
+            rows = self.rows[species_id]
+            indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum([len(codes) for codes, _, _ in rows], out=indptr[1:])
+            indices = np.concatenate([codes for codes, _, _ in rows] + [np.zeros(0, dtype=np.int64)])
+            data = np.concatenate([row[1 if abundance else 2] for row in rows] + [np.zeros(0, dtype=np.int64)])
+            # rows are sorted by column such that rows can be compared by merging
+            matrix = csr_matrix((data, indices, indptr), shape=(len(rows), len(self.vocabulary[species_id])))
+            matrix.sort_indices()
+            self.__matrices[key] = matrix
+        return self.__matrices[key]
+
+    def sample_sizes(self, species_id: str, abundance: bool = False) -> np.ndarray:
+        """
+        :param species_id: the species definition
+        :param abundance: flag indicating the data type
+        :return: the sample size of each log, i.e. the number of species occurrences or the number of traces
+        """
+        if abundance:
+            return np.asarray(self.count_matrix(species_id, True).sum(axis=1)).ravel().astype(np.int64)
+        return np.asarray(self.no_traces, dtype=np.int64)
+
+    def statistics(self, species_id: str, abundance: bool = False) -> BatchStatistics:
+        """
+        :param species_id: the species definition
+        :param abundance: flag indicating the data type
+        :return: the reference samples of all logs, see BatchStatistics
+        """
+        return BatchStatistics(self.count_matrix(species_id, abundance), self.sample_sizes(species_id, abundance),
+                               abundance)
+
+    def profile_arrays(self, species_id: str) -> dict:
+        """
+        computes the final profiles of all logs for a species definition
+        :param species_id: the species definition
+        :return: the values of each metric for all logs, keyed by metric name as in SpeciesEstimator.metrics
+        """
+        data_types = [t for t, included in [("abundance", self.estimator.include_abundance),
+                                            ("incidence", self.estimator.include_incidence)] if included]
+        statistics = {t: self.statistics(species_id, t == "abundance") for t in data_types}
+        profiles = {}
+        for name, metric in self.estimator.metric_registry.items():
+            if not metric.per_data_type:
+                continue
+            for t in data_types:
+                profiles[t + "_" + name] = batch_metric(metric, statistics[t])
+        if "degree_of_co_occurrence" in self.estimator.metric_registry:
+            incidence_total = self.statistics(species_id, False).total
+            abundance_total = self.statistics(species_id, True).total
+            profiles["degree_of_co_occurrence"] = np.where(
+                incidence_total == 0, 0.0,
+                1 - np.divide(incidence_total, abundance_total, out=np.zeros(len(self.logs)),
+                              where=abundance_total != 0))
+        return profiles
+
+    def profiles(self, species_id: str | None = None) -> DataFrame:
+        """
+        returns the final profiles of all logs as a data frame
+        :param species_id: the species definition, defaults to all species definitions
+        :return: a data frame with columns log, species, metric and value
+        """
+        species_ids = list(self.vocabulary.keys()) if species_id is None else [species_id]
+        frames = []
+        for s in species_ids:
+            for metric, values in self.profile_arrays(s).items():
+                frames.append(pd.DataFrame({"log": self.logs, "species": s, "metric": metric, "value": values}))
+        if len(frames) == 0:
+            return pd.DataFrame(columns=["log", "species", "metric", "value"])
+        return pd.concat(frames, ignore_index=True)
+
+    def shared_species(self, a, b, species_id: str) -> list:
+        """
+        :param a: the name of the first log
+        :param b: the name of the second log
+        :param species_id: the species definition
+        :return: the species observed in both logs
+        """
+        matrix = self.count_matrix(species_id)
+        shared = np.intersect1d(matrix[self.__index(a)].indices, matrix[self.__index(b)].indices, assume_unique=True)
+        species = self.species(species_id)
+        return [species[i] for i in shared]
+
+    def unique_species(self, a, b, species_id: str) -> list:
+        """
+        :param a: the name of the first log
+        :param b: the name of the second log
+        :param species_id: the species definition
+        :return: the species observed in the first log, but not in the second
+        """
+        matrix = self.count_matrix(species_id)
+        unique = np.setdiff1d(matrix[self.__index(a)].indices, matrix[self.__index(b)].indices, assume_unique=True)
+        species = self.species(species_id)
+        return [species[i] for i in unique]
+
+    def shared_species_counts(self, species_id: str) -> np.ndarray:
+        """
+        counts the species shared by every pair of logs at once
+        :param species_id: the species definition
+        :return: the (logs x logs) matrix of the number of shared species, with the number of observed species of each
+        log on the diagonal
+        """
+        matrix = self.count_matrix(species_id)
+        observed = csr_matrix((np.ones(len(matrix.indices), dtype=np.int64), matrix.indices, matrix.indptr),
+                              shape=matrix.shape)
+        return (observed @ observed.T).toarray()
+
+    def beta_diversity(self, species_id: str, index: str = "sorensen", abundance: bool = False) -> DataFrame:
+        """
+        computes a shared-species estimator or similarity index for every pair of logs at once, see
+        beta_diversity.INDICES
+        :param species_id: the species definition
+        :param index: the shared-species estimator or similarity index
+        :param abundance: flag indicating if abundance-based or incidence-based data is compared
+        :return: the (logs x logs) matrix as a data frame indexed by log names
+        """
+        values = beta_diversity(self.count_matrix(species_id, abundance), self.sample_sizes(species_id, abundance),
+                                index)
+        return pd.DataFrame(values, index=self.logs, columns=self.logs)
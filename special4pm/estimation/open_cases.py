@@ -0,0 +1,106 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pm4py.objects.log.obj import Trace, Event
+
+
+class OpenCases:
+    """
+    The partial traces of the cases of an event stream that have not been completed yet, ordered by their last event,
+    such that stale cases are found and evicted from the front in constant time per case. Assumes that events arrive
+    roughly in order of their timestamps
+    """
+
+    def __init__(self, timeout: timedelta | None = None, max_cases: int | None = None,
+                 max_events: int | None = None) -> None:
+        """
+        :param timeout: the inactivity after which a case is considered complete, None if cases only complete
+        explicitly
+        :param max_cases: the maximum number of open cases, None for no limit
+        :param max_events: the maximum number of buffered events of all open cases, None for no limit
+        """
+        self.timeout = timeout
+        self.max_cases = max_cases
+        self.max_events = max_events
+        self.cases = OrderedDict()
+        self.last_seen = {}
+        self.no_events = 0
+        self.clock = None
+
+    def __len__(self) -> int:
+        return len(self.cases)
+
+    def __contains__(self, case_id) -> bool:
+        return case_id in self.cases
+
+    def append(self, case_id, event: Event) -> Trace:
+        """
+        appends an event to the trace of its case, opening the case if necessary
+        :param case_id: the case of the event
+        :param event: the event
+        :return: the trace of the case including the event
+        """
+        if case_id not in self.cases:
+            self.cases[case_id] = Trace(attributes={"concept:name": case_id})
+        else:
+            self.cases.move_to_end(case_id)
+        self.cases[case_id].append(event)
+        self.no_events = self.no_events + 1
+        timestamp = event.get("time:timestamp")
+        if timestamp is not None and self.clock is None:
+            # cases opened before the first timestamp are considered active at the first timestamp
+            for c in self.last_seen.keys():
+                self.last_seen[c] = timestamp
+        if timestamp is not None:
+            self.clock = timestamp if self.clock is None else max(self.clock, timestamp)
+        self.last_seen[case_id] = timestamp if timestamp is not None else self.clock
+        return self.cases[case_id]
+
+    def pop(self, case_id) -> Trace:
+        """
+        closes a case
+        :param case_id: the case
+        :return: the trace of the case
+        """
+        trace = self.cases.pop(case_id)
+        del self.last_seen[case_id]
+        self.no_events = self.no_events - len(trace)
+        return trace
+
+    def expired(self, now: datetime | None = None) -> list:
+        """
+        closes all cases without events within the timeout before now
+        :param now: the current time, defaults to the latest timestamp of the stream
+        :return: the closed cases as pairs of case id and trace, least recently active first
+        """
+        now = self.clock if now is None else now
+        closed = []
+        # without any timestamp in the stream, the activity of cases is unknown
+        if self.timeout is None or now is None or self.clock is None:
+            return closed
+        while len(self.cases) > 0:
+            case_id = next(iter(self.cases))
+            last_seen = self.last_seen[case_id]
+            if now - last_seen <= self.timeout:
+                break
+            closed.append((case_id, self.pop(case_id)))
+        return closed
+
+    def overflow(self) -> list:
+        """
+        evicts the least recently active cases until the limits on open cases and buffered events hold again
+        :return: the evicted cases as pairs of case id and trace, least recently active first
+        """
+        evicted = []
+        while len(self.cases) > 0 and ((self.max_cases is not None and len(self.cases) > self.max_cases) or
+                                       (self.max_events is not None and self.no_events > self.max_events)):
+            case_id = next(iter(self.cases))
+            evicted.append((case_id, self.pop(case_id)))
+        return evicted
+
+    def close_all(self) -> list:
+        """
+        closes all open cases
+        :return: the closed cases as pairs of case id and trace, least recently active first
+        """
+        return [(case_id, self.pop(case_id)) for case_id in list(self.cases.keys())]
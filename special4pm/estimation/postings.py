@@ -0,0 +1,107 @@
+import numpy as np
+
+
+def _smallest_unsigned(values: np.ndarray) -> np.ndarray:
+    # stores non-negative deltas in the smallest unsigned integer type holding all of them
+    top = int(values.max()) if len(values) > 0 else 0
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if top <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values.astype(np.uint64)
+
+
+class PostingLists:
+    """
+    An inverted index from species to the ids of the traces they occur in, i.e. to the number of observations added
+    before the trace. Ids are appended in ascending order and compacted into delta-encoded blocks of the smallest
+    sufficient integer type, which usually take one or two bytes per entry
+    """
+
+    def __init__(self, compact_after: int = 1 << 16) -> None:
+        """
+        :param compact_after: the number of pending trace ids after which they are compacted into blocks
+        """
+        self.compact_after = compact_after
+        self.blocks = {}
+        self.last = {}
+        self.pending = {}
+        self.no_pending = 0
+
+    def add(self, trace_id: int, species, multiplicity: int = 1) -> None:
+        """
+        adds a trace, or multiplicity many identical consecutive traces, to the posting lists of its species
+        :param trace_id: the id of the (first) trace
+        :param species: the set of species of the trace
+        :param multiplicity: the number of identical traces
+        """
+        ids = [trace_id] if multiplicity == 1 else list(range(trace_id, trace_id + multiplicity))
+        for s in species:
+            self.pending.setdefault(s, []).extend(ids)
+        self.no_pending = self.no_pending + len(species) * multiplicity
+        if self.no_pending >= self.compact_after:
+            self.compact()
+
+    def add_block(self, offset: int, postings: dict) -> None:
+        """
+        adds the posting lists of a range of traces
+        :param offset: the id of the first trace of the range
+        :param postings: the ascending indices of the traces within the range containing each species, keyed by species
+        """
+        for s, traces in postings.items():
+            self.pending.setdefault(s, []).append(np.asarray(traces, dtype=np.int64) + offset)
+            self.no_pending = self.no_pending + len(traces)
+        if self.no_pending >= self.compact_after:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        delta-encodes all pending trace ids into blocks
+        """
+        for s, pending in self.pending.items():
+            ids = np.concatenate([np.atleast_1d(np.asarray(p, dtype=np.int64)) for p in pending]) \
+                if any(isinstance(p, np.ndarray) for p in pending) else np.asarray(pending, dtype=np.int64)
+            if len(ids) == 0:
+                continue
+            deltas = np.diff(ids, prepend=self.last.get(s, 0))
+            self.blocks.setdefault(s, []).append(_smallest_unsigned(deltas))
+            self.last[s] = int(ids[-1])
+        self.pending = {}
+        self.no_pending = 0
+
+    def get(self, species) -> np.ndarray:
+        """
+        :param species: the species
+        :return: the ascending ids of the traces containing the species
+        """
+        if species in self.pending:
+            self.compact()
+        blocks = self.blocks.get(species, [])
+        if len(blocks) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.cumsum(np.concatenate([block.astype(np.int64) for block in blocks]))
+
+    def union(self, species) -> np.ndarray:
+        """
+        :param species: an iterable of species
+        :return: the ascending ids of the traces containing any of the species
+        """
+        if len(self.pending) > 0:
+            self.compact()
+        lists = [np.concatenate(self.blocks[s]) if len(self.blocks[s]) > 1 else self.blocks[s][0]
+                 for s in species if s in self.blocks]
+        if len(lists) == 0:
+            return np.zeros(0, dtype=np.int64)
+        # decodes all lists at once by a cumulative sum that restarts at the first delta of each list
+        lengths = np.fromiter((len(deltas) for deltas in lists), dtype=np.int64, count=len(lists))
+        deltas = np.concatenate(lists).astype(np.int64)
+        ends = np.cumsum(lengths)
+        totals = np.cumsum(deltas)
+        restart = np.zeros(len(lists), dtype=np.int64)
+        restart[1:] = totals[ends[:-1] - 1]
+        return np.unique(totals - np.repeat(restart, lengths))
+
+    def nbytes(self) -> int:
+        """
+        :return: the number of bytes taken by the compacted blocks
+        """
+        return sum(block.nbytes for blocks in self.blocks.values() for block in blocks)
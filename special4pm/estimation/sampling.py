@@ -0,0 +1,64 @@
+import math
+
+import numpy as np
+
+
+def sample_indices(n: int, k: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    draws k of n indices uniformly at random without replacement
+    :param n: the number of items
+    :param k: the number of drawn indices
+    :param rng: the random number generator
+    :return: the drawn indices in ascending order
+    """
+    return np.sort(rng.choice(n, size=min(k, n), replace=False))
+
+
+def reservoir_sample(items, k: int, rng: np.random.Generator) -> (list, int):
+    """
+    draws k items uniformly at random without replacement from an iterable of unknown length in a single pass,
+    holding at most k items in memory. Uses Li's algorithm L, which jumps over the items not entering the reservoir
+    instead of drawing a random number per item
+    :param items: the iterable, e.g. a stream of traces
+    :param k: the size of the reservoir
+    :param rng: the random number generator
+    :return: the drawn items in the order of the iterable and the total number of items
+    """
+    reservoir = []
+    n = 0
+    if k < 1:
+        return reservoir, sum(1 for _ in items)
+    w = math.exp(math.log(rng.random()) / k)
+    skip_to = k + math.floor(math.log(rng.random()) / math.log(1 - w))
+    for item in items:
+        if n < k:
+            reservoir.append((n, item))
+        elif n == skip_to:
+            reservoir[rng.integers(k)] = (n, item)
+            w = w * math.exp(math.log(rng.random()) / k)
+            skip_to = skip_to + 1 + math.floor(math.log(rng.random()) / math.log(1 - w))
+        n = n + 1
+    reservoir.sort(key=lambda entry: entry[0])
+    return [item for _, item in reservoir], n
+
+
+def bernoulli_sample(items, fraction: float, rng: np.random.Generator) -> (list, int):
+    """
+    keeps each item of an iterable of unknown length independently with probability fraction in a single pass
+    :param items: the iterable, e.g. a stream of traces
+    :param fraction: the probability of keeping an item
+    :param rng: the random number generator
+    :return: the kept items in the order of the iterable and the total number of items
+    """
+    sample = []
+    n = 0
+    if fraction <= 0:
+        return sample, sum(1 for _ in items)
+    # the distance to the next kept item is geometrically distributed
+    keep_at = rng.geometric(fraction) - 1
+    for item in items:
+        if n == keep_at:
+            sample.append(item)
+            keep_at = keep_at + rng.geometric(fraction)
+        n = n + 1
+    return sample, n
@@ -0,0 +1,255 @@
+import math
+from collections import Counter
+from hashlib import blake2b
+
+import numpy as np
+
+
+def _hash_species(species) -> (int, int):
+    # two independent 64-bit hashes, one for the cardinality sketch and one for sampling
+    digest = blake2b(str(species).encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+
+
+class HyperLogLog:
+    """
+    A HyperLogLog sketch estimating the number of distinct species from 2^precision one-byte registers
+    """
+
+    def __init__(self, precision: int = 14) -> None:
+        """
+        :param precision: the number of hash bits selecting a register
+        """
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, h: int) -> None:
+        """
+        adds a species given by its 64-bit hash
+        :param h: the hash of the species
+        """
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self) -> float:
+        """
+        estimates the number of distinct species added so far
+        :return: the estimated number of distinct species
+        """
+        m = len(self.registers)
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        estimate = 0.7213 / (1 + 1.079 / m) * m ** 2 / np.sum(np.exp2(-registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(registers == 0))
+        # linear counting is more accurate for small cardinalities
+        if estimate <= 2.5 * m and zeros > 0:
+            return m * math.log(m / zeros)
+        return float(estimate)
+
+    def relative_error(self) -> float:
+        """
+        :return: the relative standard error of the estimate
+        """
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class HeavyHitters:
+    """
+    A Misra-Gries summary tracking the counts of the most abundant species in at most 2*capacity counters. Tracked
+    counts underestimate the true counts by at most error, which never exceeds total/(capacity+1)
+    """
+
+    def __init__(self, capacity: int = 1000) -> None:
+        """
+        :param capacity: the number of species guaranteed to be tracked if they are among the most abundant
+        """
+        self.capacity = capacity
+        self.counters = {}
+        self.error = 0
+
+    def add(self, species, count: int = 1) -> None:
+        """
+        adds count many observations of a species
+        :param species: the species
+        :param count: the number of observations
+        """
+        self.counters[species] = self.counters.get(species, 0) + count
+        if len(self.counters) > 2 * self.capacity:
+            # decrement all counters by the (capacity+1)-th largest count at once, dropping those reaching zero
+            cut = int(np.partition(np.fromiter(self.counters.values(), dtype=np.int64),
+                                   len(self.counters) - self.capacity - 1)[len(self.counters) - self.capacity - 1])
+            self.error = self.error + cut
+            self.counters = {s: c - cut for s, c in self.counters.items() if c > cut}
+
+
+class ReconstructedCounts:
+    """
+    A lazy view of the reconstructed species counts of a SpeciesSketch. Iterating it yields the count of every
+    species, the weighted sampled counts repeated, without materializing them, while len and count use the weights
+    """
+
+    def __init__(self, heavy: list, sampled: list, weights: list) -> None:
+        """
+        :param heavy: the counts of the heavy hitters, each standing for a single species
+        :param sampled: the counts of the other sampled species
+        :param weights: the number of species each sampled count stands for
+        """
+        self.heavy = heavy
+        self.sampled = sampled
+        self.weights = weights
+
+    def __len__(self) -> int:
+        return len(self.heavy) + sum(self.weights)
+
+    def __iter__(self):
+        yield from self.heavy
+        for c, w in zip(self.sampled, self.weights):
+            for _ in range(w):
+                yield c
+
+    def count(self, value: int) -> int:
+        return self.heavy.count(value) + sum(w for c, w in zip(self.sampled, self.weights) if c == value)
+
+
+class SpeciesSketch:
+    """
+    A bounded-memory replacement for the species count dictionaries of a reference sample. Counts are tracked exactly
+    until more than capacity species have been observed. From then on, only a hash-based sample of species is counted
+    exactly, halving the sampling rate whenever the capacity is exceeded again. Frequency counts such as f_1 and f_2
+    are scaled up from the sample, the most abundant species are counted by a heavy hitter summary and the number of
+    observed species is estimated by a HyperLogLog sketch. Supports the read-only dict interface used by the metric
+    functions, which read the reconstructed species counts as frequency counts, see frequencies
+    """
+
+    def __init__(self, capacity: int = 100000, heavy_hitters: int = 1000, precision: int = 14) -> None:
+        """
+        :param capacity: the maximum number of exactly counted species, bounding memory
+        :param heavy_hitters: the number of abundant species tracked by the heavy hitter summary
+        :param precision: the precision of the HyperLogLog sketch
+        """
+        self.capacity = capacity
+        self.level = 0
+        self.sample = {}
+        self.heavy = HeavyHitters(heavy_hitters)
+        self.cardinality = HyperLogLog(precision)
+        self.__last = (None, None)
+
+    def __hash(self, species) -> (int, int):
+        # get and subsequent set of the same species only hash once
+        if self.__last[0] != species:
+            self.__last = (species, _hash_species(species))
+        return self.__last[1]
+
+    def __sampled(self, h: int) -> bool:
+        return h >> (64 - self.level) == 0 if self.level > 0 else True
+
+    def add(self, species, count: int = 1) -> None:
+        """
+        adds count many observations of a species
+        :param species: the species
+        :param count: the number of observations
+        """
+        h_cardinality, h_sample = self.__hash(species)
+        self.cardinality.add(h_cardinality)
+        self.heavy.add(species, count)
+        if not self.__sampled(h_sample):
+            return
+        self.sample[species] = self.sample.get(species, 0) + count
+        while len(self.sample) > self.capacity:
+            self.level = self.level + 1
+            self.sample = {s: c for s, c in self.sample.items() if self.__sampled(_hash_species(s)[1])}
+
+    def get(self, species, default: int = 0) -> int:
+        """
+        returns the count of a species, exact for sampled species and a lower bound for heavy hitters
+        """
+        if self.__sampled(self.__hash(species)[1]):
+            return self.sample.get(species, default)
+        return self.heavy.counters.get(species, default)
+
+    def __getitem__(self, species) -> int:
+        return self.get(species)
+
+    def __setitem__(self, species, count: int) -> None:
+        self.add(species, count - self.get(species))
+
+    def __contains__(self, species) -> bool:
+        return self.get(species) > 0
+
+    def __len__(self) -> int:
+        if self.level == 0:
+            return len(self.sample)
+        return max(int(round(self.cardinality.estimate())), len(self.__heavy()))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self) -> list:
+        """
+        :return: the species known by name, i.e. all species if counts are exact, else sampled and heavy species
+        """
+        if self.level == 0:
+            return list(self.sample.keys())
+        return list(dict.fromkeys(list(self.sample.keys()) + list(self.heavy.counters.keys())))
+
+    def __heavy(self) -> dict:
+        # the heavy hitters whose counts are reliable, corrected by half the maximum underestimation
+        threshold = 2 * self.heavy.error
+        return {s: int(round(c + self.heavy.error / 2)) for s, c in self.heavy.counters.items() if c > threshold}
+
+    def __reconstruct(self) -> (list, list, list):
+        """
+        reconstructs the species counts of the reference sample. Abundant species contribute their heavy hitter
+        counts, the other species estimated by the HyperLogLog sketch are spread evenly over the other sampled species,
+        each standing for about 2^level species with the same count
+        :return: the heavy hitter counts, the other sampled counts and the number of species each of them stands for
+        """
+        heavy = self.__heavy()
+        sampled = [c for s, c in self.sample.items() if s not in heavy]
+        if len(sampled) == 0:
+            return list(heavy.values()), sampled, []
+        weight, remainder = divmod(len(self) - len(heavy), len(sampled))
+        return list(heavy.values()), sampled, [weight + 1 if i < remainder else weight for i in range(len(sampled))]
+
+    def frequencies(self) -> dict:
+        """
+        returns the frequency counts of the reference sample, i.e. the number of species f_k with count k, from which
+        the metric functions are computed without expanding the reconstructed counts of all species
+        :return: the exact frequency counts if no species were dropped, else the reconstructed ones, summing to len
+        """
+        if self.level == 0:
+            return dict(Counter(self.sample.values()))
+        heavy, sampled, weights = self.__reconstruct()
+        frequencies = Counter(heavy)
+        for c, w in zip(sampled, weights):
+            frequencies[c] = frequencies[c] + w
+        return {k: f for k, f in frequencies.items() if f > 0}
+
+    def values(self) -> list | ReconstructedCounts:
+        """
+        :return: the exact counts if no species were dropped, else a lazy view of the reconstructed counts, see
+        frequencies
+        """
+        if self.level == 0:
+            return list(self.sample.values())
+        return ReconstructedCounts(*self.__reconstruct())
+
+    def items(self) -> list:
+        return list(zip(self.keys(), (self.get(s) for s in self.keys())))
+
+    def error_bounds(self) -> dict:
+        """
+        returns one standard error of the quantities the estimators depend on, all zero while counts are exact
+        :return: the standard errors of the observed number of species, the numbers of singletons and doubletons and
+        the maximum underestimation of heavy hitter counts
+        """
+        if self.level == 0:
+            return {"species": 0.0, "singletons": 0.0, "doubletons": 0.0, "heavy_hitters": 0}
+        scale = 1 << self.level
+        sampled = list(self.sample.values())
+        return {"species": self.cardinality.relative_error() * self.cardinality.estimate(),
+                "singletons": math.sqrt(sampled.count(1) * scale * (scale - 1)),
+                "doubletons": math.sqrt(sampled.count(2) * scale * (scale - 1)),
+                "heavy_hitters": self.heavy.error}
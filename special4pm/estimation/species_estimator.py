@@ -1,20 +1,37 @@
-from typing import Callable
-
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from itertools import islice
+from typing import Callable, Iterable
+
+import numpy as np
 import pandas as pd
 import pm4py
 from deprecation import deprecated
 from pandas import DataFrame
-from pm4py.objects.log.obj import EventLog, Trace
+from pm4py.objects.log.obj import EventLog, Trace, Event
 from special4pm.bootstrap import bootstrap
 from tqdm import tqdm
 
-from special4pm.estimation.metrics import get_singletons, get_doubletons, completeness, coverage, \
-    sampling_effort_abundance, sampling_effort_incidence, hill_number_asymptotic, entropy_exp, simpson_diversity
+from special4pm.estimation.checkpoints import CheckpointSchedule, checkpoint_schedule
+from special4pm.estimation.grouping import group_function
+from special4pm.estimation.open_cases import OpenCases
+from special4pm.estimation.metric_registry import Metric, default_metrics
+from special4pm.estimation.metrics import SampleStatistics
+from special4pm.estimation.postings import PostingLists
+from special4pm.estimation.sampling import sample_indices, reservoir_sample, bernoulli_sample
+from special4pm.estimation.sketch import SpeciesSketch
+from special4pm.species.matrix import SpeciesMatrix
+from special4pm.species.specs import SpeciesSpec, EncodedSpeciesSpec, DataFrameSpeciesSpec, SpeciesCache, \
+    NGram, AttributeNGram, compile_species, compile_species_family
+from special4pm.species.vectorized import EncodedLog
+# modules instead of functions are imported, as both import the metrics of this package, i.e. import it circularly
+from special4pm.raripolation import coverage as coverage_curves, rarefaction_extrapolation
 
 
 # TODO enum for proper key access
 # TODO redo print to be r-like table of current values or history of values
-# TODO differentiate between abundance and incidence
 # TODO maybe remove MetricManager and have class extend hash map directly
 # TODO move bootstrap out of here
 # TODO dataFrame incorporate all information
@@ -24,7 +41,13 @@ class MetricManager(dict):
     """
     Manages metrics for abundance and incidence models.
     """
-    def __init__(self, d0: bool, d1: bool, d2: bool, c0: bool, c1: bool, l_n: list) -> None:
+    def __init__(self, d0: bool, d1: bool, d2: bool, c0: bool, c1: bool, l_n: list, abundance: bool = True,
+                 incidence: bool = True, registry: dict | None = None, index: bool = False) -> None:
+        """
+        :param registry: the metrics recorded at each checkpoint, keyed by name, see default_metrics. Defaults to the
+        metrics selected by the flags
+        :param index: flag indicating if the traces containing each species are indexed, see PostingLists
+        """
         # reference sample stats
         super().__init__()
         self.reference_sample_abundance = {}
@@ -36,61 +59,84 @@ class MetricManager(dict):
         self.abundance_sample_size = 0
         self.current_co_occurrence = 0
         self.empty_traces = 0
+        self.postings = PostingLists() if index else None
 
-        self["abundance_no_observations"] = [0]
-        self["incidence_no_observations"] = [0]
-        self["abundance_sum_species_counts"] = [0]
-        self["incidence_sum_species_counts"] = [0]
-        self["degree_of_co_occurrence"] = [0]
-        self["abundance_singletons"] = [0]
-        self["incidence_singletons"] = [0]
-        self["abundance_doubletons"] = [0]
-        self["incidence_doubletons"] = [0]
-        if d0:
-            self["abundance_sample_d0"] = [0]
-            self["incidence_sample_d0"] = [0]
-            self["abundance_estimate_d0"] = [0]
-            self["incidence_estimate_d0"] = [0]
-            self["incidence_estimate_d0_ci"] = [-1]
-
-        if d1:
-            self["abundance_sample_d1"] = [0]
-            self["incidence_sample_d1"] = [0]
-            self["abundance_estimate_d1"] = [0]
-            self["incidence_estimate_d1"] = [0]
-            self["incidence_estimate_d1_ci"] = [-1]
-
-        if d2:
-            self["abundance_sample_d2"] = [0]
-            self["incidence_sample_d2"] = [0]
-            self["abundance_estimate_d2"] = [0]
-            self["incidence_estimate_d2"] = [0]
-            self["incidence_estimate_d2_ci"] = [-1]
-
-        if c0:
-            self["abundance_c0"] = [0]
-            self["incidence_c0"] = [0]
-            self["incidence_c0_ci"] = [-1]
-
-        if c1:
-            self["abundance_c1"] = [0]
-            self["incidence_c1"] = [0]
-            self["incidence_c1_ci"] = [-1]
-
-        for l in l_n:
-            self["abundance_l_" + str(l)] = [0]
-            self["incidence_l_" + str(l)] = [0]
-            self["incidence_l_" + str(l)+"_ci"] = [-1]
+        self.data_types = [t for t, included in [("abundance", abundance), ("incidence", incidence)] if included]
+        self.registry = default_metrics(d0, d1, d2, c0, c1, l_n) if registry is None else registry
+        for name, metric in self.registry.items():
+            self.add_metric(name, metric)
+
+    def add_metric(self, name: str, metric: Metric) -> None:
+        """
+        adds the entries of a metric for all included data types, initialized like all other metrics
+        :param name: the name of the metric
+        :param metric: the metric
+        """
+        if not metric.per_data_type:
+            self.setdefault(name, [0])
+            return
+        for t in self.data_types:
+            self.setdefault(t + "_" + name, [0])
+        if metric.bootstrap_ci and "incidence" in self.data_types:
+            self.setdefault("incidence_" + name + "_ci", [-1])
+
+    def add_checkpoint(self) -> None:
+        """
+        records all registered metrics for the current reference samples. Sufficient statistics of a reference sample
+        are computed once and shared by all metrics, see SampleStatistics
+        """
+        statistics = {t: SampleStatistics(getattr(self, "reference_sample_" + t), getattr(self, t + "_sample_size"),
+                                          t == "abundance", getattr(self, t + "_current_total_species_count"))
+                      for t in self.data_types}
+        for name, metric in self.registry.items():
+            if not metric.per_data_type:
+                self[name].append(metric.function(self))
+                continue
+            for t in self.data_types:
+                self[t + "_" + name].append(metric.function(statistics[t]))
+            if metric.bootstrap_ci and "incidence" in self.data_types:
+                self["incidence_" + name + "_ci"].append(-1)
+
+
+class ApproximateMetricManager(MetricManager):
+    """
+    Manages metrics for abundance and incidence models in bounded memory, keeping the reference samples in species
+    sketches instead of exact dictionaries.
+    """
+    def __init__(self, d0: bool, d1: bool, d2: bool, c0: bool, c1: bool, l_n: list, abundance: bool = True,
+                 incidence: bool = True, capacity: int = 100000, heavy_hitters: int = 1000,
+                 precision: int = 14, registry: dict | None = None, index: bool = False) -> None:
+        """
+        :param capacity: the maximum number of exactly counted species per reference sample
+        :param heavy_hitters: the number of abundant species tracked exactly per reference sample
+        :param precision: the precision of the HyperLogLog sketches estimating the number of observed species
+        """
+        super().__init__(d0, d1, d2, c0, c1, l_n, abundance, incidence, registry, index)
+        self.reference_sample_abundance = SpeciesSketch(capacity, heavy_hitters, precision)
+        self.reference_sample_incidence = SpeciesSketch(capacity, heavy_hitters, precision)
+
+    def error_bounds(self) -> dict:
+        """
+        returns the standard errors of the sketched quantities of both reference samples, see SpeciesSketch
+        """
+        return {"abundance": self.reference_sample_abundance.error_bounds(),
+                "incidence": self.reference_sample_incidence.error_bounds()}
 
 
 class SpeciesEstimator:
     """
     A class for the estimation of diversity and completeness profiles of trace-based species definitions
     """
+    # bounds on the number of traces read at once when applying a log chunk by chunk
+    MIN_CHUNK_SIZE = 1000
+    MAX_CHUNK_SIZE = 100000
 
     def __init__(self, d0: bool = True, d1: bool = True, d2: bool = True, c0: bool = True,
                  c1: bool = True,
-                 l_n: list = [.9, .95, .99], no_bootstrap_samples: int = 0, step_size: int | None = None):
+                 l_n: list = [.9, .95, .99], no_bootstrap_samples: int = 0, step_size: int | None = None,
+                 cache_size: int = 0, sketch_capacity: int | None = None, abundance: bool = True,
+                 incidence: bool = True, checkpoints: int | str | list | Callable | CheckpointSchedule | None = None,
+                 bootstrap_method: str = "parametric", index_traces: bool = False):
         """
         :param d0: flag indicating if D0(=species richness) should be included
         :param d1: flag indicating if D1(=exponential Shannon entropy) should be included
@@ -99,10 +145,24 @@ class SpeciesEstimator:
         :param c1: flag indicating if C1(=coverage) should be included
         :param l_n: list of desired completeness values for estimation additional sampling effort
         :param step_size: the number of added traces after which the profiles are updated. Use None if
+        profiles should only be updated once after all traces have been added
+        :param cache_size: the maximum number of trace variants whose retrieved species are memoized per spec, see
+        SpeciesCache. Use 0 to disable memoization
+        :param sketch_capacity: if set, reference samples are kept in bounded memory, counting at most this many
+        species exactly, see ApproximateMetricManager. Use None for exact reference samples
+        :param abundance: flag indicating if abundance-based species counts and metrics should be included
+        :param incidence: flag indicating if incidence-based species counts and metrics should be included
+        :param checkpoints: the numbers of added traces after which the profiles are updated, replacing step_size if
+        set. Either "geometric" for log-spaced checkpoints, a list of numbers of traces, a predicate over the number
+        of traces or a CheckpointSchedule, see checkpoint_schedule
+        :param bootstrap_method: "parametric" for bootstrap replicates drawn from the estimated species distribution,
+        or "nonparametric" for replicates resampling the traces of the log, which requires the species matrices of
+        the log, see build_matrices
+        :param index_traces: flag indicating if the ids of the traces containing each species are indexed, see
+        traces_containing. Logs are not collapsed into their variants then
         """
-        # TODO add differentiation between abundance and incidence based data
-        self.include_abundance = True
-        self.include_incidence = True
+        self.include_abundance = abundance
+        self.include_incidence = incidence
 
         self.include_d0 = d0
         self.include_d1 = d1
@@ -112,25 +172,115 @@ class SpeciesEstimator:
         self.include_c1 = c1
 
         self.no_bootstrap_samples = no_bootstrap_samples
+        if bootstrap_method not in ("parametric", "nonparametric"):
+            raise RuntimeError('Unknown bootstrap method ' + bootstrap_method)
+        self.bootstrap_method = bootstrap_method
 
         self.l_n = l_n
+        self.metric_registry = default_metrics(d0, d1, d2, c0, c1, l_n)
 
         self.step_size = step_size
+        self.checkpoints = checkpoint_schedule(checkpoints if checkpoints is not None else step_size)
 
         self.metrics = {}
         self.species_retrieval = {}
+        self.species_families = {}
+        self.species_cache = SpeciesCache(cache_size) if cache_size > 0 else None
+        self.sketch_capacity = sketch_capacity
+        self.index_traces = index_traces
 
         self.current_obs_empty = False
 
-    def register(self, species_id: str, function: Callable) -> None:
-        self.species_retrieval[species_id] = function
-        self.metrics[species_id] = MetricManager(self.include_d0, self.include_d1, self.include_d2, self.include_c0,
-                                                 self.include_c1, self.l_n)
+        self.stop_when = None
+        self.stopped_at = {}
+
+        self.species_matrices = {}
+        self.matrix_case_ids = None
+
+        self.strata = {}
+        self.windows = {}
+
+        self.open_cases = None
+        self.evicted_cases = 0
+
+    def register(self, species_id: str, function: Callable | SpeciesSpec) -> None:
+        """
+        registers a species definition. Known retrieval functions are compiled into their spec, see compile_species,
+        so that faster backends can be used when applying whole logs. Other callables are applied trace by trace
+        :param species_id: the id of the species definition
+        :param function: the spec or retrieval function returning the list of species of a trace
+        """
+        self.species_retrieval[species_id] = compile_species(function)
+        self.metrics[species_id] = self.__create_metric_manager()
+
+    def register_family(self, species_ids: list, function: Callable) -> None:
+        """
+        registers a family of species definitions whose species are retrieved together in a single pass over each
+        trace, e.g. all n-grams up to some length. Each member keeps its own metrics
+        :param species_ids: the ids of the member species definitions
+        :param function: retrieval function returning one list of species per member, in the order of species_ids
+        """
+        self.species_families[tuple(species_ids)] = function
+        for species_id in species_ids:
+            self.metrics[species_id] = self.__create_metric_manager()
+
+    def __create_metric_manager(self) -> MetricManager:
+        if self.sketch_capacity is None:
+            return MetricManager(self.include_d0, self.include_d1, self.include_d2, self.include_c0, self.include_c1,
+                                 self.l_n, self.include_abundance, self.include_incidence, self.metric_registry,
+                                 self.index_traces)
+        return ApproximateMetricManager(self.include_d0, self.include_d1, self.include_d2, self.include_c0,
+                                        self.include_c1, self.l_n, self.include_abundance, self.include_incidence,
+                                        self.sketch_capacity, registry=self.metric_registry, index=self.index_traces)
+
+    def register_metric(self, name: str, function: Callable, per_data_type: bool = True) -> None:
+        """
+        registers a custom metric recorded at every checkpoint, in addition to the diversity and completeness profiles.
+        Metrics should be registered before any observations are added
+        :param name: the name of the metric
+        :param function: for metrics per data type, a function of the SampleStatistics of a reference sample, which
+        can be passed to all functions of special4pm.estimation.metrics. Otherwise, a function of the MetricManager
+        :param per_data_type: flag indicating if the metric is recorded for abundance and incidence data separately
+        """
+        self.metric_registry[name] = Metric(function, per_data_type)
+        for metrics in self.metrics.values():
+            metrics.add_metric(name, self.metric_registry[name])
+
+    def derive(self) -> "SpeciesEstimator":
+        """
+        creates an estimator with the same configuration, metrics and species definitions as this one, but without
+        any observations
+        :return: the new estimator
+        """
+        estimator = SpeciesEstimator(self.include_d0, self.include_d1, self.include_d2, self.include_c0,
+                                     self.include_c1, self.l_n, self.no_bootstrap_samples, self.step_size,
+                                     0 if self.species_cache is None else self.species_cache.maxsize,
+                                     self.sketch_capacity, self.include_abundance, self.include_incidence,
+                                     self.checkpoints, self.bootstrap_method, self.index_traces)
+        estimator.metric_registry = self.metric_registry
+        estimator.species_retrieval = dict(self.species_retrieval)
+        estimator.species_families = dict(self.species_families)
+        for species_id in self.metrics.keys():
+            estimator.metrics[species_id] = estimator.__create_metric_manager()
+        return estimator
 
     def add_bootstrap_ci(self, sample_size):
         #print("Adding Bootstrapping Confidence Intervals")
+        # bootstrap confidence intervals are only derived for incidence data
+        if not self.include_incidence:
+            return
         for species_id in self.metrics.keys():
-            ci=(bootstrap.get_bootstrap_ci_incidence(self.metrics[species_id].reference_sample_incidence,
+            if self.bootstrap_method == "nonparametric":
+                if species_id not in self.species_matrices:
+                    raise RuntimeError('Cannot resample traces without the species matrix of ' + species_id)
+                # after stopping early or sampling, the matrix covers other traces than the estimates
+                if len(self.species_matrices[species_id]) != self.metrics[species_id].incidence_sample_size:
+                    raise RuntimeError('Cannot resample traces, the species matrix of ' + species_id + ' holds ' +
+                                       str(len(self.species_matrices[species_id])) + ' traces, but ' +
+                                       str(self.metrics[species_id].incidence_sample_size) + ' were observed')
+                ci = bootstrap.get_nonparametric_bootstrap_ci_incidence(self.species_matrices[species_id], sample_size)
+            else:
+                ci=(bootstrap.get_bootstrap_ci_incidence(self.metrics[species_id].reference_sample_incidence,
                                                        self.metrics[species_id].incidence_sample_size - self.metrics[species_id].empty_traces,
                                                        sample_size))
             self.metrics[species_id]["incidence_estimate_d0_ci"][-1] = ci[0]
@@ -153,43 +303,844 @@ class SpeciesEstimator:
         #    print()
         return
 
-    def apply(self, data: pd.DataFrame | EventLog | Trace, verbose=True) -> None:
+    def apply(self, data: pd.DataFrame | EventLog | Trace | EncodedLog | Iterable, verbose=True,
+              stop_when: dict | None = None, stop_for: list | None = None,
+              group_by: str | Callable | None = None) -> dict:
         """
         add all observations of an event log and update diversity and completeness profiles once afterward.
-        If parameter step_size is set to an int, profiles are additionally updated along the way according to
-        the step size
-        :param data: the event log containing the trace observations
+        If checkpoints or step_size are set, profiles are additionally updated along the way whenever a checkpoint is
+        reached. Species definitions given as specs are retrieved by their fastest backend: encoded specs are
+        counted for many traces at once from an integer-encoded copy of the log, data frame specs retrieve the species
+        of all cases at once if the log is given as data frame. All other definitions are applied trace by trace.
+        If stop_when is given, a species definition stops adding observations at the first checkpoint at which all
+        given metrics have reached their thresholds, and is skipped by subsequent calls with stop_when. The log is then
+        read in chunks of cases reaching up to the next checkpoint, between MIN_CHUNK_SIZE and MAX_CHUNK_SIZE traces,
+        and reading stops once all species definitions have stopped. Only the chunks read are encoded, converted and
+        retrieved, yet a data frame is grouped by case once upfront and is held in memory as a whole. An iterable of
+        traces, such as a generator, is always read this way and only pulled as far as needed
+        :param data: the event log containing the trace observations, or an iterable of traces
+        :param stop_when: the thresholds of the stopping criterion, keyed by metric name, e.g. {"incidence_c1": 0.99}.
+        As estimates on tiny samples are unreliable, a minimum sample size may be given as "incidence_no_observations"
+        :param stop_for: the ids of the species definitions that may stop early, all if None
+        :param group_by: if given, each trace is additionally added to the estimator of its stratum in strata, in the
+        same pass over the log and sharing the retrieved species, such that this estimator holds the pooled profiles.
+        Either a function of the trace returning its stratum, an attribute key or a condition like "Age>=60", see
+        group_function. Traces lacking the attribute are collected in the stratum None
+        :return: the number of observations after which each species definition stopped, for all stopped definitions
+        """
+        if group_by is not None:
+            if stop_when is not None:
+                raise RuntimeError('Cannot stop early when grouping traces')
+            self.__apply_grouped(data, group_function(group_by), verbose)
+            return dict(self.stopped_at)
+        if stop_when is not None:
+            if self.checkpoints is None:
+                raise RuntimeError('Cannot stop early without checkpoints or step_size')
+            stop_for = list(self.metrics.keys()) if stop_for is None else stop_for
+            for species_id in stop_for:
+                for metric in stop_when.keys():
+                    if metric not in self.metrics[species_id]:
+                        raise RuntimeError('Cannot stop on metric ' + metric + ' not recorded for ' + species_id)
+            self.stop_when = (stop_when, set(stop_for))
+        try:
+            if isinstance(data, (Trace, EncodedLog)) or \
+                    (isinstance(data, (pd.DataFrame, EventLog, list)) and stop_when is None):
+                self.__apply(data, verbose)
+            else:
+                self.__apply_chunks(data, verbose)
+        finally:
+            self.stop_when = None
+        return dict(self.stopped_at)
+
+    def apply_sample(self, data, fraction: float | None = None, size: int | None = None, seed: int | None = None,
+                     q: list = [0, 1, 2], bootstrap: int = 100, workers: int | None = None,
+                     verbose=True, case_id_key: str = "case:concept:name") -> DataFrame:
+        """
+        profiles a reproducible random subset of the traces of a log instead of the full log, then extrapolates the
+        Hill numbers of each species definition from the subset to the size of the full log. Event logs, lists of
+        traces, encoded logs and data frames are sampled without replacement. Other iterables of traces are treated as
+        streams and sampled in a single pass, by reservoir sampling if a size is given and by keeping each trace with
+        probability fraction otherwise. Asymptotic estimates are recorded in the profiles as by apply, including
+        bootstrap confidence intervals if no_bootstrap_samples is set
+        :param data: the event log or stream of traces
+        :param fraction: the fraction of traces to be profiled
+        :param size: the number of traces to be profiled, used if fraction is not given
+        :param seed: the seed of the random number generator, making the subset reproducible
+        :param q: the orders of the Hill numbers, each of 0, 1 or 2
+        :param bootstrap: the number of bootstrap replicates used for the confidence bands of the extrapolation
+        :param workers: the number of worker processes used for evaluating bootstrap replicates
+        :param case_id_key: the column containing the case ids if the log is given as data frame, by which the subset
+        is sampled and profiled
+        :return: a data frame containing the Hill numbers at the size of the subset and extrapolated to the size of
+        the full log, see raripolate
+        """
+        if (fraction is None) == (size is None):
+            raise RuntimeError('Exactly one of fraction and size has to be given')
+        rng = np.random.default_rng(seed)
+
+        if isinstance(data, pd.DataFrame):
+            cases = data[case_id_key].unique()
+            total = len(cases)
+            selected = cases[sample_indices(total, self.__sample_size(total, fraction, size), rng)]
+            sample = data[data[case_id_key].isin(selected)]
+            if case_id_key != "case:concept:name":
+                # traces of data frames are profiled by the standard case id column
+                sample = sample.drop(columns="case:concept:name", errors="ignore").rename(
+                    columns={case_id_key: "case:concept:name"})
+        elif isinstance(data, EncodedLog):
+            total = len(data)
+            sample = data.select(sample_indices(total, self.__sample_size(total, fraction, size), rng))
+        elif isinstance(data, (EventLog, list)):
+            total = len(data)
+            sample = [data[i] for i in sample_indices(total, self.__sample_size(total, fraction, size), rng)]
+            if isinstance(data, EventLog):
+                sample = EventLog(sample, attributes=data.attributes, extensions=data.extensions,
+                                  omni_present=data.omni_present, classifiers=data.classifiers,
+                                  properties=data.properties)
+        elif fraction is None:
+            sample, total = reservoir_sample(data, size, rng)
+        else:
+            sample, total = bernoulli_sample(data, fraction, rng)
+
+        self.apply(sample, verbose)
+
+        abundance = not self.include_incidence
+        extrapolations = []
+        for species_id in self.metrics.keys():
+            metrics = self.metrics[species_id]
+            sample_size = metrics.abundance_sample_size if abundance else metrics.incidence_sample_size
+            # the number of species observations of the full log is only known for incidence data
+            full_size = sample_size * total // max(metrics.incidence_sample_size, 1) if abundance else total
+            extrapolations.append(self.raripolate(species_id, q, [sample_size, full_size], bootstrap=bootstrap,
+                                                  workers=workers, abundance=abundance))
+        return pd.concat(extrapolations, ignore_index=True)
+
+    @staticmethod
+    def __sample_size(total: int, fraction: float | None, size: int | None) -> int:
+        return min(total, size) if fraction is None else int(round(total * fraction))
+
+    def build_matrices(self, data: pd.DataFrame | EventLog, directory: str | None = None, verbose=True) -> dict:
+        """
+        retrieves the species of every trace of an event log into a sparse trace x species matrix per species
+        definition, see SpeciesMatrix. Profiles are not updated. The matrices are kept in species_matrices and, if a
+        directory is given, saved to one subdirectory per species definition, from where load_matrices maps them
+        into memory again. The case ids of the rows are kept in matrix_case_ids
+        :param data: the event log
+        :param directory: the directory the matrices are saved to
+        :return: the matrices, keyed by species id
+        """
+        built = []
+        if isinstance(data, pd.DataFrame):
+            self.matrix_case_ids = np.array([str(case) for case in pd.unique(data["case:concept:name"])], dtype=str)
+            for species_id, function in self.species_retrieval.items():
+                if isinstance(function, DataFrameSpeciesSpec):
+                    self.species_matrices[species_id] = \
+                        SpeciesMatrix.from_species_lists(function.retrieve_dataframe(data))
+                    built.append(species_id)
+            if len(built) < len(self.metrics):
+                data = pm4py.convert_to_event_log(data)
+        else:
+            self.matrix_case_ids = np.array([str(tr.attributes.get("concept:name", i)) if isinstance(tr, Trace)
+                                             else str(i) for i, tr in enumerate(data)], dtype=str)
+
+        for species_id in self.species_retrieval.keys():
+            if species_id not in built:
+                self.species_matrices[species_id] = SpeciesMatrix.from_species_lists(
+                    self.retrieve_species(tr, species_id)[0]
+                    for tr in tqdm(data, "Retrieving Species for " + species_id, disable=not verbose))
+        for species_ids, function in self.species_families.items():
+            species_lists = [[] for _ in species_ids]
+            for tr in tqdm(data, "Retrieving Species for " + ", ".join(species_ids), disable=not verbose):
+                for member, species_abundance in zip(species_lists, function(tr)):
+                    member.append(species_abundance)
+            for species_id, member in zip(species_ids, species_lists):
+                self.species_matrices[species_id] = SpeciesMatrix.from_species_lists(member)
+
+        if directory is not None:
+            for species_id, matrix in self.species_matrices.items():
+                matrix.save(os.path.join(directory, species_id))
+            np.save(os.path.join(directory, "case_ids.npy"), self.matrix_case_ids)
+        return self.species_matrices
+
+    def load_matrices(self, directory: str, mmap_mode: str | None = "r") -> dict:
+        """
+        loads the matrices of all registered species definitions saved by build_matrices, memory-mapped by default
+        :param directory: the directory the matrices were saved to
+        :param mmap_mode: the memory-map mode passed to np.load, None loads the matrices into memory
+        :return: the matrices, keyed by species id
+        """
+        for species_id in self.metrics.keys():
+            self.species_matrices[species_id] = SpeciesMatrix.load(os.path.join(directory, species_id), mmap_mode)
+        self.matrix_case_ids = np.load(os.path.join(directory, "case_ids.npy"), mmap_mode=mmap_mode)
+        return self.species_matrices
+
+    def profile_subset(self, selection, checkpoints: int | str | list | Callable | CheckpointSchedule | None = None,
+                       verbose=False) -> "SpeciesEstimator":
+        """
+        profiles a subset of the traces of a log from its species matrices, see build_matrices, without retrieving
+        species again. The subset is profiled by a new estimator with the configuration of this one
+        :param selection: a boolean mask over the traces of the log, the indices of the selected traces or their case
+        ids
+        :param checkpoints: the checkpoints of the new estimator, defaults to the checkpoints of this one
+        :return: the new estimator holding the profiles of the subset
+        """
+        if any(species_id not in self.species_matrices for species_id in self.metrics.keys()):
+            raise RuntimeError('Cannot profile subsets without the species matrices of all species definitions')
+        selection = np.asarray(selection)
+        if selection.dtype == bool:
+            rows = np.flatnonzero(selection)
+        elif np.issubdtype(selection.dtype, np.integer):
+            rows = selection
+        else:
+            rows = pd.Index(self.matrix_case_ids).get_indexer(selection.astype(str))
+            if (rows < 0).any():
+                raise RuntimeError('Unknown case ids ' + str(selection[rows < 0].tolist()))
+
+        estimator = self.derive()
+        if checkpoints is not None:
+            estimator.step_size = None
+            estimator.checkpoints = checkpoint_schedule(checkpoints)
+        estimator.apply_matrices({species_id: self.species_matrices[species_id].select(rows)
+                                  for species_id in self.metrics.keys()}, verbose)
+        estimator.matrix_case_ids = self.matrix_case_ids[rows]
+        return estimator
+
+    def apply_matrices(self, matrices: dict | None = None, verbose=True) -> None:
+        """
+        adds the observations of species matrices instead of an event log, updating profiles at every checkpoint as
+        apply does. No species are retrieved, so profiles of subsets or reorderings of the traces of a log only require
+        its matrices, see build_matrices
+        :param matrices: the matrices of registered species definitions keyed by species id, defaults to
+        species_matrices
+        """
+        matrices = dict(self.species_matrices) if matrices is None else matrices
+        for species_id, matrix in matrices.items():
+            if species_id not in self.metrics:
+                raise RuntimeError('Cannot apply matrix of unregistered species definition ' + species_id)
+            self.species_matrices[species_id] = matrix
+            self.__apply_counts(matrix, species_id, matrix.counts, verbose, matrix.postings)
+        if self.no_bootstrap_samples > 0:
+            self.add_bootstrap_ci(self.no_bootstrap_samples)
+
+    def permutation_profiles(self, data: pd.DataFrame | EventLog | None = None, k: int = 10,
+                             workers: int | None = None, seed: int | None = None, quantiles: list = [.025, .975],
+                             verbose=True) -> DataFrame:
+        """
+        computes the profiles of k random orderings of the traces of a log from its species matrices, averaging out
+        the dependence of the profiles on the order of traces. Matrices are built from the log if they are not
+        available yet. Profiles are updated at the checkpoints of this estimator, but not recorded in it
+        :param data: the event log, only required if the matrices have not been built or loaded yet
+        :param k: the number of random orderings
+        :param workers: the number of worker processes, computes orderings serially if None or 1. Requires all
+        registered metrics to be picklable
+        :param seed: the seed of the random number generator
+        :param quantiles: the lower and upper quantile of the bands around the mean profile
+        :return: a data frame containing the mean and quantiles of each metric at each checkpoint
+        """
+        if self.checkpoints is None:
+            raise RuntimeError('Cannot compute permutation profiles without checkpoints or step_size')
+        if any(species_id not in self.species_matrices for species_id in self.metrics.keys()):
+            if data is None:
+                raise RuntimeError('Cannot compute permutation profiles without an event log or species matrices')
+            self.build_matrices(data, verbose=verbose)
+
+        # species are retrieved from the matrices only, so the definitions need not be shipped to the workers
+        template = self.derive()
+        template.species_retrieval = {}
+        template.species_families = {}
+        template.no_bootstrap_samples = 0
+        matrices = {species_id: self.species_matrices[species_id] for species_id in self.metrics.keys()}
+        tasks = [(template.derive(), matrices, s) for s in np.random.SeedSequence(seed).spawn(k)]
+        if workers is None or workers <= 1:
+            profiles = [_permutation_profile(task) for task in tqdm(tasks, "Profiling Permutations",
+                                                                     disable=not verbose)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                profiles = list(tqdm(executor.map(_permutation_profile, tasks), "Profiling Permutations",
+                                     total=k, disable=not verbose))
+
+        grouped = pd.concat(profiles).groupby(["species", "metric", "observation"], sort=False)["value"]
+        result = grouped.mean().rename("mean").reset_index()
+        result["lower"] = grouped.quantile(quantiles[0]).to_numpy()
+        result["upper"] = grouped.quantile(quantiles[1]).to_numpy()
+        return result
+
+    def apply_windows(self, data, freq: str = "M", timestamp: str = "first", timestamp_key: str = "time:timestamp",
+                      verbose=True, keep_windows: bool = False, max_pending: int = 1000) -> DataFrame:
+        """
+        profiles the traces of a time-ordered log or stream per calendar period, e.g. per week, month or quarter, in a
+        single pass. Each trace belongs to the period of the timestamp of its first or last event. The traces of each
+        period are added to a new estimator, and to this estimator, whose profiles thus cover all traces up to the end
+        of each period. Profiles are updated once at the end of each period instead of at checkpoints. Only the
+        current trace and the estimator of the current period are held in memory, so traces may be read lazily, e.g.
+        from a generator. Traces without timestamp belong to the current period, leading ones to the first period
+        :param data: the traces, ordered by the timestamp the periods are determined by
+        :param freq: the calendar period, given as pandas period alias, e.g. "W", "M", "Q" or "Y"
+        :param timestamp: "first" or "last", the event whose timestamp determines the period of a trace
+        :param timestamp_key: the timestamp attribute of events
+        :param keep_windows: flag indicating if the estimator of each period is kept in windows after its profile has
+        been emitted, otherwise it is released
+        :param max_pending: the maximum number of leading traces without timestamp held until the first period starts
+        :return: a data frame containing the profile of each period and the cumulative profile up to its end, for
+        each species definition and metric
+        """
+        if timestamp not in ("first", "last"):
+            raise RuntimeError('Unknown timestamp ' + timestamp + ', expected "first" or "last"')
+        if isinstance(data, pd.DataFrame):
+            data = pm4py.convert_to_event_log(data)
+        position = 0 if timestamp == "first" else -1
+
+        rows = []
+        window = None
+        # traces without timestamp belong to the current period, or to the first one if no period has started yet
+        pending = []
+        for tr in tqdm(data, "Profiling Log by " + freq, disable=not verbose):
+            t = tr[position].get(timestamp_key) if len(tr) > 0 else None
+            if t is None:
+                if window is None:
+                    if len(pending) >= max_pending:
+                        raise RuntimeError('More than ' + str(max_pending) + ' traces without timestamp precede '
+                                           'the first period')
+                    pending.append(tr)
+                else:
+                    self.__add_to_window(tr, window)
+                continue
+            t = pd.Timestamp(t)
+            period = (t.tz_convert(None) if t.tzinfo is not None else t).to_period(freq)
+            if window is None or period != window:
+                if window is not None:
+                    if period < window:
+                        raise RuntimeError('Traces are not ordered by time, ' + str(period) + ' follows ' + str(window))
+                    rows.extend(self.__close_window(window, keep_windows))
+                window = period
+                self.windows[window] = self.derive()
+                self.windows[window].checkpoints = None
+                for observation in pending:
+                    self.__add_to_window(observation, window)
+                pending = []
+            self.__add_to_window(tr, window)
+        if window is not None:
+            rows.extend(self.__close_window(window, keep_windows))
+        return pd.DataFrame(rows, columns=["window", "species", "metric", "value", "cumulative"])
+
+    def __add_to_window(self, observation: Trace, window: pd.Period) -> None:
+        """
+        adds a single observation to the estimator of its period and to this estimator, without updating profiles
+        """
+        for species_id, (species_abundance, species_incidence) in self.__retrieve_all(observation):
+            for estimator in (self, self.windows[window]):
+                estimator.add_species(species_id, species_abundance, species_incidence)
+
+    def __close_window(self, window: pd.Period, keep: bool) -> list:
+        """
+        updates the profiles of a period and the cumulative profiles at its end, releasing the estimator of the
+        period unless it is kept
+        :return: the rows of the profile table for the period
+        """
+        estimator = self.windows[window]
+        rows = []
+        for species_id in self.metrics.keys():
+            self.update_metrics(species_id)
+            estimator.update_metrics(species_id)
+            rows.extend([window.start_time, species_id, metric, estimator.metrics[species_id][metric][-1], values[-1]]
+                        for metric, values in self.metrics[species_id].items())
+        if not keep:
+            del self.windows[window]
+        return rows
+
+    def open_stream(self, timeout: timedelta | None = None, max_cases: int | None = None,
+                    max_events: int | None = None) -> None:
+        """
+        configures the ingestion of an event stream by push_event. Cases are completed explicitly or after timeout
+        without events. If the limits on open cases or buffered events are exceeded, the least recently active cases
+        are evicted: as their traces are incomplete, they are dropped instead of completed, their abundance counts
+        added event by event are rolled back, and they are counted in evicted_cases. As sketched reference samples,
+        see sketch_capacity, cannot be decremented, n-gram abundance counts are then added once a case completes
+        :param timeout: the inactivity after which a case is considered complete, None if cases only complete
+        explicitly
+        :param max_cases: the maximum number of open cases, None for no limit
+        :param max_events: the maximum number of buffered events of all open cases, None for no limit
+        """
+        if self.open_cases is not None and len(self.open_cases) > 0:
+            raise RuntimeError('Cannot reconfigure event stream with ' + str(len(self.open_cases)) + ' open cases')
+        self.open_cases = OpenCases(timeout, max_cases, max_events)
+
+    def push_event(self, case_id, activity: str, timestamp: datetime | None = None, lifecycle: str | None = None,
+                   attributes: dict | None = None, complete: bool = False) -> list:
+        """
+        adds a single event of an event stream, in which the events of different cases are interleaved. Events are
+        buffered per open case, see open_stream. Abundance counts of n-gram species are updated as the events arrive,
+        while incidence counts, and all counts of other species definitions, are added once a case completes.
+        Profiles are updated at checkpoints, counted in completed cases
+        :param case_id: the case of the event
+        :param activity: the activity of the event
+        :param timestamp: the timestamp of the event, required for timeouts
+        :param lifecycle: the lifecycle transition of the event
+        :param attributes: further event attributes
+        :param complete: flag indicating if the event completes its case
+        :return: the ids of the cases completed by this event, including timed out cases, but not evicted ones
         """
+        if self.open_cases is None:
+            self.open_stream()
+        event = Event({"concept:name": activity})
+        if timestamp is not None:
+            event["time:timestamp"] = timestamp
+        if lifecycle is not None:
+            event["lifecycle:transition"] = lifecycle
+        if attributes is not None:
+            event.update(attributes)
+
+        trace = self.open_cases.append(case_id, event)
+        for species_id, (key, n) in self.__incremental_species().items():
+            if len(trace) >= n:
+                self.__add_event_species(species_id, ",".join(str(e[key]) for e in trace[-n:]))
+
+        completed = [(case_id, self.open_cases.pop(case_id))] if complete else []
+        completed.extend(self.open_cases.expired())
+        evicted = self.open_cases.overflow()
+        self.evicted_cases = self.evicted_cases + len(evicted)
+        for _, tr in evicted:
+            self.__drop_case(tr)
+        for _, tr in completed:
+            self.__complete_case(tr)
+        return [case for case, _ in completed]
+
+    def complete_case(self, case_id) -> None:
+        """
+        completes an open case of an event stream, see push_event
+        :param case_id: the case
+        """
+        if self.open_cases is None or case_id not in self.open_cases:
+            raise RuntimeError('Unknown open case ' + str(case_id))
+        self.__complete_case(self.open_cases.pop(case_id))
+
+    def flush(self) -> list:
+        """
+        completes all open cases of an event stream, e.g. at its end, and updates the profiles
+        :return: the ids of the completed cases
+        """
+        completed = self.open_cases.close_all() if self.open_cases is not None else []
+        for _, tr in completed:
+            self.__complete_case(tr)
+        for species_id in self.metrics.keys():
+            if not self.__is_checkpoint(species_id):
+                self.update_metrics(species_id)
+        return [case for case, _ in completed]
+
+    def __incremental_species(self) -> dict:
+        """
+        returns the species definitions whose abundance counts are updated event by event, i.e. n-grams, unless
+        evicted cases would have to be rolled back from sketched reference samples
+        :return: the event attribute and length of the n-grams, keyed by species id
+        """
+        if self.sketch_capacity is not None and self.open_cases is not None and \
+                (self.open_cases.max_cases is not None or self.open_cases.max_events is not None):
+            return {}
+        return {species_id: (function.key, function.n) for species_id, function in self.species_retrieval.items()
+                if isinstance(function, (NGram, AttributeNGram))}
+
+    def __add_event_species(self, species_id: str, species, count: int = 1) -> None:
+        """
+        adds the abundance count of a single species completed by an event of an open case, or removes it again if
+        count is negative
+        """
+        metrics = self.metrics[species_id]
+        if self.include_abundance:
+            metrics.reference_sample_abundance[species] = metrics.reference_sample_abundance.get(species, 0) + count
+            if metrics.reference_sample_abundance[species] == 0:
+                del metrics.reference_sample_abundance[species]
+        metrics.abundance_sample_size = metrics.abundance_sample_size + count
+        metrics.abundance_current_total_species_count = metrics.abundance_current_total_species_count + count
+        if metrics.incidence_current_total_species_count > 0:
+            metrics.current_co_occurrence = 1 - (
+                    metrics.incidence_current_total_species_count / metrics.abundance_current_total_species_count)
+
+    def __drop_case(self, trace: Trace) -> None:
+        """
+        rolls back the abundance counts added event by event for an evicted case
+        """
+        for species_id, (key, n) in self.__incremental_species().items():
+            for i in range(len(trace) - n + 1):
+                self.__add_event_species(species_id, ",".join(str(e[key]) for e in trace[i:i + n]), -1)
+
+    def __complete_case(self, trace: Trace) -> None:
+        """
+        adds the species of a completed case, except for abundance counts already added event by event
+        """
+        incremental = self.__incremental_species()
+        for species_id, (species_abundance, species_incidence) in self.__retrieve_all(trace):
+            self.add_species(species_id, species_abundance, species_incidence,
+                             count_abundance=species_id not in incremental)
+            if self.__is_checkpoint(species_id):
+                self.update_metrics(species_id)
+
+    def __apply(self, data: pd.DataFrame | EventLog | Trace | EncodedLog, verbose: bool, final: bool = True) -> None:
+        """
+        adds the observations of data for all species definitions not stopped yet. If final is False, data is one chunk
+        of a larger log, and profiles are only updated at checkpoints, leaving the final update and bootstrapping to
+        the caller
+        """
+        specs = {species_id: function for species_id, function in self.species_retrieval.items()
+                 if isinstance(function, SpeciesSpec)}
+        families = []
+        for species_ids, function in self.species_families.items():
+            members = compile_species_family(function)
+            if members is None:
+                families.append(species_ids)
+            else:
+                specs.update(zip(species_ids, members))
+        encoded = {species_id: spec for species_id, spec in specs.items() if isinstance(spec, EncodedSpeciesSpec)}
+
         if isinstance(data, pd.DataFrame):
-            return self.apply(pm4py.convert_to_event_log(data))
+            encodings = {}
+            for species_id, spec in encoded.items():
+                if self.__stopped(species_id):
+                    continue
+                if spec.key not in encodings:
+                    encodings[spec.key] = self.__compress(EncodedLog.from_dataframe(data, key=spec.key))
+                self.__apply_counts(encodings[spec.key], species_id,
+                                    partial(spec.encoded_counts, encodings[spec.key]), verbose,
+                                    partial(spec.encoded_postings, encodings[spec.key]), final)
+            singles = []
+            for species_id, function in self.species_retrieval.items():
+                if self.__stopped(species_id):
+                    continue
+                if isinstance(function, DataFrameSpeciesSpec):
+                    species_lists = function.retrieve_dataframe(data)
+                    self.__apply_species_lists(species_id, ((species, None, 1) for species in species_lists), verbose,
+                                               len(species_lists), final)
+                elif species_id not in encoded:
+                    singles.append(species_id)
+            if len(singles) > 0 or len(families) > 0:
+                self.__apply_traces(pm4py.convert_to_event_log(data), singles, families, verbose, final)
+            if final and self.no_bootstrap_samples > 0:
+                self.add_bootstrap_ci(self.no_bootstrap_samples)
+
+        elif isinstance(data, EncodedLog):
+            if len(encoded) < len(self.metrics):
+                raise RuntimeError('Cannot apply encoded log to species definitions other than encoded specs')
+            for species_id, spec in encoded.items():
+                if not self.__stopped(species_id):
+                    self.__apply_counts(data, species_id, partial(spec.encoded_counts, data), verbose,
+                                        partial(spec.encoded_postings, data), final)
+            if final and self.no_bootstrap_samples > 0:
+                self.add_bootstrap_ci(self.no_bootstrap_samples)
 
         #todo find out why this is notably faster than self.apply(tr) for tr in Log
         elif isinstance(data, EventLog) or isinstance(data, list) :
-            for species_id in self.species_retrieval.keys():
-                #TODO find better way to
-                for tr in tqdm(data, "Profiling Log for " + species_id, disable=not verbose):
-                    self.add_observation(tr, species_id)
-                    # if step size is set, update metrics after <step_size> many traces
-                    if self.step_size is None:
-                        continue
-                    elif self.metrics[species_id].incidence_sample_size % self.step_size == 0:
-                        self.update_metrics(species_id)
-                if self.step_size is None or len(data) % self.step_size != 0:
-                    self.update_metrics(species_id)
-            if self.no_bootstrap_samples > 0:
+            encodings = {}
+            for species_id, spec in encoded.items():
+                if self.__stopped(species_id):
+                    continue
+                if spec.key not in encodings:
+                    encodings[spec.key] = self.__compress(EncodedLog.from_log(data, key=spec.key))
+                self.__apply_counts(encodings[spec.key], species_id,
+                                    partial(spec.encoded_counts, encodings[spec.key]), verbose,
+                                    partial(spec.encoded_postings, encodings[spec.key]), final)
+            singles = [species_id for species_id in self.species_retrieval.keys()
+                       if species_id not in encoded and not self.__stopped(species_id)]
+            self.__apply_traces(data, singles, families, verbose, final)
+            if final and self.no_bootstrap_samples > 0:
                 self.add_bootstrap_ci(self.no_bootstrap_samples)
         elif isinstance(data, Trace):
             for species_id in self.species_retrieval.keys():
-                self.add_observation(data, species_id)
-                # if step size is set, update metrics after <step_size> many traces
-                if self.step_size is None:
+                if self.__stopped(species_id):
                     continue
-                elif self.metrics[species_id].incidence_sample_size % self.step_size == 0:
+                self.add_observation(data, species_id)
+                # if checkpoints are set, update metrics whenever one is reached
+                if self.__is_checkpoint(species_id):
                     self.update_metrics(species_id)
+                    self.__check_stop(species_id)
+            for species_ids in self.species_families.keys():
+                if not all(self.__stopped(species_id) for species_id in species_ids):
+                    self.add_family_observation(data, species_ids)
 
         else:
             raise RuntimeError('Cannot apply data of type ' + str(type(data)))
 
+    def __apply_chunks(self, data, verbose: bool) -> None:
+        """
+        adds the observations of a log chunk by chunk, each chunk extending to a checkpoint, such that retrieval and
+        encoding stop together with the last species definition stopping early. Traces of an iterable are only pulled
+        as far as needed
+        """
+        chunks = self.__chunks(data)
+        next(chunks)
+        total = len(data) if hasattr(data, "__len__") else None
+        with tqdm(total=total, desc="Profiling Log", disable=not verbose) as progress:
+            while not all(self.__stopped(species_id) for species_id in self.metrics.keys()):
+                chunk = chunks.send(self.__chunk_size())
+                if chunk is None:
+                    break
+                self.__apply(chunk, False, final=False)
+                progress.update(len(chunk))
+        chunks.close()
+        for species_id in self.metrics.keys():
+            if not self.__is_checkpoint(species_id):
+                self.update_metrics(species_id)
+        if self.no_bootstrap_samples > 0:
+            self.add_bootstrap_ci(self.no_bootstrap_samples)
+
+    def __chunks(self, data):
+        """
+        generator of the chunks of a log, receiving the number of traces of the next chunk by send and yielding None
+        once the log is exhausted. A data frame is split into cases, grouping its rows by case once upfront
+        """
+        if isinstance(data, pd.DataFrame):
+            codes, cases = pd.factorize(data["case:concept:name"])
+            rows = np.argsort(codes, kind="stable")
+            bounds = np.concatenate(([0], np.cumsum(np.bincount(codes[codes >= 0], minlength=len(cases)))))
+            start = 0
+            size = yield
+            while start < len(cases):
+                stop = min(start + size, len(cases))
+                size = yield data.iloc[rows[bounds[start]:bounds[stop]]]
+                start = stop
+        else:
+            try:
+                traces = iter(data)
+            except TypeError:
+                raise RuntimeError('Cannot apply data of type ' + str(type(data)))
+            size = yield
+            while True:
+                chunk = list(islice(traces, size))
+                if len(chunk) == 0:
+                    break
+                size = yield chunk
+        while True:
+            yield None
+
+    def __chunk_size(self) -> int:
+        """
+        returns the number of traces of the next chunk, reaching up to the first checkpoint after at least
+        MIN_CHUNK_SIZE traces of the species definition with the fewest observations that has not stopped yet
+        """
+        n = min(self.metrics[species_id].incidence_sample_size for species_id in self.metrics.keys()
+                if not self.__stopped(species_id))
+        checkpoint = self.checkpoints.next_checkpoint(n + self.MIN_CHUNK_SIZE - 1, n + self.MAX_CHUNK_SIZE) \
+            if self.checkpoints is not None else None
+        return self.MAX_CHUNK_SIZE if checkpoint is None else checkpoint - n
+
+    def __apply_grouped(self, data: pd.DataFrame | EventLog | Trace, group: Callable, verbose: bool) -> None:
+        """
+        adds the observations of an event log trace by trace to the pooled profiles and to the profiles of the stratum
+        of each trace, retrieving the species of each trace once
+        """
+        if isinstance(data, pd.DataFrame):
+            data = pm4py.convert_to_event_log(data)
+        elif isinstance(data, Trace):
+            data = [data]
+        elif not isinstance(data, (EventLog, list)):
+            raise RuntimeError('Cannot group data of type ' + str(type(data)))
+
+        updated = {id(self): self}
+        for tr in tqdm(data, "Profiling Log by Strata", disable=not verbose):
+            key = group(tr)
+            if key not in self.strata:
+                self.strata[key] = self.derive()
+            estimators = (self, self.strata[key])
+            updated[id(self.strata[key])] = self.strata[key]
+            for species_id, (species_abundance, species_incidence) in self.__retrieve_all(tr):
+                for estimator in estimators:
+                    estimator.add_species(species_id, species_abundance, species_incidence)
+                    if estimator.__is_checkpoint(species_id):
+                        estimator.update_metrics(species_id)
+        for estimator in updated.values():
+            for species_id in self.metrics.keys():
+                if not estimator.__is_checkpoint(species_id):
+                    estimator.update_metrics(species_id)
+            if self.no_bootstrap_samples > 0:
+                estimator.add_bootstrap_ci(self.no_bootstrap_samples)
+
+    def __retrieve_all(self, observation: Trace) -> list:
+        """
+        retrieves the species of a single observation for all species definitions and families
+        :return: pairs of species id and the species of the observation with repetitions and, if computed, as set
+        """
+        retrieved = [(species_id, self.retrieve_species(observation, species_id))
+                     for species_id in self.species_retrieval.keys()]
+        for species_ids, function in self.species_families.items():
+            retrieved.extend((species_id, (species_abundance, None))
+                             for species_id, species_abundance in zip(species_ids, function(observation)))
+        return retrieved
+
+    def __apply_traces(self, data: EventLog, singles: list, families: list, verbose: bool,
+                       final: bool = True) -> None:
+        """
+        adds the observations of an event log trace by trace for the given species definitions and families
+        """
+        for species_id in singles:
+            variants = self.__compress_traces(data, species_id)
+            if variants is not None:
+                self.__apply_species_lists(species_id, ((*self.retrieve_species(tr, species_id), multiplicity)
+                                                        for tr, multiplicity in variants), verbose, len(variants),
+                                           final)
+                continue
+            #TODO find better way to
+            self.__apply_species_lists(species_id, ((*self.retrieve_species(tr, species_id), 1) for tr in data),
+                                       verbose, len(data), final)
+        for species_ids in families:
+            for tr in tqdm(data, "Profiling Log for " + ", ".join(species_ids), disable=not verbose):
+                if all(self.__stopped(species_id) for species_id in species_ids):
+                    break
+                self.add_family_observation(tr, species_ids)
+            for species_id in species_ids:
+                if final and not self.__is_checkpoint(species_id):
+                    self.update_metrics(species_id)
+
+    def __compress(self, data: EncodedLog) -> EncodedLog:
+        """
+        collapses an encoded log into its variants if profiles are only updated once, as the order of traces does not
+        matter then
+        """
+        return data.compress() if self.checkpoints is None and not self.index_traces else data
+
+    def __compress_traces(self, data: EventLog, species_id: str) -> list | None:
+        """
+        collapses the traces of an event log into pairs of a representative trace and its multiplicity, one per trace
+        key of the species definition. Only done if profiles are updated once and the definition is a spec providing
+        trace keys
+        :return: the pairs in order of first occurrence, or None if the log cannot be collapsed
+        """
+        spec = self.species_retrieval[species_id]
+        if self.checkpoints is not None or self.index_traces or not isinstance(spec, SpeciesSpec):
+            return None
+        variants = {}
+        for tr in data:
+            key = spec.trace_key(tr)
+            if key is None:
+                return None
+            if key in variants:
+                variants[key][1] = variants[key][1] + 1
+            else:
+                variants[key] = [tr, 1]
+        return list(variants.values())
+
+    def __apply_species_lists(self, species_id: str, species_lists, verbose: bool, total: int,
+                              final: bool = True) -> None:
+        """
+        adds the species lists of several observations one by one, updating profiles at every checkpoint. Each
+        item holds the species of an observation with repetitions, optionally the set of its species and the number
+        of identical observations it stands for
+        """
+        for species_abundance, species_incidence, multiplicity in tqdm(species_lists, "Profiling Log for " + species_id,
+                                                                       total=total, disable=not verbose):
+            self.add_species(species_id, species_abundance, species_incidence, multiplicity)
+            # if checkpoints are set, update metrics whenever one is reached
+            if self.__is_checkpoint(species_id):
+                self.update_metrics(species_id)
+                if self.__check_stop(species_id):
+                    break
+        if final and not self.__is_checkpoint(species_id):
+            self.update_metrics(species_id)
+
+    def add_family_observation(self, observation: Trace, species_ids: tuple) -> None:
+        """
+        adds a single observation to all members of a family of species definitions, retrieving their species at once.
+        If checkpoints are set, profiles of the members are updated accordingly
+        :param observation: the trace observation
+        :param species_ids: the ids of the family members, as registered
+        """
+        for species_id, species_abundance in zip(species_ids, self.species_families[species_ids](observation)):
+            if self.__stopped(species_id):
+                continue
+            self.add_species(species_id, species_abundance)
+            if self.__is_checkpoint(species_id):
+                self.update_metrics(species_id)
+                self.__check_stop(species_id)
+
+    def __apply_counts(self, data: EncodedLog | SpeciesMatrix, species_id: str, counts: Callable,
+                       verbose: bool, postings: Callable | None = None, final: bool = True) -> None:
+        """
+        adds the species of all traces of an encoded log or species matrix in bulk, one chunk of traces per profile
+        update. The species counts of a chunk are retrieved by counts(start, stop), the traces containing each
+        species by postings(start, stop) if traces are indexed
+        """
+        start = 0
+        with tqdm(total=len(data), desc="Profiling Log for " + species_id, disable=not verbose) as progress:
+            while start < len(data):
+                stop = len(data)
+                if self.checkpoints is not None:
+                    # encoded logs are only compressed without checkpoints, so traces correspond to observations
+                    n = self.metrics[species_id].incidence_sample_size
+                    checkpoint = self.checkpoints.next_checkpoint(n, n + len(data) - start)
+                    if checkpoint is not None:
+                        stop = start + checkpoint - n
+                abundance, incidence, empty = counts(start, stop)
+                self.add_counts(species_id, abundance, incidence, data.no_traces(start, stop), empty,
+                                postings(start, stop) if self.index_traces else None)
+                progress.update(stop - start)
+                start = stop
+                if self.__is_checkpoint(species_id):
+                    self.update_metrics(species_id)
+                    if self.__check_stop(species_id):
+                        break
+        if final and not self.__is_checkpoint(species_id):
+            self.update_metrics(species_id)
+
+    def __is_checkpoint(self, species_id: str) -> bool:
+        """
+        returns True if the number of observations added for a species definition is a checkpoint of the schedule
+        """
+        return self.checkpoints is not None and \
+            self.checkpoints.is_checkpoint(self.metrics[species_id].incidence_sample_size)
+
+    def __stopped(self, species_id: str) -> bool:
+        """
+        returns True if early stopping is requested and the species definition has already stopped
+        """
+        return self.stop_when is not None and species_id in self.stopped_at
+
+    def __check_stop(self, species_id: str) -> bool:
+        """
+        checks the stopping criterion of a species definition after a checkpoint, recording the number of
+        observations if it is met
+        :return: True if the species definition stops adding observations
+        """
+        if self.stop_when is None or species_id not in self.stop_when[1]:
+            return False
+        if all(self.metrics[species_id][metric][-1] >= threshold for metric, threshold in self.stop_when[0].items()):
+            self.stopped_at[species_id] = self.metrics[species_id].incidence_sample_size
+            return True
+        return False
+
+    def add_counts(self, species_id: str, species_abundance: dict, species_incidence: dict, no_observations: int,
+                   no_empty_observations: int = 0, postings: dict | None = None) -> None:
+        """
+        adds the aggregated species counts of several observations at once
+        :param species_id: the species definition for which the counts shall be added
+        :param species_abundance: the abundance counts of the species in the observations
+        :param species_incidence: the incidence counts of the species in the observations
+        :param no_observations: the number of observations
+        :param no_empty_observations: the number of observations that did not contain any species
+        :param postings: the indices of the observations containing each species, required if traces are indexed
+        """
+        metrics = self.metrics[species_id]
+        if metrics.postings is not None:
+            if postings is None:
+                raise RuntimeError('Cannot index traces of aggregated species counts')
+            metrics.postings.add_block(metrics.incidence_sample_size, postings)
+        if self.include_abundance:
+            for s, c in species_abundance.items():
+                metrics.reference_sample_abundance[s] = metrics.reference_sample_abundance.get(s, 0) + c
+        if self.include_incidence:
+            for s, c in species_incidence.items():
+                metrics.reference_sample_incidence[s] = metrics.reference_sample_incidence.get(s, 0) + c
+
+        abundance_total = sum(species_abundance.values())
+        metrics.empty_traces = metrics.empty_traces + no_empty_observations
+        metrics.abundance_sample_size = metrics.abundance_sample_size + abundance_total
+        metrics.incidence_sample_size = metrics.incidence_sample_size + no_observations
+        metrics.abundance_current_total_species_count = metrics.abundance_current_total_species_count + abundance_total
+        metrics.incidence_current_total_species_count = \
+            metrics.incidence_current_total_species_count + sum(species_incidence.values())
+
+        if metrics.incidence_current_total_species_count == 0:
+            metrics.current_co_occurrence = 0
+        else:
+            metrics.current_co_occurrence = 1 - (
+                    metrics.incidence_current_total_species_count / metrics.abundance_current_total_species_count)
+
     def add_observation(self, observation: Trace, species_id: str) -> None:
         """
         adds a single observation
@@ -197,39 +1148,67 @@ class SpeciesEstimator:
         :param observation: the trace observation
         """
         # retrieve species from current observation
-        species_abundance = self.species_retrieval[species_id](observation)
-        species_incidence = set(species_abundance)
+        self.add_species(species_id, *self.retrieve_species(observation, species_id))
+
+    def retrieve_species(self, observation: Trace, species_id: str) -> (list, set | None):
+        """
+        retrieves the species of a single observation. If memoization is enabled, species definitions given as spec
+        look up the species of repeated trace variants in the cache
+        :param observation: the trace observation
+        :param species_id: the species definition
+        :return: the species of the observation with repetitions and the set of its species, if already computed
+        """
+        function = self.species_retrieval[species_id]
+        if self.species_cache is not None and isinstance(function, SpeciesSpec):
+            return self.species_cache.retrieve(function, observation)
+        return function(observation), None
+
+    def add_species(self, species_id: str, species_abundance: list, species_incidence: set | None = None,
+                    multiplicity: int = 1, count_abundance: bool = True) -> None:
+        """
+        adds the species retrieved from a single observation
+        :param species_id: the species definition for which the species shall be added
+        :param species_abundance: the species retrieved from the observation, including repetitions
+        :param species_incidence: the set of species retrieved from the observation, computed if not given
+        :param multiplicity: the number of identical observations to be added at once
+        :param count_abundance: flag indicating if abundance counts are added, False if they have already been added
+        event by event, see push_event
+        """
+        species_incidence = set(species_abundance) if species_incidence is None else species_incidence
         if len(species_abundance) == 0:
-            self.metrics[species_id].empty_traces = self.metrics[species_id].empty_traces + 1
+            self.metrics[species_id].empty_traces = self.metrics[species_id].empty_traces + multiplicity
             self.current_obs_empty = True
         else:
             self.current_obs_empty = False
 
         self.metrics[species_id].trace_retrieved_species_abundance = species_abundance
         self.metrics[species_id].trace_retrieved_species_incidence = species_incidence
+        if self.metrics[species_id].postings is not None:
+            self.metrics[species_id].postings.add(self.metrics[species_id].incidence_sample_size, species_incidence,
+                                                  multiplicity)
 
         # update species abundances/incidences
-        for s in species_abundance:
-            self.metrics[species_id].reference_sample_abundance[s] = self.metrics[
-                                                                         species_id].reference_sample_abundance.get(s,
-                                                                                                                    0) + 1
+        abundance_added = len(species_abundance) * multiplicity if count_abundance else 0
+        if self.include_abundance and count_abundance:
+            for s in species_abundance:
+                self.metrics[species_id].reference_sample_abundance[s] = \
+                    self.metrics[species_id].reference_sample_abundance.get(s, 0) + multiplicity
 
-        for s in species_incidence:
-            self.metrics[species_id].reference_sample_incidence[s] = self.metrics[
-                                                                         species_id].reference_sample_incidence.get(s,
-                                                                                                                    0) + 1
+        if self.include_incidence:
+            for s in species_incidence:
+                self.metrics[species_id].reference_sample_incidence[s] = \
+                    self.metrics[species_id].reference_sample_incidence.get(s, 0) + multiplicity
 
         # update current number of observation for each model
-        self.metrics[species_id].abundance_sample_size = self.metrics[species_id].abundance_sample_size + len(
-            species_abundance)
-        self.metrics[species_id].incidence_sample_size = self.metrics[species_id].incidence_sample_size + 1
+        self.metrics[species_id].abundance_sample_size = self.metrics[species_id].abundance_sample_size + abundance_added
+        self.metrics[species_id].incidence_sample_size = self.metrics[species_id].incidence_sample_size + multiplicity
 
         # update current sum of all observed species for each model
         self.metrics[species_id].abundance_current_total_species_count = \
-            self.metrics[species_id].abundance_current_total_species_count + len(species_abundance)
+            self.metrics[species_id].abundance_current_total_species_count + abundance_added
         self.metrics[species_id].incidence_current_total_species_count = \
             self.metrics[species_id].incidence_current_total_species_count + len(
-                species_incidence)
+                species_incidence) * multiplicity
 
         #update current degree of spatial aggregation
         if self.metrics[species_id].incidence_current_total_species_count == 0:
@@ -245,145 +1224,99 @@ class SpeciesEstimator:
         """
         #if self.current_obs_empty:
         #    return
+        self.metrics[species_id].add_checkpoint()
 
-        # update number of observations so far
-        self.metrics[species_id]["abundance_no_observations"].append(self.metrics[species_id].abundance_sample_size)
-        self.metrics[species_id]["incidence_no_observations"].append(self.metrics[species_id].incidence_sample_size)
-
-        #update number of species seen so far
-        self.metrics[species_id]["abundance_sum_species_counts"].append(
-            self.metrics[species_id].abundance_current_total_species_count)
-        self.metrics[species_id]["incidence_sum_species_counts"].append(
-            self.metrics[species_id].incidence_current_total_species_count)
-
-        #update degree of spatial aggregation
-        self.metrics[species_id]["degree_of_co_occurrence"].append(self.metrics[species_id].current_co_occurrence)
-
-        #update singleton and doubleton counts
-        self.metrics[species_id]["abundance_singletons"].append(
-            get_singletons(self.metrics[species_id].reference_sample_abundance))
-        self.metrics[species_id]["incidence_singletons"].append(
-            get_singletons(self.metrics[species_id].reference_sample_incidence))
-
-        self.metrics[species_id]["abundance_doubletons"].append(
-            get_doubletons(self.metrics[species_id].reference_sample_abundance))
-        self.metrics[species_id]["incidence_doubletons"].append(
-            get_doubletons(self.metrics[species_id].reference_sample_incidence))
-
-        #update diversity profile
-        if self.include_d0:
-            self.__update_d0(species_id)
-        if self.include_d1:
-            self.__update_d1(species_id)
-        if self.include_d2:
-            self.__update_d2(species_id)
-
-        #update completeness profile
-        if self.include_c0:
-            self.__update_c0(species_id)
-        if self.include_c1:
-            self.__update_c1(species_id)
-
-        #update estimated sampling effort for target completeness
-        for l in self.l_n:
-            self.__update_l(l, species_id)
-
-    def __update_d0(self, species_id: str) -> None:
+    def __data_types(self) -> list:
         """
-        updates D0 (=species richness) based on the current observations
+        returns the included data types, i.e. abundance and/or incidence
         """
-        #update sample metrics
-        self.metrics[species_id]["abundance_sample_d0"].append(len(self.metrics[species_id].reference_sample_abundance))
-        self.metrics[species_id]["incidence_sample_d0"].append(len(self.metrics[species_id].reference_sample_incidence))
+        return [t for t, included in [("abundance", self.include_abundance), ("incidence", self.include_incidence)]
+                if included]
 
-        #update estimated metrics
-        self.metrics[species_id]["abundance_estimate_d0"].append(
-            hill_number_asymptotic(0, self.metrics[species_id].reference_sample_abundance,
-                                   self.metrics[species_id].abundance_sample_size))
-        self.metrics[species_id]["incidence_estimate_d0"].append(
-            hill_number_asymptotic(0, self.metrics[species_id].reference_sample_incidence,
-                                   self.metrics[species_id].incidence_sample_size, abundance=False))
-
-        self.metrics[species_id]["incidence_estimate_d0_ci"].append(-1)
-
-    def __update_d1(self, species_id: str) -> None:
+    def __reference_sample(self, species_id: str, abundance: bool) -> (dict, int):
         """
-        updates D1 (=exponential of Shannon entropy) based on the current observations
+        returns the reference sample and its sample size for the given data type, which has to be included
         """
-        #update sample metrics
-        self.metrics[species_id]["abundance_sample_d1"].append(
-            entropy_exp(self.metrics[species_id].reference_sample_abundance))
-        self.metrics[species_id]["incidence_sample_d1"].append(
-            entropy_exp(self.metrics[species_id].reference_sample_incidence))
-
-        #update estimated metrics
-        self.metrics[species_id]["abundance_estimate_d1"].append(
-            hill_number_asymptotic(1, self.metrics[species_id].reference_sample_abundance,
-                                   self.metrics[species_id].abundance_sample_size))
-        self.metrics[species_id]["incidence_estimate_d1"].append(
-            hill_number_asymptotic(1, self.metrics[species_id].reference_sample_incidence,
-                                   self.metrics[species_id].incidence_sample_size, abundance=False))
-
-        self.metrics[species_id]["incidence_estimate_d1_ci"].append(-1)
-
-
-    def __update_d2(self, species_id: str) -> None:
+        if (abundance and not self.include_abundance) or (not abundance and not self.include_incidence):
+            raise RuntimeError('Data type ' + ("abundance" if abundance else "incidence") + ' is not included')
+        metrics = self.metrics[species_id]
+        return (metrics.reference_sample_abundance, metrics.abundance_sample_size) if abundance \
+            else (metrics.reference_sample_incidence, metrics.incidence_sample_size)
+
+    def traces_containing(self, species_id: str, species: list | None = None, frequencies: list | None = None,
+                          abundance: bool = False) -> np.ndarray:
         """
-        updates D2 (=Simpson Diversity Index) based on the current observations
+        looks up the traces containing any of the given species in the index, e.g. all traces containing a singleton
+        species with frequencies=[1]. Traces are identified by the number of observations added before them, i.e. by
+        their position in the applied logs. Requires traces to be indexed, see index_traces
+        :param species_id: the species definition
+        :param species: the species to look up
+        :param frequencies: if given, additionally looks up all species occurring this many times in the reference
+        sample
+        :param abundance: flag indicating if frequencies refer to the abundance-based or incidence-based reference
+        sample
+        :return: the ascending ids of the traces containing any of the species
         """
-        #update sample metrics
-        self.metrics[species_id]["abundance_sample_d2"].append(
-            simpson_diversity(self.metrics[species_id].reference_sample_abundance))
-        self.metrics[species_id]["incidence_sample_d2"].append(
-            simpson_diversity(self.metrics[species_id].reference_sample_incidence))
-
-        #update estimated metrics
-        self.metrics[species_id]["abundance_estimate_d2"].append(
-            hill_number_asymptotic(2, self.metrics[species_id].reference_sample_abundance,
-                                   self.metrics[species_id].abundance_sample_size))
-        self.metrics[species_id]["incidence_estimate_d2"].append(
-            hill_number_asymptotic(2, self.metrics[species_id].reference_sample_incidence,
-                                   self.metrics[species_id].incidence_sample_size, abundance=False))
-
-        self.metrics[species_id]["incidence_estimate_d2_ci"].append(-1)
-
-
-    def __update_c0(self, species_id: str) -> None:
+        metrics = self.metrics[species_id]
+        if metrics.postings is None:
+            raise RuntimeError('Traces of ' + species_id + ' are not indexed')
+        species = [] if species is None else list(species)
+        if frequencies is not None:
+            reference_sample = self.__reference_sample(species_id, abundance)[0]
+            species = species + [s for s, count in reference_sample.items() if count in frequencies]
+        return metrics.postings.union(species)
+
+    def raripolate(self, species_id: str, q: list = [0, 1, 2], points: int | list = 40, endpoint: int | None = None,
+                   bootstrap: int = 0, workers: int | None = None, abundance: bool = False) -> DataFrame:
         """
-        updates C0 (=completeness) based on the current observations
+        computes rarefaction/extrapolation curves of the Hill numbers for the current reference sample. If bootstrap is
+        set, confidence bands are derived from that many bootstrap replicates, evaluated by a pool of worker processes
+        :param species_id: the species definition for which the curves shall be computed
+        :param q: the orders of the Hill numbers, each of 0, 1 or 2
+        :param points: the number of evenly spaced sample sizes, or an explicit list of sample sizes
+        :param endpoint: the largest sample size if points is a number, defaults to twice the reference sample size
+        :param bootstrap: the number of bootstrap replicates used for the confidence bands, at least 2, 0 disables them
+        :param workers: the number of worker processes used for evaluating bootstrap replicates
+        :param abundance: flag indicating if abundance-based or incidence-based curves are computed
+        :returns: a data frame containing the curves and their confidence bands
         """
-        self.metrics[species_id]["abundance_c0"].append(
-            completeness(self.metrics[species_id].reference_sample_abundance))
-        self.metrics[species_id]["incidence_c0"].append(
-            completeness(self.metrics[species_id].reference_sample_incidence))
-
-        self.metrics[species_id]["incidence_c0_ci"].append(-1)
-
-    def __update_c1(self, species_id: str) -> None:
+        if bootstrap == 1:
+            raise RuntimeError('Cannot derive confidence bands from a single bootstrap replicate')
+        reference_sample, sample_size = self.__reference_sample(species_id, abundance)
+
+        locations = rarefaction_extrapolation.get_locations(sample_size, points, endpoint) if isinstance(points, int) \
+            else np.unique(np.asarray(points, dtype=np.int64))
+        values = rarefaction_extrapolation.raripolate_counts(reference_sample, sample_size, q, locations, abundance)
+        ci = rarefaction_extrapolation.raripolate_bootstrap(reference_sample, sample_size, q, locations, abundance,
+                                                            bootstrap, workers) if bootstrap > 0 \
+            else np.full(values.shape, np.nan)
+
+        methods = np.where(locations < sample_size, "rarefaction",
+                           np.where(locations == sample_size, "observed", "extrapolation"))
+        return pd.DataFrame([[species_id, order, locations[col], methods[col], values[row, col],
+                              values[row, col] - 1.96 * ci[row, col], values[row, col] + 1.96 * ci[row, col]]
+                             for row, order in enumerate(q)
+                             for col in range(len(locations))
+                             ], columns=["species", "q", "sample_size", "method", "value", "lower", "upper"])
+
+    def raripolate_coverage(self, species_id: str, coverage: list, q: list = [0, 1, 2],
+                            abundance: bool = False) -> DataFrame:
         """
-        updates C1 (=coverage) based on the current observations
+        computes the Hill numbers at the sample sizes for which the current reference sample reaches the target
+        coverages, allowing the comparison of samples of different size at equal completeness
+        :param species_id: the species definition for which the Hill numbers shall be computed
+        :param coverage: the target coverages
+        :param q: the orders of the Hill numbers, each of 0, 1 or 2
+        :param abundance: flag indicating if abundance-based or incidence-based data is used
+        :returns: a data frame containing the Hill numbers at the target coverages
         """
-        self.metrics[species_id]["abundance_c1"].append(
-            coverage(self.metrics[species_id].reference_sample_abundance,
-                     self.metrics[species_id].abundance_sample_size))
-        self.metrics[species_id]["incidence_c1"].append(
-            coverage(self.metrics[species_id].reference_sample_incidence,
-                     self.metrics[species_id].incidence_sample_size))
+        reference_sample, sample_size = self.__reference_sample(species_id, abundance)
 
-        self.metrics[species_id]["incidence_c1_ci"].append(-1)
-
-    def __update_l(self, g: float, species_id: str) -> None:
-        """
-        updates l_g (=expected number additional observations for reaching completeness g) based on the current
-        observations
-        :param g: desired  completeness
-        """
-        self.metrics[species_id]["abundance_l_" + str(g)].append(
-            sampling_effort_abundance(g, self.metrics[species_id].reference_sample_abundance,
-                                      self.metrics[species_id].abundance_sample_size))
-        self.metrics[species_id]["incidence_l_" + str(g)].append(
-            sampling_effort_incidence(g, self.metrics[species_id].reference_sample_incidence,
-                                      self.metrics[species_id].incidence_sample_size))
+        sizes, values = coverage_curves.raripolate_at_coverage(reference_sample, sample_size, q, coverage, abundance)
+        return pd.DataFrame([[species_id, order, coverage[col], sizes[col], values[row, col]]
+                             for row, order in enumerate(q)
+                             for col in range(len(coverage))
+                             ], columns=["species", "q", "coverage", "sample_size", "value"])
 
     def summarize(self, species_id: str = None) -> None:
         """
@@ -392,36 +1325,34 @@ class SpeciesEstimator:
         """
         species_ids = self.metrics.keys() if species_id is None else [species_id]
 
+        data_types = self.__data_types()
         for species_id in species_ids:
+            metrics = self.metrics[species_id]
             print("### "+species_id+" ###")
-            print("%-25s %-20s %s" % ("Sample Stats", "Abundance", "Incidence"))
-            print("%-25s %-20s %s" % ("", "---------", "---------"))
-            print("%-25s %-20s %s" % ("No Observations", str(self.metrics[species_id]["abundance_no_observations"][-1]),str(self.metrics[species_id]["incidence_no_observations"][-1])))
-            print("%-25s %-20s %s" % ("No Species", str(self.metrics[species_id]["abundance_sum_species_counts"][-1]),str(self.metrics[species_id]["incidence_sum_species_counts"][-1])))
-
-            print("%-25s %-20s %s" % ("Singletons", str(self.metrics[species_id]["abundance_singletons"][-1]),str(self.metrics[species_id]["abundance_doubletons"][-1])))
-            print("%-25s %-20s %s" % ("Doubletons", str(self.metrics[species_id]["abundance_doubletons"][-1]),str(self.metrics[species_id]["incidence_doubletons"][-1])))
-            print("%-25s %s" % ("Degree of Co-Occurrence", str(self.metrics[species_id]["degree_of_co_occurrence"][-1])))
-            print()
-            print("%-25s %-20s %-20s %s" % ("Abundance:", "Observed", "Estimate", "Stdev"))
-            print("%-25s %-20s %-20s %s" % ("", "--------", "--------", "-----"))
-            print("%-25s %-20s %-20s %s" % ("D0",str(self.metrics[species_id]["abundance_sample_d0"][-1]), str(self.metrics[species_id]["abundance_estimate_d0"][-1]),"-"))
-            print("%-25s %-20s %-20s %s" % ("D1",str(self.metrics[species_id]["abundance_sample_d1"][-1]), str(self.metrics[species_id]["abundance_estimate_d1"][-1]),"-"))
-            print("%-25s %-20s %-20s %s" % ("D2",str(self.metrics[species_id]["abundance_sample_d2"][-1]), str(self.metrics[species_id]["abundance_estimate_d2"][-1]),"-"))
-            print("%-25s %-20s %-20s %s" % ("C0","-", str(self.metrics[species_id]["abundance_c0"][-1]),"-"))
-            print("%-25s %-20s %-20s %s" % ("C1","-", str(self.metrics[species_id]["abundance_c1"][-1]),"-"))
-            for l in self.l_n:
-                print("%-25s %-20s %-20s %s" %("l_"+str(l), "-", str(self.metrics[species_id]["abundance_l_" + str(l)][-1]), "-"))
-            print()
-            print("%-25s %-20s %-20s %s" % ("Incidence:", "Observed", "Estimate", "Stdev"))
-            print("%-25s %-20s %-20s %s" % ("", "--------", "--------", "-----"))
-            print("%-25s %-20s %-20s %s" % ("D0",str(self.metrics[species_id]["incidence_sample_d0"][-1]), str(self.metrics[species_id]["incidence_estimate_d0"][-1]),str(self.metrics[species_id]["incidence_estimate_d0_ci"][-1]) if self.no_bootstrap_samples>0 else "-"))
-            print("%-25s %-20s %-20s %s" % ("D1",str(self.metrics[species_id]["incidence_sample_d1"][-1]), str(self.metrics[species_id]["incidence_estimate_d1"][-1]),str(self.metrics[species_id]["incidence_estimate_d1_ci"][-1]) if self.no_bootstrap_samples>0 else "-"))
-            print("%-25s %-20s %-20s %s" % ("D2",str(self.metrics[species_id]["incidence_sample_d2"][-1]), str(self.metrics[species_id]["incidence_estimate_d2"][-1]),str(self.metrics[species_id]["incidence_estimate_d2_ci"][-1]) if self.no_bootstrap_samples>0 else "-"))
-            print("%-25s %-20s %-20s %s" % ("C0","-", str(self.metrics[species_id]["incidence_c0"][-1]),str(self.metrics[species_id]["incidence_c0_ci"][-1]) if self.no_bootstrap_samples>0 else "-"))
-            print("%-25s %-20s %-20s %s" % ("C1","-", str(self.metrics[species_id]["incidence_c1"][-1]),str(self.metrics[species_id]["incidence_c1_ci"][-1]) if self.no_bootstrap_samples>0 else "-"))
-            for l in self.l_n:
-                print("%-25s %-20s %-20s %s" %("l_"+str(l), "-", str(self.metrics[species_id]["incidence_l_" + str(l)][-1]),"-"))
+            print("%-25s " % "Sample Stats" + " ".join("%-20s" % t.capitalize() for t in data_types))
+            print("%-25s " % "" + " ".join("%-20s" % "---------" for _ in data_types))
+            for label, key in [("No Observations", "_no_observations"), ("No Species", "_sum_species_counts"),
+                               ("Singletons", "_singletons"), ("Doubletons", "_doubletons")]:
+                print("%-25s " % label + " ".join("%-20s" % str(metrics[t + key][-1]) for t in data_types))
+            print("%-25s %s" % ("Degree of Co-Occurrence", str(metrics["degree_of_co_occurrence"][-1])))
+            for t in data_types:
+                # bootstrap confidence intervals are only available for incidence data
+                ci = t == "incidence" and self.no_bootstrap_samples > 0
+                print()
+                print("%-25s %-20s %-20s %s" % (t.capitalize() + ":", "Observed", "Estimate", "Stdev"))
+                print("%-25s %-20s %-20s %s" % ("", "--------", "--------", "-----"))
+                for d, included in enumerate([self.include_d0, self.include_d1, self.include_d2]):
+                    if included:
+                        print("%-25s %-20s %-20s %s" % ("D" + str(d), str(metrics[t + "_sample_d" + str(d)][-1]),
+                                                        str(metrics[t + "_estimate_d" + str(d)][-1]),
+                                                        str(metrics[t + "_estimate_d" + str(d) + "_ci"][-1]) if ci
+                                                        else "-"))
+                for c, included in enumerate([self.include_c0, self.include_c1]):
+                    if included:
+                        print("%-25s %-20s %-20s %s" % ("C" + str(c), "-", str(metrics[t + "_c" + str(c)][-1]),
+                                                        str(metrics[t + "_c" + str(c) + "_ci"][-1]) if ci else "-"))
+                for l in self.l_n:
+                    print("%-25s %-20s %-20s %s" % ("l_" + str(l), "-", str(metrics[t + "_l_" + str(l)][-1]), "-"))
             print("")
             print("")
 
@@ -431,76 +1362,61 @@ class SpeciesEstimator:
         """
         prints the Diversity and Completeness Profile of the current observations
         """
-        for species_id in self.species_retrieval:
+        for species_id in self.metrics:
             print("### " + species_id + " ###")
             print("### SAMPLE STATS ###")
-            print("Abundance")
-            print("%-30s %s" % ("     No Observations:", str(self.metrics[species_id]["abundance_no_observations"])))
-            print("%-30s %s" % (
-                "     Total Species Count:", str(self.metrics[species_id]["abundance_sum_species_counts"])))
-            print("%-30s %s" % ("     Singletons:", str(self.metrics[species_id]["abundance_singletons"])))
-            print("%-30s %s" % ("     Doubletons:", str(self.metrics[species_id]["abundance_doubletons"])))
-
-            print("Incidence")
-            print("%-30s %s" % ("     No Observations:", str(self.metrics[species_id]["incidence_no_observations"])))
-            print("%-30s %s" % (
-                "     Total Species Count:", str(self.metrics[species_id]["incidence_sum_species_counts"])))
-            print("%-30s %s" % ("     Singletons:", str(self.metrics[species_id]["incidence_singletons"])))
-            print("%-30s %s" % ("     Doubletons:", str(self.metrics[species_id]["incidence_doubletons"])))
+            for t in self.__data_types():
+                print(t.capitalize())
+                print("%-30s %s" % ("     No Observations:", str(self.metrics[species_id][t + "_no_observations"])))
+                print("%-30s %s" % (
+                    "     Total Species Count:", str(self.metrics[species_id][t + "_sum_species_counts"])))
+                print("%-30s %s" % ("     Singletons:", str(self.metrics[species_id][t + "_singletons"])))
+                print("%-30s %s" % ("     Doubletons:", str(self.metrics[species_id][t + "_doubletons"])))
 
             print("%-30s %s" % ("     Empty Traces:", str(self.metrics[species_id].empty_traces)))
-            print("%-30s %s" % ("Degree of Co-Occurrence:", str(self.metrics[species_id]["degree_of_aggregation"])))
+            print("%-30s %s" % ("Degree of Co-Occurrence:", str(self.metrics[species_id]["degree_of_co_occurrence"])))
             print()
             print("### DIVERSITY AND COMPLETENESS PROFILE ###")
-            print("Abundance")
-            if self.include_d0:
-                print("%-30s %s" % ("     D0 - sample:", (self.metrics[species_id]["abundance_sample_d0"])))
-                print("%-30s %s" % ("     D0 - estimate:", str(self.metrics[species_id]["abundance_estimate_d0"])))
-            if self.include_d1:
-                print("%-30s %s" % ("     D1 - sample:", str(self.metrics[species_id]["abundance_sample_d1"])))
-                print("%-30s %s" % ("     D1 - estimate:", str(self.metrics[species_id]["abundance_estimate_d1"])))
-            if self.include_d2:
-                print("%-30s %s" % ("     D2 - sample:", str(self.metrics[species_id]["abundance_sample_d2"])))
-                print("%-30s %s" % ("     D2 - estimate:", str(self.metrics[species_id]["abundance_estimate_d2"])))
-            if self.include_c0:
-                print("%-30s %s" % ("     C0:", str(self.metrics[species_id]["abundance_c0"])))
-            if self.include_c1:
-                print("%-30s %s" % ("     C1:", str(self.metrics[species_id]["abundance_c1"])))
-            for l in self.l_n:
-                print("%-30s %s" % ("     l_" + str(l) + ":", str(self.metrics[species_id]["abundance_l_" + str(l)])))
-            print("Incidence")
-            if self.include_d0:
-                print("%-30s %s" % ("     D0 - sample:", (self.metrics[species_id]["incidence_sample_d0"])))
-                print("%-30s %s" % ("     D0 - estimate:", str(self.metrics[species_id]["incidence_estimate_d0"])))
-                print("%-30s %s" % ("     D0 - CI:", str(self.metrics[species_id]["incidence_estimate_d0_ci"])))
-
-            if self.include_d1:
-                print("%-30s %s" % ("     D1 - sample:", str(self.metrics[species_id]["incidence_sample_d1"])))
-                print("%-30s %s" % ("     D1 - estimate:", str(self.metrics[species_id]["incidence_estimate_d1"])))
-                print("%-30s %s" % ("     D1 - CI:", str(self.metrics[species_id]["incidence_estimate_d1_ci"])))
-
-            if self.include_d2:
-                print("%-30s %s" % ("     D2 - sample:", str(self.metrics[species_id]["incidence_sample_d2"])))
-                print("%-30s %s" % ("     D2 - estimate:", str(self.metrics[species_id]["incidence_estimate_d2"])))
-                print("%-30s %s" % ("     D2 - CI:", str(self.metrics[species_id]["incidence_estimate_d2_ci"])))
-
-            if self.include_c0:
-                print("%-30s %s" % ("     C0:", str(self.metrics[species_id]["incidence_c0"])))
-                print("%-30s %s" % ("     C0 - CI:", str(self.metrics[species_id]["incidence_c0_ci"])))
-
-            if self.include_c1:
-                print("%-30s %s" % ("     C1:", str(self.metrics[species_id]["incidence_c1"])))
-                print("%-30s %s" % ("     C1 - CI:", str(self.metrics[species_id]["incidence_c1_ci"])))
-
-            for l in self.l_n:
-                print("%-30s %s" % ("     l_" + str(l) + ":", str(self.metrics[species_id]["incidence_l_" + str(l)])))
+            for t in self.__data_types():
+                # bootstrap confidence intervals are only kept for incidence data
+                ci = t == "incidence"
+                print(t.capitalize())
+                for d, included in enumerate([self.include_d0, self.include_d1, self.include_d2]):
+                    if included:
+                        print("%-30s %s" % ("     D" + str(d) + " - sample:",
+                                            str(self.metrics[species_id][t + "_sample_d" + str(d)])))
+                        print("%-30s %s" % ("     D" + str(d) + " - estimate:",
+                                            str(self.metrics[species_id][t + "_estimate_d" + str(d)])))
+                        if ci:
+                            print("%-30s %s" % ("     D" + str(d) + " - CI:",
+                                                str(self.metrics[species_id][t + "_estimate_d" + str(d) + "_ci"])))
+                for c, included in enumerate([self.include_c0, self.include_c1]):
+                    if included:
+                        print("%-30s %s" % ("     C" + str(c) + ":", str(self.metrics[species_id][t + "_c" + str(c)])))
+                        if ci:
+                            print("%-30s %s" % ("     C" + str(c) + " - CI:",
+                                                str(self.metrics[species_id][t + "_c" + str(c) + "_ci"])))
+                for l in self.l_n:
+                    print("%-30s %s" % ("     l_" + str(l) + ":", str(self.metrics[species_id][t + "_l_" + str(l)])))
             print()
 
-    def to_dataFrame(self, include_all=True) -> DataFrame:
+    def to_dataFrame(self, include_all=True, strata: bool = False) -> DataFrame:
         """
         returns the diversity and completeness profile of the current observations as a data frame
+        :param strata: flag indicating if the profiles of all strata are included, see apply, in which case the
+        stratum of each row is given in an additional column, and an additional boolean column pooled marks the rows
+        of the pooled profiles, whose stratum is None. Traces lacking the attribute grouped by form the stratum None
+        as well, but with pooled False
         :returns: a data frame view of the Diversity and Completeness Profile
         """
+        if strata:
+            frames = []
+            for pooled, key, estimator in [(True, None, self)] + [(False, k, e) for k, e in self.strata.items()]:
+                frame = estimator.to_dataFrame(include_all)
+                frame.insert(0, "stratum", [key] * len(frame))
+                frame.insert(0, "pooled", pooled)
+                frames.append(frame)
+            return pd.concat(frames, ignore_index=True)
         return pd.DataFrame([[i, j, ix, v]
                              for i in self.metrics.keys()
                              for j in self.metrics[i].keys()
@@ -510,3 +1426,12 @@ class SpeciesEstimator:
                                                                 for i in self.metrics.keys()
                                                                 for j in self.metrics[i].keys()
                                                                 ], columns=["species", "metric", "value"])
+
+
+def _permutation_profile(args) -> DataFrame:
+    # profiles the species matrices in a random order of traces, shared by all species definitions
+    estimator, matrices, seed = args
+    permutation = np.random.default_rng(seed).permutation(len(next(iter(matrices.values()))))
+    estimator.apply_matrices({species_id: matrix.select(permutation) for species_id, matrix in matrices.items()},
+                             verbose=False)
+    return estimator.to_dataFrame()
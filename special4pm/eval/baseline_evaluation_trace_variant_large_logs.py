@@ -11,13 +11,14 @@ from special4pm.estimation import SpeciesEstimator
 from special4pm.simulation.simulation import simulate_model
 from functools import partial
 from tqdm import tqdm
-from special4pm.species import retrieve_species_n_gram
+from special4pm.species import retrieve_species_n_gram, HashedTraceVariant
 
 
 def init_estimator(step_size):
     estimator = SpeciesEstimator(step_size=step_size)
     estimator.register("3-gram", partial(retrieve_species_n_gram, n=3))
-    estimator.register("tv", species_retrieval.retrieve_species_trace_variant)
+    # variants of the large simulated logs are kept as 64-bit hashes instead of full labels
+    estimator.register("tv", HashedTraceVariant())
     return estimator
 
 
@@ -1,12 +1,13 @@
 import copy
 from functools import partial
+import numpy as np
 import pm4py
-from pm4py.objects.log.obj import EventLog
 from special4pm.visualization.visualization import plot_diversity_profile, plot_completeness_profile, \
     plot_expected_sampling_effort
 
 from build.src.special4pm.species import species_retrieval
 from special4pm.estimation import SpeciesEstimator
+from special4pm.raripolation.coverage import compare_at_coverage
 from special4pm.species import retrieve_species_n_gram
 from special4pm.visualization import plot_rank_abundance
 
@@ -26,8 +27,11 @@ def profile_log(log, name):
     step_size = int(len(log) / 200)
     estimator = init_estimator(step_size=step_size)
     estimator.apply(log, verbose=True)
-    estimator.add_bootstrap_ci(200)
+    return report(estimator, name)
+
 
+def report(estimator, name):
+    estimator.add_bootstrap_ci(200)
 
     estimator.to_dataFrame().to_csv("out/" + name + ".csv", index=False)
     estimator.to_dataFrame(include_all=False).to_csv("out/" + name + "_final_only.csv", index=False)
@@ -38,6 +42,7 @@ def profile_log(log, name):
         plot_completeness_profile(estimator, species, abundance=False,
                                   save_to="fig/" + name + "_completeness_profile.pdf")
         plot_expected_sampling_effort(estimator, species, abundance=False, save_to="fig/" + name + "_effort.pdf")
+    return estimator
 
 
 log = pm4py.read_xes("../../logs/Sepsis_Cases_-_Event_Log.xes", return_legacy_log_object=True)
@@ -45,16 +50,12 @@ log = pm4py.read_xes("../../logs/Sepsis_Cases_-_Event_Log.xes", return_legacy_lo
 log_pre_admission = copy.deepcopy(log)
 log_post_admission = copy.deepcopy(log)
 
-log_young = EventLog(attributes=log.attributes, extensions=log.extensions, omni_present=log.omni_present,
-                     classifiers=log.classifiers, properties=log.properties)
-log_old = EventLog(attributes=log.attributes, extensions=log.extensions, omni_present=log.omni_present,
-                   classifiers=log.classifiers, properties=log.properties)
+# species of the full log are retrieved once, filtered sub-logs are then profiled from the cached species matrices
+full_estimator = init_estimator(step_size=None)
+full_estimator.build_matrices(log, verbose=True)
+old = np.array([trace[0]['Age'] >= 60 for trace in log])
 
 for t in range(0, len(log)):
-    if log[t][0]['Age'] >= 60:
-        log_old.append(log[t])
-    else:
-        log_young.append(log[t])
     for idx, e in enumerate(log[t]):
         if "Admission" in e["concept:name"]:
             if len(log_pre_admission[t][:idx + 1]) > 0:
@@ -64,7 +65,14 @@ for t in range(0, len(log)):
                 log_post_admission[t] = log_post_admission[t][idx + 1:]
             break
 
-profile_log(log_pre_admission, "log_vs_log_eval_sepsis_cases_pre_admission")
-profile_log(log_post_admission, "log_vs_log_eval_sepsis_cases_post_admission")
-profile_log(log_young, "log_vs_log_eval_sepsis_cases_age_less_60")
-profile_log(log_old, "log_vs_log_eval_sepsis_cases_age_geq_60")
+estimators = {
+    "pre_admission": profile_log(log_pre_admission, "log_vs_log_eval_sepsis_cases_pre_admission"),
+    "post_admission": profile_log(log_post_admission, "log_vs_log_eval_sepsis_cases_post_admission"),
+    "age_less_60": report(full_estimator.profile_subset(~old, checkpoints=int(np.count_nonzero(~old) / 200)),
+                          "log_vs_log_eval_sepsis_cases_age_less_60"),
+    "age_geq_60": report(full_estimator.profile_subset(old, checkpoints=int(np.count_nonzero(old) / 200)),
+                         "log_vs_log_eval_sepsis_cases_age_geq_60")
+}
+
+# sub-logs differ strongly in size, thus diversity is additionally compared at equal sample coverage
+compare_at_coverage(estimators).to_csv("out/log_vs_log_eval_sepsis_cases_equal_coverage.csv", index=False)
@@ -8,6 +8,7 @@ import pm4py
 from matplotlib import pyplot as plt
 
 from special4pm.estimation import SpeciesEstimator
+from special4pm.estimation.beta_diversity import compare_logs
 from special4pm.simulation.simulation import simulate_model
 from special4pm.visualization.visualization import plot_diversity_profile, plot_expected_sampling_effort, \
     plot_completeness_profile, plot_rank_abundance
@@ -52,6 +53,7 @@ def profile_model(model, i, f, log, name):
                                       save_to="fig/" + name + "_" + species + "_effort.pdf")
 
     df = model_est.to_dataFrame(include_all=False).to_csv("out/" + name + ".csv", index=False)
+    compare_logs({"log": estimator, "model": model_est}).to_csv("out/" + name + "_similarity.csv", index=False)
     return
 
     #print("Simulating initial Sample of 80% Size")
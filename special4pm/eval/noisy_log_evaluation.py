@@ -12,7 +12,7 @@ import random
 from special4pm.simulation.simulation import simulate_model
 from special4pm.visualization import visualization
 
-from special4pm.estimation.species_estimator import SpeciesEstimator
+from special4pm.estimation import SpeciesEstimator, MultiLogEstimator
 from tqdm import tqdm
 
 from special4pm.species import retrieve_species_n_gram, species_retrieval
@@ -230,19 +230,11 @@ def evaluate_model(logs, name, true_values):
         plt.close()
 
 def compare_rank_abundances(base, small, medium, large, name):
-    l = [base, small, medium, large]
-    e_b = SpeciesEstimator(step_size=None)
-    e_b.register("2-gram", partial(retrieve_species_n_gram, n=2))
-    e_b.apply(base)
-    e_s = SpeciesEstimator(step_size=None)
-    e_s.register("2-gram", partial(retrieve_species_n_gram, n=2))
-    e_s.apply(small)
-    e_m = SpeciesEstimator(step_size=None)
-    e_m.register("2-gram", partial(retrieve_species_n_gram, n=2))
-    e_m.apply(medium)
-    e_l = SpeciesEstimator(step_size=None)
-    e_l.register("2-gram", partial(retrieve_species_n_gram, n=2))
-    e_l.apply(large)
+    estimator = MultiLogEstimator()
+    estimator.register("2-gram", partial(retrieve_species_n_gram, n=2))
+    for i, log in enumerate([base, small, medium, large]):
+        estimator.add_log(i, log)
+    counts = estimator.count_matrix("2-gram", abundance=True)
     labels = ("Original","0.01% Noise","0.1% Noise","1% Noise")
 
     plt.rcParams['figure.figsize'] = [6 * 4, 3.5]
@@ -250,11 +242,9 @@ def compare_rank_abundances(base, small, medium, large, name):
     plt.rcParams['ytick.labelsize'] = 20
 
     f, (ax1, ax2, ax3, ax4) = plt.subplots(nrows=1, ncols=4, sharey="row", layout="constrained")
-    for x,e,l in zip([ax1, ax2, ax3, ax4],(e_b.metrics["2-gram"].reference_sample_abundance, e_s.metrics["2-gram"].reference_sample_abundance, e_m.metrics["2-gram"].reference_sample_abundance, e_l.metrics["2-gram"].reference_sample_abundance),labels):
-        reference_sample = e
-        species_count = sum(reference_sample.values())
-        reference_values_sorted = sorted(list(reference_sample.values()), reverse=True)
-        no_species = len(reference_sample)
+    for i, (x, l) in enumerate(zip([ax1, ax2, ax3, ax4], labels)):
+        reference_values_sorted = sorted(counts[i].data.tolist(), reverse=True)
+        no_species = len(reference_values_sorted)
 
         x.fill_between(np.linspace(0, no_species, no_species, endpoint=False),
                          reference_values_sorted,
@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+# the module is imported instead of its functions, as importing it first imports this module circularly
+from special4pm.raripolation import rarefaction_extrapolation
+
+
+def _observed_coverage_factor(f_1: int, f_2: int, sample_size: int) -> float:
+    # the term (n-1)f_1 / ((n-1)f_1 + 2f_2), by which the observed singleton ratio is damped
+    if f_2 > 0:
+        return ((sample_size - 1) * f_1) / ((sample_size - 1) * f_1 + 2 * f_2)
+    if f_1 > 1:
+        return ((sample_size - 1) * (f_1 - 1)) / ((sample_size - 1) * (f_1 - 1) + 2)
+    return 0.0
+
+
+def raripolate_coverage_counts(reference_sample: dict, sample_size: int, locations: np.ndarray) -> np.ndarray:
+    """
+    computes the expected sample coverage of the reference sample at the given sample sizes. Locations below the
+    reference sample size are rarefied, locations above are extrapolated. Abundance and incidence data share the
+    same formulas
+    :param reference_sample: the species with corresponding abundance or incidence counts
+    :param sample_size: the sample size associated with the species counts
+    :param locations: the sample sizes at which coverage is evaluated
+    :return: the expected sample coverage at each location
+    """
+    k, f_k = rarefaction_extrapolation.get_frequency_counts(reference_sample)
+    locations = np.asarray(locations, dtype=np.float64)
+    u = np.sum(k * f_k)
+    if u == 0 or sample_size <= 1:
+        return np.zeros(len(locations))
+
+    f_1 = int(f_k[k == 1].sum())
+    f_2 = int(f_k[k == 2].sum())
+    factor = _observed_coverage_factor(f_1, f_2, sample_size)
+
+    values = np.empty(len(locations))
+    rarefied = locations < sample_size
+    t = locations[rarefied][None, :]
+    k_col, f_col = k[:, None].astype(np.float64), f_k[:, None]
+    # C(n-k, t) / C(n-1, t) per distinct count k and location t, zero if the subsample cannot miss the species
+    valid = sample_size - k_col >= t
+    log_comb = rarefaction_extrapolation._log_comb
+    log_ratio = np.where(valid, log_comb(np.maximum(sample_size - k_col, t), t) - log_comb(sample_size - 1, t), 0)
+    missed = np.where(valid, np.exp(log_ratio), 0)
+    values[rarefied] = 1 - np.sum(f_col * (k_col / u) * missed, axis=0)
+
+    m = locations[~rarefied] - sample_size
+    values[~rarefied] = 1 - f_1 / u * factor ** (m + 1)
+    return values
+
+
+def sample_size_for_coverage(reference_sample: dict, sample_size: int, coverage: list) -> np.ndarray:
+    """
+    computes the smallest sample sizes at which the reference sample reaches the target coverages. Rarefied sample
+    sizes are found by a bisection run for all targets at once, extrapolated sample sizes are solved in closed form
+    :param reference_sample: the species with corresponding abundance or incidence counts
+    :param sample_size: the sample size associated with the species counts
+    :param coverage: the target coverages
+    :return: the sample sizes reaching the target coverages, NaN for targets that cannot be reached
+    """
+    targets = np.asarray(coverage, dtype=np.float64)
+    sizes = np.full(len(targets), np.nan)
+    if sample_size <= 1:
+        return sizes
+
+    observed = raripolate_coverage_counts(reference_sample, sample_size, np.array([sample_size]))[0]
+    rarefied = targets <= observed
+
+    lo = np.ones(np.count_nonzero(rarefied))
+    hi = np.full(len(lo), sample_size, dtype=np.float64)
+    goal = targets[rarefied]
+    while np.any(lo < hi):
+        mid = np.floor((lo + hi) / 2)
+        reached = raripolate_coverage_counts(reference_sample, sample_size, mid) >= goal
+        hi = np.where(reached, mid, hi)
+        lo = np.where(reached, lo, mid + 1)
+    sizes[rarefied] = lo
+
+    k, f_k = rarefaction_extrapolation.get_frequency_counts(reference_sample)
+    u = np.sum(k * f_k)
+    f_1 = int(f_k[k == 1].sum())
+    f_2 = int(f_k[k == 2].sum())
+    factor = _observed_coverage_factor(f_1, f_2, sample_size)
+    extrapolated = ~rarefied & (targets < 1)
+    if f_1 > 0 and 0 < factor < 1:
+        # solve 1 - f_1/U * factor^(m+1) = C for m
+        m = np.log((1 - targets[extrapolated]) * u / f_1) / np.log(factor) - 1
+        sizes[extrapolated] = sample_size + np.ceil(np.maximum(m, 0))
+    return sizes
+
+
+def raripolate_at_coverage(reference_sample: dict, sample_size: int, q: list, coverage: list,
+                           abundance: bool = True) -> (np.ndarray, np.ndarray):
+    """
+    computes the Hill numbers of the given orders at the sample sizes reaching the target coverages
+    :param reference_sample: the species with corresponding abundance or incidence counts
+    :param sample_size: the sample size associated with the species counts
+    :param q: the orders of the Hill numbers, each of 0, 1 or 2
+    :param coverage: the target coverages
+    :param abundance: flag indicating the data type
+    :return: the sample sizes reaching the target coverages and an array of shape (len(q), len(coverage))
+    containing the Hill numbers at these sample sizes
+    """
+    sizes = sample_size_for_coverage(reference_sample, sample_size, coverage)
+    values = np.full((len(q), len(sizes)), np.nan)
+    reachable = ~np.isnan(sizes)
+    if np.any(reachable):
+        values[:, reachable] = rarefaction_extrapolation.raripolate_counts(reference_sample, sample_size, q,
+                                                                           sizes[reachable].astype(np.int64),
+                                                                           abundance)
+    return sizes, values
+
+
+def compare_at_coverage(estimators: dict, coverage: list | None = None, q: list = [0, 1, 2],
+                        abundance: bool = False) -> DataFrame:
+    """
+    compares the diversity of several logs at equal sample coverage. If no coverage is given, each species
+    definition is compared at the lowest coverage any of the logs reaches at twice its sample size
+    :param estimators: the species estimators of the logs, keyed by log name
+    :param coverage: the target coverages
+    :param q: the orders of the Hill numbers, each of 0, 1 or 2
+    :param abundance: flag indicating if abundance-based or incidence-based data is compared
+    :returns: a data frame containing the Hill numbers of each log and species definition at the target coverages
+    """
+    def reference(estimator, species_id):
+        metrics = estimator.metrics[species_id]
+        return (metrics.reference_sample_abundance, metrics.abundance_sample_size) if abundance \
+            else (metrics.reference_sample_incidence, metrics.incidence_sample_size)
+
+    species_ids = list(dict.fromkeys(s for estimator in estimators.values() for s in estimator.metrics.keys()))
+    rows = []
+    for species_id in species_ids:
+        samples = {name: reference(estimator, species_id) for name, estimator in estimators.items()
+                   if species_id in estimator.metrics}
+        targets = coverage if coverage is not None else \
+            [min(raripolate_coverage_counts(sample, size, np.array([2 * size]))[0] for sample, size in samples.values())]
+        for name, (sample, size) in samples.items():
+            sizes, values = raripolate_at_coverage(sample, size, q, targets, abundance)
+            rows.extend([[name, species_id, order, targets[col], sizes[col], values[row, col]]
+                         for row, order in enumerate(q)
+                         for col in range(len(targets))])
+    return pd.DataFrame(rows, columns=["log", "species", "q", "coverage", "sample_size", "value"])
@@ -1,194 +1,157 @@
 import math
-import statistics
-import time
-
-
-from src.bootstrap.bootstrap import generate_bootstrap_sequence_abundance, generate_bootstrap_sequence_incidence
-from src.raripolation.extrapolation import extrapolate_richness_abundance, extrapolate_shannon_entropy_abundance, \
-    extrapolate_simpson_diversity_abundance, extrapolate_richness_incidence, extrapolate_shannon_entropy_incidence, \
-    extrapolate_simpson_diversity_incidence
-from src.estimation.metrics import get_number_observed_species, entropy_exp, simpson_diversity, estimate_species_richness_chao, estimate_shannon_entropy_abundance, \
-    estimate_shannon_entropy_incidence
-from rarefaction import rarefy_richness_abundance, rarefy_shannon_entropy_abundance, rarefy_simpson_diversity_abundance, \
-    rarefy_richness_incidence, rarefy_shannon_entropy_incidence, rarefy_simpson_diversity_incidence
-
-
-def rarefy_extrapolate_q0(est, abundance=True, data_points=30):
-    start = time.time()
-    if abundance:
-        print("Richness Abundance(" + str(est.observed_species_count[-1])+", "+ str(est.chao2_abundance[-1]) + ")")
-
-        r, loc_r = rarefy_richness_abundance(est.reference_sample_abundance, est.number_observations_abundance,
-                                             est.observed_species_count[-1], data_points)
-        e, loc_e = extrapolate_richness_abundance(est.reference_sample_abundance, est.number_observations_abundance,
-                                                  est.chao2_abundance[-1], data_points)
-        print("Eplapsed Time: "+str(time.time() - start))
-        return r.append + [est.observed_species_count[-1]] + e, loc_r + [est.number_observations_abundance] + loc_e
-    else:
-        print("Richness Incidence(" + str(est.observed_species_count[-1])+", "+ str(est.chao2_incidence[-1]) + ")")
-
-        r, loc_r = rarefy_richness_incidence(est.reference_sample_incidence, est.number_observations_incidence,
-                                             est.observed_species_count[-1], data_points)
-        e, loc_e = extrapolate_richness_incidence(est.reference_sample_incidence, est.number_observations_incidence,
-                                                  est.chao2_abundance[-1], data_points)
-        print("Eplapsed Time: "+str(time.time() - start))
-        return r + [est.observed_species_count[-1]] + e, loc_r + [est.number_observations_incidence] + loc_e
-
-
-def rarefy_extrapolate_q1(est, abundance=True, data_points=30):
-    start = time.time()
-    if abundance:
-        print("Shannon Abundance(" + str(est.D1_sample_abundance[-1])+", "+ str(est.D1_estimated_abundance[-1]) + ")")
-
-        r, loc_r = rarefy_shannon_entropy_abundance(est.reference_sample_abundance, est.number_observations_abundance,
-                                                    est.D1_sample_abundance[-1], data_points)
-        e, loc_e = extrapolate_shannon_entropy_abundance(est.reference_sample_abundance,
-                                                         est.number_observations_abundance,
-                                                         est.D1_estimated_abundance[-1], data_points)
-        print("Eplapsed Time: "+str(time.time() - start))
-        return r + [est.D1_sample_abundance[-1]] + e, loc_r + [est.number_observations_abundance] + loc_e
-    else:
-        print("Shannon Incidence(" + str(est.D1_sample_incidence[-1])+", "+ str(est.D1_estimated_incidence[-1]) + ")")
-
-        r, loc_r = rarefy_shannon_entropy_incidence(est.reference_sample_incidence, est.number_observations_incidence,
-                                                    est.D1_sample_incidence[-1], data_points)
-        e, loc_e = extrapolate_shannon_entropy_incidence(est.reference_sample_incidence,
-                                                         est.number_observations_incidence,
-                                                         est.D1_estimated_incidence[-1], data_points)
-        print("Eplapsed Time: "+str(time.time() - start))
-        return r + [est.D1_sample_incidence[-1]] + e, loc_r + [est.number_observations_incidence] + loc_e
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.special import gammaln
+
+from special4pm.estimation import metrics
+from special4pm.estimation.metrics import estimate_species_richness_chao, hill_number_asymptotic
+
+
+def get_locations(sample_size: int, points: int = 40, endpoint: int | None = None) -> np.ndarray:
+    """
+    returns evenly spaced sample sizes at which rarefaction/extrapolation curves are evaluated. The reference sample
+    size is always included
+    :param sample_size: the size of the reference sample
+    :param points: the number of evenly spaced sample sizes
+    :param endpoint: the largest sample size, defaults to twice the reference sample size
+    :return: the sorted sample sizes
+    """
+    endpoint = 2 * sample_size if endpoint is None else endpoint
+    locations = np.linspace(1, endpoint, points).round().astype(np.int64)
+    return np.unique(np.append(locations, sample_size))
+
+
+def get_frequency_counts(reference_sample: dict) -> (np.ndarray, np.ndarray):
+    """
+    returns the frequency counts of a reference sample, i.e. the distinct species counts k and the number of species
+    f_k having exactly count k
+    :param reference_sample: the species with corresponding abundance or incidence counts
+    :return: the distinct species counts and their frequencies
+    """
+    frequencies = sorted((k, f) for k, f in metrics.get_frequency_counts(reference_sample).items() if k > 0)
+    return np.array([k for k, _ in frequencies], dtype=np.int64), np.array([f for _, f in frequencies], dtype=np.int64)
+
+
+def _log_comb(n, k):
+    return gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
+
+
+def _rarefy_q0(k, f_k, sample_size, t):
+    # expected number of species missed by subsamples of sizes t, i.e. C(n-k, t)/C(n, t) per species and size
+    t = t[:, None]
+    valid = sample_size - k >= t
+    absent = np.exp(_log_comb(np.where(valid, sample_size - k, t), t) - _log_comb(sample_size, t), where=valid,
+                    out=np.zeros(valid.shape))
+    return np.sum(f_k) - absent @ f_k
+
+
+def _rarefy_q1(k, f_k, sample_size, u, t):
+    # expected frequency counts f_j(t) for j=1,...,t from hypergeometric subsampling, evaluated for all
+    # distinct counts and subsample sizes at once
+    location = np.repeat(np.arange(len(t)), len(k))
+    rep_t = t[location]
+    rep_k = np.tile(k, len(t))
+    no_j = np.minimum(rep_k, rep_t)
+    location = np.repeat(location, no_j)
+    rep_t = np.repeat(rep_t, no_j)
+    rep_f = np.repeat(np.tile(f_k, len(t)), no_j)
+    rep_k = np.repeat(rep_k, no_j)
+    j = np.arange(len(rep_k)) - np.repeat(np.cumsum(no_j) - no_j, no_j) + 1
+    valid = sample_size - rep_k >= rep_t - j
+    location, rep_t, rep_f, rep_k, j = location[valid], rep_t[valid], rep_f[valid], rep_k[valid], j[valid]
+    log_p = _log_comb(rep_k, j) + _log_comb(sample_size - rep_k, rep_t - j) - _log_comb(sample_size, rep_t)
+    p_j = j / (rep_t * u / sample_size)
+    return np.exp(-np.bincount(location, weights=rep_f * np.exp(log_p) * p_j * np.log(p_j), minlength=len(t)))
+
+
+def _raripolate_q2(k, f_k, sample_size, u, t):
+    # closed form of sum_j (j/U_t)^2 f_j(t), valid for rarefaction and extrapolation alike
+    u_t = t * u / sample_size
+    squares = t * (t - 1) / (sample_size * (sample_size - 1)) * np.sum(f_k * k * (k - 1)) + t * u / sample_size
+    return u_t ** 2 / squares
+
+
+def raripolate_counts(reference_sample: dict, sample_size: int, q: list, locations: np.ndarray,
+                      abundance: bool = True) -> np.ndarray:
+    """
+    computes the rarefaction/extrapolation curves of the Hill numbers of the given orders for the reference sample.
+    Locations below the reference sample size are rarefied, locations above are extrapolated
+    :param reference_sample: the species with corresponding abundance or incidence counts
+    :param sample_size: the sample size associated with the species counts
+    :param q: the orders of the Hill numbers, each of 0, 1 or 2
+    :param locations: the sample sizes at which the curves are evaluated
+    :param abundance: flag indicating the data type. Setting this 'True' indicates abundance-based data,
+    setting this 'False' indicates incidence-based data
+    :return: an array of shape (len(q), len(locations)) containing the curves
+    """
+    k, f_k = get_frequency_counts(reference_sample)
+    u = int(np.sum(k * f_k))
+    values = np.zeros((len(q), len(locations)))
+    if u == 0 or sample_size == 0:
+        return values
+
+    s_obs = int(np.sum(f_k))
+    f_1 = int(f_k[k == 1].sum())
+    p = k / u
+    h_obs = -np.sum(f_k * p * np.log(p))
+
+    t = np.asarray(locations, dtype=np.int64)
+    rarefied = t < sample_size
+    extrapolated = ~rarefied
+    for row, order in enumerate(q):
+        if order == 0:
+            f_0 = estimate_species_richness_chao(reference_sample) - s_obs
+            m = t[extrapolated] - sample_size
+            values[row, extrapolated] = s_obs if f_0 == 0 else \
+                s_obs + f_0 * (1 - (1 - f_1 / (sample_size * f_0 + f_1)) ** m)
+            values[row, rarefied] = _rarefy_q0(k, f_k, sample_size, t[rarefied])
+        elif order == 1:
+            d1_asymptotic = hill_number_asymptotic(1, reference_sample, sample_size, abundance)
+            d1_log = math.log(d1_asymptotic) if d1_asymptotic > 0 else h_obs
+            m = t[extrapolated]
+            values[row, extrapolated] = np.exp(sample_size / m * h_obs + (m - sample_size) / m * d1_log)
+            values[row, rarefied] = _rarefy_q1(k, f_k, sample_size, u, t[rarefied])
+        elif order == 2:
+            values[row] = _raripolate_q2(k, f_k, sample_size, u, t) if sample_size > 1 else s_obs
+        else:
+            raise RuntimeError('Cannot raripolate Hill number of order ' + str(order))
+    return values
 
 
-def rarefy_extrapolate_q2(est, abundance=True, data_points=30):
-    start = time.time()
+def _raripolate_bootstrap_sample(args):
+    bootstrap_sample, sample_size, q, locations, abundance = args
     if abundance:
-        print("Simpson Abundance(" + str(est.D2_sample_abundance[-1])+", "+ str(est.D2_estimated_abundance[-1]) + ")")
-
-        r, loc_r = rarefy_simpson_diversity_abundance(est.reference_sample_abundance, est.number_observations_abundance,
-                                                      est.D2_sample_abundance[-1], data_points)
-        e, loc_e = extrapolate_simpson_diversity_abundance(est.reference_sample_abundance,
-                                                           est.number_observations_abundance,
-                                                           data_points)
-        print("Eplapsed Time: "+str(time.time() - start))
-        return r + [est.D2_sample_abundance[-1]] + e, loc_r + [est.number_observations_abundance] + loc_e
-    else:
-        print("Simpson Incidence(" + str(est.D2_sample_incidence[-1])+", "+ str(est.D2_estimated_incidence[-1]) + ")")
-        r, loc_r = rarefy_simpson_diversity_incidence(est.reference_sample_incidence, est.number_observations_incidence,
-                                                      est.D2_sample_incidence[-1], data_points)
-        e, loc_e = extrapolate_simpson_diversity_incidence(est.reference_sample_incidence,
-                                                           est.number_observations_incidence,
-                                                           data_points)
-        print("Eplapsed Time: "+str(time.time() - start))
-        return r + [est.D2_sample_incidence[-1]] + e, loc_r + [est.number_observations_incidence] + loc_e
-
-
-def rarefy_extrapolate_all(est, abundance_data=True, data_points=30):
-    if abundance_data:
-        q0_a, q0_a_loc = rarefy_extrapolate_q0(est, abundance=True, data_points=data_points)
-        q1_a, q1_a_loc = rarefy_extrapolate_q1(est, abundance=True, data_points=data_points)
-        q2_a, q2_a_loc = rarefy_extrapolate_q2(est, abundance=True, data_points=data_points)
-        return (q0_a, q0_a_loc), (q1_a, q1_a_loc), (q2_a, q2_a_loc)
+        sample_size = sum(bootstrap_sample.values())
+    return raripolate_counts(bootstrap_sample, sample_size, q, locations, abundance)
+
+
+def raripolate_bootstrap(reference_sample: dict, sample_size: int, q: list, locations: np.ndarray,
+                         abundance: bool = True, no_bootstrap_samples: int = 200,
+                         workers: int | None = None) -> np.ndarray:
+    """
+    computes the standard deviation of the rarefaction/extrapolation curves over bootstrap samples of the reference
+    sample. Bootstrap replicates are evaluated in a process pool if more than one worker is requested
+    :param reference_sample: the species with corresponding abundance or incidence counts
+    :param sample_size: the sample size associated with the species counts
+    :param q: the orders of the Hill numbers, each of 0, 1 or 2
+    :param locations: the sample sizes at which the curves are evaluated
+    :param abundance: flag indicating the data type
+    :param no_bootstrap_samples: the number of bootstrap replicates
+    :param workers: the number of worker processes, evaluates replicates serially if None or 1
+    :return: an array of shape (len(q), len(locations)) containing the bootstrap standard deviations
+    """
+    # imported here, as the bootstrap module imports the estimation package, which imports this module
+    from special4pm.bootstrap.bootstrap import generate_bootstrap_samples_abundance, \
+        generate_bootstrap_samples_incidence
+    samples = generate_bootstrap_samples_abundance(reference_sample, no_bootstrap_samples) if abundance \
+        else generate_bootstrap_samples_incidence(reference_sample, sample_size, no_bootstrap_samples)
+    tasks = [(sample, sample_size, q, locations, abundance) for sample in samples]
+
+    if workers is None or workers <= 1:
+        curves = [_raripolate_bootstrap_sample(task) for task in tasks]
     else:
-        q0_i, q0_i_loc = rarefy_extrapolate_q0(est, abundance=False, data_points=data_points)
-        q1_i, q1_i_loc = rarefy_extrapolate_q1(est, abundance=False, data_points=data_points)
-        q2_i, q2_i_loc = rarefy_extrapolate_q2(est, abundance=False, data_points=data_points)
-        return (q0_i, q0_i_loc), (q1_i, q1_i_loc), (q2_i, q2_i_loc)
-
-
-
-def rarefy_extrapolate_bootstrap_all(s, abundance_data=True, data_points=30, bootstrap_repetitions = 200):
-    q0_all=[]
-    q1_all=[]
-    q2_all=[]
-
-    q_loc=None
-    print("Creatign Bootstrap Samples")
-    for i in range(0, bootstrap_repetitions):
-        #function results for all samples
-        q0 = [0]
-        q1 = [0]
-        q2 = [0]
-
-        seq_a = None
-        loc_a = None
-        #subsampling of bootstrap samples
-        if abundance_data:
-            seq_a, loc_a = generate_bootstrap_sequence_abundance(s.reference_sample_abundance,
-                                                                 s.number_observations_abundance, math.floor(
-                    s.number_observations_abundance / data_points))
-        else:
-            #print("OBSERVATIONS: "+str(s.number_observations_incidence))
-            seq_a, loc_a = generate_bootstrap_sequence_incidence(s.reference_sample_incidence,
-                                                                 s.number_observations_incidence, math.floor(
-                    s.number_observations_incidence / data_points))
-
-
-        for seq in seq_a:
-            q0.append(get_number_observed_species(seq))
-            q1.append(entropy_exp(seq,sum(seq.values())))
-            q2.append(simpson_diversity(seq,sum(seq.values())))
-
-        #extrapolation
-        ref_sample = seq_a[-1]
-        q0_e = None
-        q1_e = None
-        q2_e = None
-        loc_e = None
-
-        if abundance_data:
-            q0_e, loc_e = extrapolate_richness_abundance(ref_sample, s.number_observations_abundance, estimate_species_richness_chao(ref_sample), data_points=data_points)
-            q1_e, _ = extrapolate_shannon_entropy_abundance(ref_sample, s.number_observations_abundance,
-                                                            math.exp(estimate_shannon_entropy_abundance(ref_sample, s.number_observations_abundance)), data_points= data_points)
-            q2_e, _ = extrapolate_simpson_diversity_abundance(ref_sample, s.number_observations_abundance,data_points= data_points)
-        else:
-            q0_e, loc_e = extrapolate_richness_incidence(ref_sample, s.number_observations_incidence, estimate_species_richness_chao(ref_sample),
-                                                         data_points=data_points)
-            q1_e, _ = extrapolate_shannon_entropy_incidence(ref_sample, s.number_observations_incidence,
-                                                            math.exp(estimate_shannon_entropy_incidence(ref_sample,
-                                                                                                        s.number_observations_incidence)),
-                                                            data_points=data_points)
-            q2_e, _ = extrapolate_simpson_diversity_incidence(ref_sample, s.number_observations_incidence,
-                                                              data_points=data_points)
-
-        #connect subsampled and extrapolated function curves
-        q0 = q0 + q0_e
-        q1 = q1 + q1_e
-        q2 = q2 + q2_e
-        q_loc = loc_a + loc_e
-
-        #add bootstrap function values to list of all results
-        for x in range(0,len(q_loc)):
-            if len(q0_all)<=x:
-                q0_all.append([])
-                q1_all.append([])
-                q2_all.append([])
-            q0_all[x].append(q0[x])
-            q1_all[x].append(q1[x])
-            q2_all[x].append(q2[x])
-
-    #aggregate bootstrap results
-    q0_mean = []
-    q0_ciu = []
-    q0_cil = []
-
-    q1_mean = []
-    q1_ciu = []
-    q1_cil = []
-
-    q2_mean = []
-    q2_ciu = []
-    q2_cil = []
-    for x in range(0,len(q0_all)):
-        q0_mean.append(statistics.mean(q0_all[x]))
-        q0_ciu.append(q0_mean[x]+1.96*statistics.stdev(q0_all[x]))
-        q0_cil.append(q0_mean[x]-1.96*statistics.stdev(q0_all[x]))
-
-        q1_mean.append(statistics.mean(q1_all[x]))
-        q1_ciu.append(q1_mean[x]+1.96*statistics.stdev(q1_all[x]))
-        q1_cil.append(q1_mean[x]-1.96*statistics.stdev(q1_all[x]))
-
-        q2_mean.append(statistics.mean(q2_all[x]))
-        q2_ciu.append(q2_mean[x]+1.96*statistics.stdev(q2_all[x]))
-        q2_cil.append(q2_mean[x]-1.96*statistics.stdev(q2_all[x]))
-
-    return(q0_mean,q1_mean,q2_mean),(q0_cil,q1_cil,q2_cil),(q0_ciu,q1_ciu,q2_ciu), q_loc
\ No newline at end of file
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            curves = list(executor.map(_raripolate_bootstrap_sample, tasks,
+                                       chunksize=max(1, len(tasks) // (4 * workers))))
+    return np.std(np.stack(curves), axis=0, ddof=1)
@@ -1 +1,2 @@
-from special4pm.species.species_retrieval import *
\ No newline at end of file
+from special4pm.species.species_retrieval import *
+from special4pm.species.specs import *
\ No newline at end of file
@@ -0,0 +1,159 @@
+import atexit
+import sqlite3
+from hashlib import blake2b
+
+import numpy as np
+
+
+def hash_activities(labels) -> np.ndarray:
+    """
+    hashes activity labels into 64-bit codes that do not depend on the encoding of a log, see hash_sequence
+    :param labels: the activity labels, e.g. the vocabulary of an encoded log
+    :return: the hash of each label
+    """
+    return np.fromiter((int.from_bytes(blake2b(str(label).encode("utf-8"), digest_size=8).digest(), "big")
+                        for label in labels), dtype=np.uint64, count=len(labels))
+
+
+def hash_sequence(activity_hashes: np.ndarray, bits: int = 64) -> int:
+    """
+    hashes a trace variant given as sequence of hashed activities into a compact integer species key, without
+    building its label. Equal activity sequences yield equal keys in every log
+    :param activity_hashes: the hashes of the activities of the variant, see hash_activities
+    :param bits: the size of the hash, 64 or 128 bits
+    :return: the hash as unsigned integer
+    """
+    if bits not in (64, 128):
+        raise RuntimeError('Cannot hash trace variants to ' + str(bits) + ' bits')
+    return int.from_bytes(blake2b(np.ascontiguousarray(activity_hashes, dtype=np.uint64).tobytes(),
+                                  digest_size=bits // 8).digest(), "big")
+
+
+class VariantTable:
+    """
+    An on-disk side table mapping hashed trace variants back to their full labels. Every recorded variant is checked
+    against the variant previously stored under the same hash, such that hash collisions are detected. Variants may
+    be staged in memory and written in batches. The table has to be closed to write all staged variants, e.g. by
+    using it as context manager
+    """
+
+    def __init__(self, path: str, batch_size: int = 10000) -> None:
+        """
+        :param path: the path of the sqlite database holding the table, created if it does not exist
+        :param batch_size: the number of staged variants written at once
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.staged = {}
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS variants (hash BLOB PRIMARY KEY, variant TEXT NOT NULL)")
+
+    def __enter__(self) -> "VariantTable":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def stage(self, variants: dict) -> None:
+        """
+        stages hashed trace variants, writing them once batch_size variants are staged. Collisions among staged
+        variants raise a RuntimeError immediately, collisions with stored variants once they are written
+        :param variants: the variant labels, keyed by their hash
+        """
+        for h, variant in variants.items():
+            if self.staged.setdefault(h, variant) != variant:
+                raise RuntimeError('Hash collision between trace variants ' + repr(self.staged[h]) + ' and ' +
+                                   repr(variant))
+        if len(self.staged) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        writes all staged variants
+        """
+        staged = self.staged
+        self.staged = {}
+        if len(staged) > 0:
+            self.record(staged)
+
+    def close(self) -> None:
+        """
+        writes all staged variants and closes the connection
+        """
+        if self.connection is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self.connection.close()
+            self.connection = None
+
+    def record(self, variants: dict) -> None:
+        """
+        stores hashed trace variants, raising a RuntimeError if a hash is already taken by another variant
+        :param variants: the variant labels, keyed by their hash
+        """
+        rows = [(self.__key(h), v) for h, v in variants.items()]
+        with self.connection:
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS batch (hash BLOB, variant TEXT)")
+            self.connection.execute("DELETE FROM batch")
+            self.connection.executemany("INSERT INTO batch VALUES (?, ?)", rows)
+            collision = self.connection.execute(
+                "SELECT b.variant, v.variant FROM batch b JOIN variants v ON b.hash = v.hash "
+                "WHERE b.variant != v.variant LIMIT 1").fetchone()
+            if collision is not None:
+                raise RuntimeError('Hash collision between trace variants ' + repr(collision[0]) + ' and ' +
+                                   repr(collision[1]))
+            self.connection.execute("INSERT OR IGNORE INTO variants SELECT hash, variant FROM batch")
+
+    def lookup(self, hashes: list) -> dict:
+        """
+        resolves hashed trace variants to their labels
+        :param hashes: the hashes
+        :return: the labels of all recorded hashes, keyed by hash
+        """
+        self.flush()
+        labels = {}
+        for h in hashes:
+            row = self.connection.execute("SELECT variant FROM variants WHERE hash = ?", (self.__key(h),)).fetchone()
+            if row is not None:
+                labels[h] = row[0]
+        return labels
+
+    def __len__(self) -> int:
+        self.flush()
+        return self.connection.execute("SELECT COUNT(*) FROM variants").fetchone()[0]
+
+    @staticmethod
+    def __key(h: int) -> bytes:
+        # sqlite integers are limited to signed 64 bits, hashes are stored as big-endian blobs instead
+        return h.to_bytes(16, "big")
+
+
+_open_tables = {}
+
+
+def open_variant_table(path: str) -> VariantTable:
+    """
+    opens the side table at the given path, reusing an already opened table until it is closed by
+    close_variant_table
+    :param path: the path of the sqlite database
+    :return: the side table
+    """
+    if path not in _open_tables:
+        _open_tables[path] = VariantTable(path)
+    return _open_tables[path]
+
+
+def close_variant_table(path: str | None = None) -> None:
+    """
+    writes all staged variants of a side table opened by open_variant_table and closes it
+    :param path: the path of the sqlite database, all open tables if None
+    """
+    for p in list(_open_tables.keys()) if path is None else [path]:
+        if p in _open_tables:
+            _open_tables.pop(p).close()
+
+
+# staged variants of tables that were never closed are written at exit
+atexit.register(close_variant_table)
@@ -0,0 +1,200 @@
+import os
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class LabelArray:
+    """
+    String labels stored as one concatenated UTF-8 byte array and the offset of each label in it. Unlike fixed-width
+    numpy strings, labels are not padded to the longest one, e.g. long trace variants, and can still be memory-mapped
+    """
+
+    def __init__(self, offsets: np.ndarray, data: np.ndarray) -> None:
+        """
+        :param offsets: the start of each label in data, followed by the length of data
+        :param data: the UTF-8 bytes of all labels
+        """
+        self.offsets = offsets
+        self.data = data
+
+    @classmethod
+    def from_labels(cls, labels: list) -> "LabelArray":
+        encoded = [str(s).encode("utf-8") for s in labels]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __label(self, i: int) -> str:
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return self.__label(range(len(self))[item])
+        return np.array([self.__label(i) for i in np.arange(len(self))[item]], dtype=object)
+
+    def tolist(self) -> list:
+        return [self.__label(i) for i in range(len(self))]
+
+
+def _label_array(labels: list) -> np.ndarray | LabelArray:
+    # labels are stored such that they can be memory-mapped, i.e. as 64-bit integers if possible, e.g. for hashed
+    # trace variants, and as UTF-8 bytes otherwise
+    if len(labels) > 0 and all(isinstance(s, (int, np.integer)) for s in labels):
+        if all(-2 ** 63 <= s < 2 ** 63 for s in labels):
+            return np.array(labels, dtype=np.int64)
+        if all(0 <= s < 2 ** 64 for s in labels):
+            return np.array(labels, dtype=np.uint64)
+    return LabelArray.from_labels(labels)
+
+
+class SpeciesMatrix:
+    """
+    A sparse trace x species matrix in CSR format, holding the number of occurrences of each species in each trace in
+    the order of the log. Incidence data is given by the non-zero entries. The arrays can be saved as .npy files and
+    loaded memory-mapped, such that profiles of subsets or resamples of traces can be computed from column sums without
+    retrieving species from the log again. String labels are saved as species.npy holding their UTF-8 bytes and
+    species_offsets.npy, see LabelArray
+    """
+
+    FILES = ["indptr", "indices", "abundance", "species"]
+
+    def __init__(self, indptr: np.ndarray, indices: np.ndarray, abundance: np.ndarray,
+                 species: np.ndarray | LabelArray) -> None:
+        """
+        :param indptr: the start of each trace in indices and abundance, followed by the number of non-zero entries
+        :param indices: the species index of each non-zero entry, trace after trace
+        :param abundance: the number of occurrences of each non-zero entry
+        :param species: the label of each species index
+        """
+        self.indptr = indptr
+        self.indices = indices
+        self.abundance = abundance
+        self.species = species
+
+    @classmethod
+    def from_species_lists(cls, species_lists) -> "SpeciesMatrix":
+        """
+        builds the matrix from the species retrieved from each trace
+        :param species_lists: iterable of the species of each trace, including repetitions
+        :return: the matrix, with species indexed in order of first occurrence
+        """
+        codes = {}
+        indptr = [0]
+        indices = []
+        abundance = []
+        for species_abundance in species_lists:
+            counts = {}
+            for s in species_abundance:
+                counts[s] = counts.get(s, 0) + 1
+            indices.extend(codes.setdefault(s, len(codes)) for s in counts.keys())
+            abundance.extend(counts.values())
+            indptr.append(len(indices))
+        return cls(np.asarray(indptr, dtype=np.int64), np.asarray(indices, dtype=np.int64),
+                   np.asarray(abundance, dtype=np.int64), _label_array(list(codes.keys())))
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: str | None = "r") -> "SpeciesMatrix":
+        """
+        loads a matrix saved by save
+        :param directory: the directory holding the .npy files of the matrix
+        :param mmap_mode: the memory-map mode passed to np.load, None loads the arrays into memory
+        :return: the matrix
+        """
+        arrays = [np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode) for name in cls.FILES]
+        offsets = os.path.join(directory, "species_offsets.npy")
+        if os.path.exists(offsets):
+            arrays[-1] = LabelArray(np.load(offsets, mmap_mode=mmap_mode), arrays[-1])
+        return cls(*arrays)
+
+    def save(self, directory: str) -> None:
+        """
+        saves the arrays of the matrix as one .npy file each
+        :param directory: the directory, created if it does not exist
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in self.FILES[:-1]:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+        offsets = os.path.join(directory, "species_offsets.npy")
+        if isinstance(self.species, LabelArray):
+            np.save(os.path.join(directory, "species.npy"), self.species.data)
+            np.save(offsets, self.species.offsets)
+        else:
+            np.save(os.path.join(directory, "species.npy"), self.species)
+            if os.path.exists(offsets):
+                os.remove(offsets)
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def abundance_matrix(self) -> csr_matrix:
+        """
+        :return: the trace x species matrix of species occurrences, sharing the arrays of this matrix
+        """
+        return csr_matrix((self.abundance, self.indices, self.indptr), shape=(len(self), len(self.species)),
+                          copy=False)
+
+    def incidence_matrix(self) -> csr_matrix:
+        """
+        :return: the binary trace x species matrix of species incidences
+        """
+        return csr_matrix((np.ones(len(self.indices), dtype=np.int64), self.indices, self.indptr),
+                          shape=(len(self), len(self.species)), copy=False)
+
+    def select(self, rows) -> "SpeciesMatrix":
+        """
+        selects a subset of traces
+        :param rows: a boolean mask over all traces or the indices of the selected traces
+        :return: the matrix of the selected traces, sharing the species labels
+        """
+        rows = np.asarray(rows)
+        rows = np.flatnonzero(rows) if rows.dtype == bool else rows.astype(np.int64)
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        positions = np.repeat(self.indptr[rows] - indptr[:-1], lengths) + np.arange(indptr[-1])
+        return SpeciesMatrix(indptr, np.asarray(self.indices[positions]), np.asarray(self.abundance[positions]),
+                             self.species)
+
+    def no_traces(self, start: int = 0, stop: int | None = None) -> int:
+        """
+        returns the number of observations a range of traces stands for, i.e. the number of traces
+        :param start: the index of the first trace
+        :param stop: the index after the last trace, defaults to the end of the matrix
+        :return: the number of observations
+        """
+        return len(range(len(self))[start:stop])
+
+    def postings(self, start: int = 0, stop: int | None = None) -> dict:
+        """
+        retrieves the traces containing each species for a range of traces, i.e. the columns of the range
+        :param start: the index of the first trace
+        :param stop: the index after the last trace, defaults to the end of the matrix
+        :return: the ascending indices of the traces within the range containing each species, keyed by species
+        """
+        stop = len(self) if stop is None else stop
+        columns = self.select(np.arange(start, stop)).incidence_matrix().tocsc()
+        observed = np.flatnonzero(np.diff(columns.indptr))
+        return {label: columns.indices[columns.indptr[j]:columns.indptr[j + 1]].astype(np.int64)
+                for label, j in zip(self.species[observed].tolist(), observed)}
+
+    def counts(self, start: int = 0, stop: int | None = None) -> (dict, dict, int):
+        """
+        retrieves the species counts of a range of traces by column sums
+        :param start: the index of the first trace
+        :param stop: the index after the last trace, defaults to the end of the matrix
+        :return: the abundance counts, the incidence counts and the number of traces without any species
+        """
+        stop = len(self) if stop is None else stop
+        indices = self.indices[self.indptr[start]:self.indptr[stop]]
+        abundance = np.bincount(indices, weights=self.abundance[self.indptr[start]:self.indptr[stop]],
+                                minlength=len(self.species))
+        incidence = np.bincount(indices, minlength=len(self.species))
+        observed = np.flatnonzero(incidence)
+        labels = self.species[observed].tolist()
+        empty = int(np.count_nonzero(np.diff(self.indptr[start:stop + 1]) == 0))
+        return dict(zip(labels, abundance[observed].astype(np.int64).tolist())), \
+            dict(zip(labels, incidence[observed].tolist())), empty
@@ -1,6 +1,9 @@
 import math
+from collections import deque
 from datetime import datetime, timedelta
 
+import numpy as np
+import pandas as pd
 import pm4py
 
 def retrieve_species_n_gram(trace, n):
@@ -21,34 +24,88 @@ def retrieve_species_n_gram(trace, n):
     return [",".join(events[x:x + n]) for x in range(0, len(events) - n+1)]
 
 
+def retrieve_species_attribute_n_gram(trace, n, key):
+    """
+    retrieves the n-grams over an arbitrary event attribute, e.g. the sequence of resources handling a case
+    :param trace: the trace
+    :param n: the n-gram length
+    :param key: the event attribute forming the n-grams
+    :return: the n-gram species of the trace
+    """
+    events = [str(x[key]) for x in trace]
+    return [",".join(events[x:x + n]) for x in range(0, len(events) - n + 1)]
+
+
+def retrieve_species_n_gram_family(trace, ns):
+    """
+    retrieves the n-grams of several lengths from a single pass over the trace. Each n-gram is built by extending the
+    (n-1)-gram at the same position, so shorter n-grams are never joined twice
+    :param trace: the trace
+    :param ns: the n-gram lengths
+    :return: a list of n-gram species per length, in the order of ns
+    """
+    events = [x['concept:name'] for x in trace]
+    grams = {}
+    current = list(events)
+    for n in range(1, max(ns, default=0) + 1):
+        if n > 1:
+            current = [current[x] + "," + events[x + n - 1] for x in range(0, len(events) - n + 1)]
+        grams[n] = current
+    return [grams[n] for n in ns]
+
+
+def retrieve_species_prefix_family(trace, lengths):
+    """
+    retrieves the prefixes of several lengths from a single pass over the trace. Traces shorter than a prefix length
+    do not contain a species for that length
+    :param trace: the trace
+    :param lengths: the prefix lengths
+    :return: a list of prefix species per length, in the order of lengths
+    """
+    prefixes = []
+    for x in trace:
+        prefixes.append(x['concept:name'] if len(prefixes) == 0 else prefixes[-1] + "," + x['concept:name'])
+    return [[prefixes[n - 1]] if len(prefixes) >= n else [] for n in lengths]
+
+
 def retrieve_species_trace_variant(trace):
     return [",".join([x["concept:name"] for x in trace])]
 
 
+def _match_lifecycle_durations(trace):
+    """
+    matches each complete event of a trace to the earliest open start event of the same activity, using one FIFO of
+    open starts per activity
+    :param trace: the trace
+    :return: for each complete event its activity and duration in hours, or None if the complete event is the
+    unmatched first event of the trace
+    """
+    open_starts = {}
+    durations = []
+    for ide, e in enumerate(trace):
+        if "start" in e["lifecycle:transition"].lower():
+            open_starts.setdefault(e["concept:name"], deque()).append(e["time:timestamp"])
+        elif "complete" in e["lifecycle:transition"].lower():
+            starts = open_starts.get(e["concept:name"])
+            if starts:
+                time = e["time:timestamp"] - starts.popleft()
+            elif ide == 0:
+                durations.append((e["concept:name"], None))
+                continue
+            else:
+                time = e["time:timestamp"] - trace[ide - 1]["time:timestamp"]
+            durations.append((e["concept:name"], time.total_seconds() / 60 / 60))
+    return durations
+
+
 def retrieve_timed_activity(trace, interval_size):
     l=[]
     if "lifecycle:transition" in trace[0]:
-        open_set = []
-        for ide,e in enumerate(trace):
-            if "start" in e["lifecycle:transition"].lower():
-                open_set.append(e)
-            elif "complete" in e["lifecycle:transition"].lower():
-                found = False
-                for idx, x in enumerate(open_set):
-                    if x["concept:name"] == e["concept:name"]:
-                        time = trace[ide]["time:timestamp"] - trace[idx]["time:timestamp"]
-                        t = interval_size * math.ceil((time.total_seconds() / 60 / 60) / interval_size)
-                        l.append(e["concept:name"] + "_" + str(t))
-                        open_set.pop(idx)
-                        found = True
-                        break
-                if not found:
-                    if ide == 0:
-                        l.append(e["concept:name"]+"_"+str(interval_size))
-                    else:
-                        time = trace[ide]["time:timestamp"] - trace[ide-1]["time:timestamp"]
-                        t = interval_size * math.ceil((time.total_seconds() / 60 / 60) / interval_size)
-                        l.append(e["concept:name"] + "_" + str(t))
+        for activity, t in _match_lifecycle_durations(trace):
+            if t is None:
+                l.append(activity + "_" + str(interval_size))
+            else:
+                l.append(activity + "_" + str(interval_size * math.ceil(t / interval_size)))
     else:
         if len(trace) == 1:
             return [trace[0]["concept:name"] + "_0"]
@@ -68,33 +125,11 @@ def retrieve_timed_activity_exponential(trace):
     if len(trace) == 1:
         return [trace[0]["concept:name"] + "_2"]
     if "lifecycle:transition" in trace[0]:
-        open_set = []
-        for ide,e in enumerate(trace):
-            if "start" in e["lifecycle:transition"].lower():
-                open_set.append(e)
-            elif "complete" in e["lifecycle:transition"].lower():
-                found = False
-                for idx, x in enumerate(open_set):
-                    if x["concept:name"] == e["concept:name"]:
-                        time = trace[ide]["time:timestamp"] - trace[idx]["time:timestamp"]
-                        t = time.total_seconds() / 60 / 60
-                        if t < 1:
-                            l.append(e["concept:name"] + "_2")
-                        else:
-                            l.append(e["concept:name"] + "_" + str(2 * math.ceil(math.log(t, 2))))
-                        open_set.pop(idx)
-                        found = True
-                        break
-                if not found:
-                    if ide == 0:
-                        l.append(e["concept:name"]+"_2")
-                    else:
-                        time = trace[ide]["time:timestamp"] - trace[ide-1]["time:timestamp"]
-                        t = time.total_seconds() / 60 / 60
-                        if t < 1:
-                            l.append(e["concept:name"] + "_2")
-                        else:
-                            l.append(e["concept:name"] + "_" + str(2 * math.ceil(math.log(t, 2))))
+        for activity, t in _match_lifecycle_durations(trace):
+            if t is None or t < 1:
+                l.append(activity + "_2")
+            else:
+                l.append(activity + "_" + str(2 * math.ceil(math.log(t, 2))))
     else:
         t = sorted(trace, key=lambda d: d['time:timestamp'])
         for idx, e in enumerate(t):
@@ -110,6 +145,102 @@ def retrieve_timed_activity_exponential(trace):
     return l
 
 
+def _timed_activity_durations(df, case_id, key, timestamp, lifecycle):
+    """
+    computes the activity durations of all traces of a data frame at once. Start and complete events are matched per
+    case and activity in FIFO order: a complete event is matched iff the count of open starts, a running sum of
+    starts and completes reflected at zero, is positive. The j-th matched complete event then consumes the j-th start
+    :return: a data frame holding case code, activity, duration in hours and flags for each event, with flag 'species'
+    marking the events that yield a species, and the case ids in order of first occurrence
+    """
+    cases, case_ids = pd.factorize(df[case_id])
+    activities, labels = pd.factorize(df[key])
+    events = pd.DataFrame({"case": cases, "activity": np.asarray(labels.astype(str), dtype=object)[activities],
+                           "time": pd.to_datetime(df[timestamp]).to_numpy()})
+    by_case = events.groupby("case", sort=False)
+    events["first"] = by_case.cumcount() == 0
+    events["length"] = by_case["case"].transform("size")
+    events["hours"] = (events["time"] - by_case["time"].shift(1)).dt.total_seconds() / 60 / 60
+    events["unmatched_first"] = False
+    events["species"] = True
+    if lifecycle not in df.columns:
+        return events, case_ids
+
+    # as for single traces, the lifecycle branch is chosen if the first event of a trace has a lifecycle attribute
+    lifecycle_first = np.zeros(len(case_ids), dtype=bool)
+    lifecycle_first[cases[events["first"].to_numpy()]] = df[lifecycle].notna().to_numpy()[events["first"].to_numpy()]
+    has_lifecycle = pd.Series(lifecycle_first[cases])
+    transition = df[lifecycle].astype(str).str.lower().reset_index(drop=True)
+    is_start = transition.str.contains("start", regex=False) & has_lifecycle
+    is_complete = transition.str.contains("complete", regex=False) & has_lifecycle & ~is_start
+
+    groups = pd.Series(cases.astype(np.int64) * len(labels) + activities)
+    step = is_start.astype(np.int64) - is_complete.astype(np.int64)
+    walk = step.groupby(groups, sort=False).cumsum()
+    open_after = walk - np.minimum(walk.groupby(groups, sort=False).cummin(), 0)
+    open_before = open_after.groupby(groups, sort=False).shift(1, fill_value=0)
+    matched = is_complete & (open_before > 0)
+
+    rank = np.full(len(events), -1, dtype=np.int64)
+    rank[is_start.to_numpy()] = groups[is_start].groupby(groups[is_start], sort=False).cumcount().to_numpy()
+    rank[matched.to_numpy()] = groups[matched].groupby(groups[matched], sort=False).cumcount().to_numpy()
+    starts = pd.DataFrame({"group": groups[is_start], "rank": rank[is_start.to_numpy()],
+                           "start": events.loc[is_start, "time"]})
+    matched_starts = pd.DataFrame({"group": groups[matched], "rank": rank[matched.to_numpy()]}).merge(
+        starts, on=["group", "rank"], how="left")["start"].to_numpy()
+    events.loc[matched, "hours"] = (events.loc[matched, "time"].to_numpy() - matched_starts) / np.timedelta64(1, "h")
+    events["unmatched_first"] = is_complete & ~matched & events["first"]
+    events["species"] = is_complete | ~has_lifecycle
+    return events, case_ids
+
+
+def _collect_species(events, case_ids, labels):
+    # species stay in trace order, traces are split off by their case code
+    cases = events["case"].to_numpy()
+    species = (events["activity"].to_numpy() + "_" + labels)[np.argsort(cases, kind="stable")]
+    offsets = np.zeros(len(case_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(cases, minlength=len(case_ids)), out=offsets[1:])
+    return pd.Series([species[offsets[i]:offsets[i + 1]].tolist() for i in range(len(case_ids))], index=case_ids)
+
+
+def retrieve_timed_activity_dataframe(df, interval_size, case_id="case:concept:name", key="concept:name",
+                                      timestamp="time:timestamp", lifecycle="lifecycle:transition"):
+    """
+    retrieves the timed activity species of all traces of an event log data frame at once, equivalent to applying
+    retrieve_timed_activity to each trace. Events are expected to be ordered by timestamp within each case
+    :param df: the event log as data frame
+    :param interval_size: the size of the duration buckets in hours
+    :return: the species lists of all cases, indexed by case id in order of first occurrence
+    """
+    events, case_ids = _timed_activity_durations(df, case_id, key, timestamp, lifecycle)
+    buckets = pd.Series(interval_size * np.ceil(events["hours"].to_numpy() / interval_size)).fillna(0)
+    labels = buckets.astype(np.int64).astype(str) if isinstance(interval_size, int) else buckets.astype(str)
+    labels[events["unmatched_first"]] = str(interval_size)
+    labels[events["first"] & ~events["unmatched_first"]] = "0"
+    events = events[events["species"]]
+    return _collect_species(events, case_ids, labels[events.index].to_numpy().astype(object))
+
+
+def retrieve_timed_activity_exponential_dataframe(df, case_id="case:concept:name", key="concept:name",
+                                                  timestamp="time:timestamp", lifecycle="lifecycle:transition"):
+    """
+    retrieves the exponentially bucketed timed activity species of all traces of an event log data frame at once,
+    equivalent to applying retrieve_timed_activity_exponential to each trace. Events are expected to be ordered by
+    timestamp within each case
+    :param df: the event log as data frame
+    :return: the species lists of all cases, indexed by case id in order of first occurrence
+    """
+    events, case_ids = _timed_activity_durations(df, case_id, key, timestamp, lifecycle)
+    hours = events["hours"].to_numpy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        buckets = np.where(hours < 1, 2, 2 * np.ceil(np.log(np.maximum(hours, 1)) / math.log(2)))
+    labels = pd.Series(buckets).fillna(2).astype(np.int64).astype(str)
+    labels[events["first"] & ~events["unmatched_first"]] = "0"
+    labels[events["unmatched_first"] | (events["length"] == 1)] = "2"
+    events = events[events["species"] | (events["length"] == 1)]
+    return _collect_species(events, case_ids, labels[events.index].to_numpy().astype(object))
+
+
 #log = pm4py.read_xes("logs/Sepsis_Cases_-_Event_Log.xes", return_legacy_log_object=True)
 #for x in log:
 #    retrieve_timed_activity_exponential(x)
\ No newline at end of file
@@ -0,0 +1,312 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from special4pm.species.species_retrieval import retrieve_species_n_gram, retrieve_species_n_gram_family, \
+    retrieve_species_attribute_n_gram, retrieve_species_trace_variant, retrieve_timed_activity, \
+    retrieve_timed_activity_exponential, retrieve_timed_activity_dataframe, \
+    retrieve_timed_activity_exponential_dataframe
+from special4pm.species.hashing import hash_activities, hash_sequence, open_variant_table, close_variant_table
+from special4pm.species.vectorized import EncodedLog
+
+
+@dataclass(frozen=True)
+class SpeciesSpec(ABC):
+    """
+    Base class of declarative species definitions. Specs are hashable and picklable, so they can serve as cache keys
+    and be shipped to worker processes. Calling a spec retrieves the species of a single trace, subclasses may
+    additionally provide faster backends for whole logs
+    """
+
+    @abstractmethod
+    def __call__(self, trace) -> list:
+        """
+        retrieves the species of a single trace
+        :param trace: the trace
+        :return: the species of the trace, including repetitions
+        """
+
+    def trace_key(self, trace):
+        """
+        returns a hashable key determining the species of a trace, i.e. traces with equal keys yield equal species.
+        Specs returning None are not memoized
+        :param trace: the trace
+        :return: the key, or None
+        """
+        return None
+
+
+@dataclass(frozen=True)
+class EncodedSpeciesSpec(SpeciesSpec):
+    """
+    Base class of species definitions whose species counts can be retrieved in bulk from an integer-encoded log
+    """
+
+    @property
+    def key(self) -> str:
+        """
+        the event attribute the log has to be encoded by
+        """
+        return "concept:name"
+
+    def trace_key(self, trace):
+        return tuple(e[self.key] for e in trace)
+
+    @abstractmethod
+    def encoded_counts(self, encoded: EncodedLog, start: int, stop: int) -> (dict, dict, int):
+        """
+        retrieves the species counts of a range of traces of an encoded log
+        :param encoded: the log, encoded by attribute key
+        :param start: the index of the first trace
+        :param stop: the index after the last trace
+        :return: the abundance counts, the incidence counts and the number of traces without any species
+        """
+
+    @abstractmethod
+    def encoded_postings(self, encoded: EncodedLog, start: int, stop: int) -> dict:
+        """
+        retrieves the traces containing each species for a range of traces of an encoded log
+        :param encoded: the log, encoded by attribute key
+        :param start: the index of the first trace
+        :param stop: the index after the last trace
+        :return: the ascending indices of the traces within the range containing each species, keyed by species
+        """
+
+
+@dataclass(frozen=True)
+class DataFrameSpeciesSpec(SpeciesSpec):
+    """
+    Base class of species definitions whose species can be retrieved for all traces of a data frame at once
+    """
+
+    @abstractmethod
+    def retrieve_dataframe(self, df: pd.DataFrame) -> pd.Series:
+        """
+        retrieves the species of all cases of an event log data frame
+        :param df: the event log as data frame
+        :return: the species lists of all cases, indexed by case id in order of first occurrence
+        """
+
+
+@dataclass(frozen=True)
+class NGram(EncodedSpeciesSpec):
+    """
+    the activity n-grams of a trace, see retrieve_species_n_gram
+    """
+    n: int
+
+    def __call__(self, trace) -> list:
+        return retrieve_species_n_gram(trace, self.n)
+
+    def encoded_counts(self, encoded: EncodedLog, start: int, stop: int) -> (dict, dict, int):
+        return encoded.n_gram_counts(self.n, start, stop)
+
+    def encoded_postings(self, encoded: EncodedLog, start: int, stop: int) -> dict:
+        return encoded.n_gram_postings(self.n, start, stop)
+
+
+@dataclass(frozen=True)
+class AttributeNGram(EncodedSpeciesSpec):
+    """
+    the n-grams over an arbitrary event attribute, see retrieve_species_attribute_n_gram
+    """
+    attr: str
+    n: int
+
+    @property
+    def key(self) -> str:
+        return self.attr
+
+    def __call__(self, trace) -> list:
+        return retrieve_species_attribute_n_gram(trace, self.n, self.attr)
+
+    def encoded_counts(self, encoded: EncodedLog, start: int, stop: int) -> (dict, dict, int):
+        return encoded.n_gram_counts(self.n, start, stop)
+
+    def encoded_postings(self, encoded: EncodedLog, start: int, stop: int) -> dict:
+        return encoded.n_gram_postings(self.n, start, stop)
+
+
+@dataclass(frozen=True)
+class TraceVariant(EncodedSpeciesSpec):
+    """
+    the trace variant, i.e. the full activity sequence, see retrieve_species_trace_variant
+    """
+
+    def __call__(self, trace) -> list:
+        return retrieve_species_trace_variant(trace)
+
+    def encoded_counts(self, encoded: EncodedLog, start: int, stop: int) -> (dict, dict, int):
+        return encoded.variant_counts(start, stop)
+
+    def encoded_postings(self, encoded: EncodedLog, start: int, stop: int) -> dict:
+        return encoded.variant_postings(start, stop)
+
+
+@dataclass(frozen=True)
+class HashedTraceVariant(EncodedSpeciesSpec):
+    """
+    the trace variant, keyed by a 64 or 128 bit hash of its activity sequence instead of its label, see hash_sequence.
+    Labels are optionally kept in an on-disk side table at path side_table, which detects hash collisions. Labels are
+    written in batches, the side table has to be closed by close to write the remaining ones
+    """
+    bits: int = 64
+    side_table: str | None = None
+
+    def __call__(self, trace) -> list:
+        labels = [e["concept:name"] for e in trace]
+        h = hash_sequence(hash_activities(labels), self.bits)
+        if self.side_table is not None:
+            open_variant_table(self.side_table).stage({h: ",".join(labels)})
+        return [h]
+
+    def encoded_counts(self, encoded: EncodedLog, start: int, stop: int) -> (dict, dict, int):
+        sequences = encoded.variant_sequences(start, stop)
+        hashes = self.__hash_sequences(encoded, sequences.keys())
+        counts = {}
+        for key, count in sequences.items():
+            counts[hashes[key]] = counts.get(hashes[key], 0) + count
+        return counts, dict(counts), 0
+
+    def encoded_postings(self, encoded: EncodedLog, start: int, stop: int) -> dict:
+        sequences = encoded.variant_sequence_postings(start, stop)
+        hashes = self.__hash_sequences(encoded, sequences.keys())
+        postings = {}
+        for key, traces in sequences.items():
+            h = hashes[key]
+            postings[h] = np.union1d(postings[h], traces) if h in postings else traces
+        return postings
+
+    def close(self) -> None:
+        """
+        writes the remaining labels to the side table and closes it
+        """
+        if self.side_table is not None:
+            close_variant_table(self.side_table)
+
+    def __hash_sequences(self, encoded: EncodedLog, keys) -> dict:
+        # hashes the interned activity sequences of an encoded log, labeling them only if the side table is kept
+        activity_hashes = hash_activities(encoded.vocabulary)
+        hashes = {key: hash_sequence(activity_hashes[encoded.sequence(key)], self.bits) for key in keys}
+        if self.side_table is not None:
+            labels = {}
+            for key, h in hashes.items():
+                label = ",".join(encoded.vocabulary[encoded.sequence(key)])
+                if labels.setdefault(h, label) != label:
+                    raise RuntimeError('Hash collision between trace variants ' + repr(labels[h]) + ' and ' +
+                                       repr(label))
+            open_variant_table(self.side_table).stage(labels)
+        return hashes
+
+
+@dataclass(frozen=True)
+class TimedActivity(DataFrameSpeciesSpec):
+    """
+    activities labeled by their duration bucket, see retrieve_timed_activity. Durations are bucketed exponentially
+    as in retrieve_timed_activity_exponential if no interval is given
+    """
+    interval: float | None = None
+
+    def __call__(self, trace) -> list:
+        if self.interval is None:
+            return retrieve_timed_activity_exponential(trace)
+        return retrieve_timed_activity(trace, self.interval)
+
+    def trace_key(self, trace):
+        # durations only depend on timestamps relative to the first event
+        start = trace[0]["time:timestamp"] if len(trace) > 0 else None
+        return tuple((e["concept:name"], e.get("lifecycle:transition"), e["time:timestamp"] - start) for e in trace)
+
+    def retrieve_dataframe(self, df: pd.DataFrame) -> pd.Series:
+        if self.interval is None:
+            return retrieve_timed_activity_exponential_dataframe(df)
+        return retrieve_timed_activity_dataframe(df, self.interval)
+
+
+class SpeciesCache:
+    """
+    A bounded least-recently-used cache of retrieved species, holding up to maxsize trace variants per spec. Entries
+    are keyed by trace key, such that repeated trace variants are retrieved only once per species definition
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        """
+        :param maxsize: the maximum number of cached entries per spec
+        """
+        self.maxsize = maxsize
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def retrieve(self, spec: SpeciesSpec, trace) -> (list, set):
+        """
+        retrieves the species of a trace, reusing the entry of an earlier trace with equal key if cached
+        :param spec: the species definition
+        :param trace: the trace
+        :return: the species of the trace with repetitions and the set of its species
+        """
+        key = spec.trace_key(trace)
+        if key is None:
+            species_abundance = spec(trace)
+            return species_abundance, set(species_abundance)
+
+        entries = self.entries.setdefault(spec, OrderedDict())
+        entry = entries.get(key)
+        if entry is not None:
+            entries.move_to_end(key)
+            self.hits = self.hits + 1
+            return entry
+
+        self.misses = self.misses + 1
+        species_abundance = spec(trace)
+        entry = (species_abundance, set(species_abundance))
+        entries[key] = entry
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        return entry
+
+
+def _bound_arguments(function, func, *names):
+    # the keyword arguments of a partial of func binding exactly the given names, or None
+    if isinstance(function, partial) and function.func is func and not function.args \
+            and set(function.keywords.keys()) == set(names):
+        return [function.keywords[name] for name in names]
+    return None
+
+
+def compile_species(function):
+    """
+    compiles a retrieval function into the equivalent spec if it is one of the known retrieval functions, bound via
+    functools.partial where needed. Specs and unknown callables are returned unchanged
+    :param function: the retrieval function or spec
+    :return: the spec, or the unchanged function
+    """
+    if isinstance(function, SpeciesSpec):
+        return function
+    if function is retrieve_species_trace_variant:
+        return TraceVariant()
+    if function is retrieve_timed_activity_exponential:
+        return TimedActivity()
+    if (args := _bound_arguments(function, retrieve_species_n_gram, "n")) is not None:
+        return NGram(*args)
+    if (args := _bound_arguments(function, retrieve_species_attribute_n_gram, "key", "n")) is not None:
+        return AttributeNGram(*args)
+    if (args := _bound_arguments(function, retrieve_timed_activity, "interval_size")) is not None:
+        return TimedActivity(*args)
+    return function
+
+
+def compile_species_family(function) -> list | None:
+    """
+    compiles a family retrieval function into the specs of its members if it is retrieve_species_n_gram_family with
+    bound ns
+    :param function: the family retrieval function
+    :return: the member specs in the order of ns, or None if the family cannot be compiled
+    """
+    if (args := _bound_arguments(function, retrieve_species_n_gram_family, "ns")) is not None:
+        return [NGram(n) for n in args[0]]
+    return None
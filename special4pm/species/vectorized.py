@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class EncodedLog:
+    """
+    An event log stored as one concatenated array of integer-encoded activities, with trace boundaries given by
+    offsets. Allows the retrieval of n-gram species for many traces at once
+    """
+
+    def __init__(self, activities: np.ndarray, offsets: np.ndarray, vocabulary: list,
+                 multiplicities: np.ndarray | None = None) -> None:
+        """
+        :param activities: the activity codes of all events, trace after trace
+        :param offsets: the start index of each trace in activities, followed by the total number of events
+        :param vocabulary: the activity label of each activity code
+        :param multiplicities: the number of observations each trace stands for, defaults to one per trace
+        """
+        self.activities = activities
+        self.offsets = offsets
+        self.vocabulary = np.array([str(label) for label in vocabulary], dtype=object)
+        self.multiplicities = np.ones(len(offsets) - 1, dtype=np.int64) if multiplicities is None else multiplicities
+
+    @classmethod
+    def from_log(cls, log, key: str = "concept:name") -> "EncodedLog":
+        """
+        encodes an event log, preserving the order of traces
+        :param log: the event log
+        :param key: the event attribute used as activity label
+        :return: the encoded log
+        """
+        codes = {}
+        activities = np.fromiter((codes.setdefault(e[key], len(codes)) for tr in log for e in tr), dtype=np.int32)
+        offsets = np.zeros(len(log) + 1, dtype=np.int64)
+        np.cumsum([len(tr) for tr in log], out=offsets[1:])
+        return cls(activities, offsets, list(codes.keys()))
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, case_id: str = "case:concept:name",
+                       key: str = "concept:name") -> "EncodedLog":
+        """
+        encodes an event log given as data frame. Traces are ordered by the first occurrence of their case id, events
+        within a trace keep their order in the data frame
+        :param df: the event log as data frame
+        :param case_id: the column containing the case ids
+        :param key: the column used as activity label
+        :return: the encoded log
+        """
+        # missing activities are labeled like any other value, as str(e[key]) does for traces
+        codes, vocabulary = pd.factorize(df[key], use_na_sentinel=False)
+        cases = pd.factorize(df[case_id])[0]
+        order = np.argsort(cases, kind="stable")
+        offsets = np.zeros(cases.max() + 2 if len(cases) > 0 else 1, dtype=np.int64)
+        np.cumsum(np.bincount(cases), out=offsets[1:])
+        return cls(codes[order].astype(np.int32), offsets, list(vocabulary))
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def no_traces(self, start: int = 0, stop: int | None = None) -> int:
+        """
+        returns the number of observations a range of traces stands for, i.e. the sum of their multiplicities
+        :param start: the index of the first trace
+        :param stop: the index after the last trace, defaults to the end of the log
+        :return: the number of observations
+        """
+        return int(self.multiplicities[start:stop].sum())
+
+    def variant_sequences(self, start: int = 0, stop: int | None = None) -> dict:
+        """
+        interns the distinct activity sequences of a range of traces by their raw bytes, see sequence
+        :param start: the index of the first trace
+        :param stop: the index after the last trace, defaults to the end of the log
+        :return: the summed multiplicities of the traces of each activity sequence, keyed by its bytes
+        """
+        stop = len(self) if stop is None else stop
+        variants = {}
+        for i in range(start, stop):
+            sequence = self.activities[self.offsets[i]:self.offsets[i + 1]].tobytes()
+            variants[sequence] = variants.get(sequence, 0) + int(self.multiplicities[i])
+        return variants
+
+    def sequence(self, key: bytes) -> np.ndarray:
+        """
+        :param key: an activity sequence interned by its raw bytes, see variant_sequences
+        :return: the activity codes of the sequence
+        """
+        return np.frombuffer(key, dtype=self.activities.dtype)
+
+    def compress(self) -> "EncodedLog":
+        """
+        collapses identical traces into a single trace each, weighted by the number of traces it replaces. Species
+        counts of the compressed log equal those of the original log, but are retrieved once per variant
+        :return: the compressed log, holding the variants in order of first occurrence
+        """
+        variants = self.variant_sequences()
+        sequences = [np.frombuffer(sequence, dtype=self.activities.dtype) for sequence in variants.keys()]
+        offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+        np.cumsum([len(sequence) for sequence in sequences], out=offsets[1:])
+        activities = np.concatenate(sequences) if len(sequences) > 0 else self.activities[:0]
+        return EncodedLog(activities, offsets, self.vocabulary,
+                          np.fromiter(variants.values(), dtype=np.int64, count=len(variants)))
+
+    def select(self, indices) -> "EncodedLog":
+        """
+        selects a subset of traces, keeping their multiplicities
+        :param indices: the indices of the selected traces, in the order they shall appear
+        :return: the encoded log of the selected traces
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = self.offsets[indices + 1] - self.offsets[indices]
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        positions = np.repeat(self.offsets[indices] - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return EncodedLog(self.activities[positions], offsets, self.vocabulary, self.multiplicities[indices])
+
+    def __n_grams(self, n: int, start: int, stop: int) -> tuple | None:
+        # the activities of a range of traces and, for every n-gram not crossing a trace boundary, its species id, its
+        # trace within the range and its start position, ordered by id and, within each id, by trace
+        activities = self.activities[self.offsets[start]:self.offsets[stop]]
+        lengths = np.diff(self.offsets[start:stop + 1])
+        if len(activities) < n:
+            return None
+
+        # an n-gram starting at position p is valid if it does not cross a trace boundary
+        trace_of = np.repeat(np.arange(stop - start), lengths)
+        positions = np.flatnonzero(trace_of[:len(activities) - n + 1] == trace_of[n - 1:])
+        if len(positions) == 0:
+            return None
+
+        base = max(len(self.vocabulary), 1)
+        if base ** n < 2 ** 63:
+            # exact mixed-radix ids
+            ids = np.zeros(len(activities) - n + 1, dtype=np.int64)
+            for j in range(n):
+                ids = ids * base + activities[j:len(activities) - n + 1 + j]
+            ids = ids[positions]
+        else:
+            ids = np.unique(sliding_window_view(activities, n)[positions], axis=0, return_inverse=True)[1].ravel()
+
+        # a stable sort orders the n-grams by id and, within each id, by trace
+        order = np.argsort(ids, kind="stable")
+        return activities, ids[order], trace_of[positions][order], positions[order]
+
+    def __n_gram_labels(self, activities: np.ndarray, first: np.ndarray, n: int) -> list:
+        # the labels of the n-grams starting at the given positions, as in retrieve_species_n_gram
+        labels = self.vocabulary[activities[first]]
+        for j in range(1, n):
+            labels = labels + "," + self.vocabulary[activities[first + j]]
+        return labels.tolist()
+
+    def n_gram_counts(self, n: int, start: int = 0, stop: int | None = None) -> (dict, dict, int):
+        """
+        retrieves the abundance and incidence counts of n-gram species for a range of traces. Species are labeled as in
+        retrieve_species_n_gram
+        :param n: the length of the n-grams
+        :param start: the index of the first trace
+        :param stop: the index after the last trace, defaults to the end of the log
+        :return: the abundance counts, the incidence counts and the number of traces without any n-gram
+        """
+        stop = len(self) if stop is None else stop
+        weights = self.multiplicities[start:stop]
+        empty = int(weights[np.diff(self.offsets[start:stop + 1]) < n].sum())
+        n_grams = self.__n_grams(n, start, stop)
+        if n_grams is None:
+            return {}, {}, empty
+        activities, ids, traces, positions = n_grams
+
+        new_species = np.empty(len(ids), dtype=bool)
+        new_species[0] = True
+        np.not_equal(ids[1:], ids[:-1], out=new_species[1:])
+        new_incidence = new_species.copy()
+        new_incidence[1:] |= traces[1:] != traces[:-1]
+
+        starts = np.flatnonzero(new_species)
+        weights = weights[traces]
+        abundance = np.add.reduceat(weights, starts)
+        incidence = np.add.reduceat(np.where(new_incidence, weights, 0), starts)
+
+        labels = self.__n_gram_labels(activities, positions[starts], n)
+        return dict(zip(labels, abundance.tolist())), dict(zip(labels, incidence.tolist())), empty
+
+    def n_gram_postings(self, n: int, start: int = 0, stop: int | None = None) -> dict:
+        """
+        retrieves the traces containing each n-gram species for a range of traces
+        :param n: the length of the n-grams
+        :param start: the index of the first trace
+        :param stop: the index after the last trace, defaults to the end of the log
+        :return: the ascending indices of the traces within the range containing each species, keyed by species
+        """
+        stop = len(self) if stop is None else stop
+        n_grams = self.__n_grams(n, start, stop)
+        if n_grams is None:
+            return {}
+        activities, ids, traces, positions = n_grams
+
+        new_species = np.empty(len(ids), dtype=bool)
+        new_species[0] = True
+        np.not_equal(ids[1:], ids[:-1], out=new_species[1:])
+        new_incidence = new_species.copy()
+        new_incidence[1:] |= traces[1:] != traces[:-1]
+
+        starts = np.flatnonzero(new_species)
+        boundaries = np.flatnonzero(new_species[new_incidence])
+        labels = self.__n_gram_labels(activities, positions[starts], n)
+        return dict(zip(labels, np.split(traces[new_incidence], boundaries[1:])))
+
+    def variant_counts(self, start: int = 0, stop: int | None = None) -> (dict, dict, int):
+        """
+        retrieves the counts of trace variant species for a range of traces. Variants are interned by their encoded
+        activity sequence, so each distinct variant is labeled once. Species are labeled as in
+        retrieve_species_trace_variant
+        :param start: the index of the first trace
+        :param stop: the index after the last trace, defaults to the end of the log
+        :return: the abundance counts, the incidence counts and the number of traces without any variant, i.e. zero
+        """
+        stop = len(self) if stop is None else stop
+        counts = {",".join(self.vocabulary[self.sequence(key)]): count
+                  for key, count in self.variant_sequences(start, stop).items()}
+        return counts, dict(counts), 0
+
+    def variant_postings(self, start: int = 0, stop: int | None = None) -> dict:
+        """
+        retrieves the traces of each trace variant species for a range of traces
+        :param start: the index of the first trace
+        :param stop: the index after the last trace, defaults to the end of the log
+        :return: the ascending indices of the traces within the range of each variant, keyed by variant
+        """
+        return {",".join(self.vocabulary[self.sequence(key)]): indices
+                for key, indices in self.variant_sequence_postings(start, stop).items()}
+
+    def variant_sequence_postings(self, start: int = 0, stop: int | None = None) -> dict:
+        """
+        retrieves the traces of each distinct activity sequence for a range of traces
+        :param start: the index of the first trace
+        :param stop: the index after the last trace, defaults to the end of the log
+        :return: the ascending indices of the traces within the range of each sequence, keyed by its bytes
+        """
+        stop = len(self) if stop is None else stop
+        traces = {}
+        for i in range(start, stop):
+            traces.setdefault(self.activities[self.offsets[i]:self.offsets[i + 1]].tobytes(), []).append(i - start)
+        return {key: np.asarray(indices, dtype=np.int64) for key, indices in traces.items()}
+
@@ -0,0 +1,15 @@
+import subprocess
+import sys
+import unittest
+
+MODULES = ["special4pm.bootstrap.bootstrap", "special4pm.raripolation.coverage",
+           "special4pm.raripolation.rarefaction_extrapolation", "special4pm.estimation.metrics",
+           "special4pm.estimation", "special4pm.species"]
+
+
+class TestImports(unittest.TestCase):
+    def test_modules_import_on_their_own(self):
+        # each module is imported first in a fresh interpreter, such that circular imports are detected
+        for module in MODULES:
+            result = subprocess.run([sys.executable, "-c", "import " + module], capture_output=True, text=True)
+            self.assertEqual(result.returncode, 0, module + ": " + result.stderr)
@@ -0,0 +1,97 @@
+import random
+import unittest
+
+import numpy as np
+from pm4py.objects.log.obj import EventLog, Trace, Event
+
+from special4pm.estimation import SpeciesEstimator, MultiLogEstimator
+from special4pm.estimation.beta_diversity import align_counts, shared_species_observed, \
+    estimate_shared_species_chao, sorensen, jaccard, chao_sorensen, chao_jaccard, morisita_horn, beta_diversity, \
+    compare_logs
+from special4pm.species import NGram, TraceVariant
+
+
+def create_random_log(size, seed):
+    rnd = random.Random(seed)
+    return EventLog([Trace([Event({"concept:name": rnd.choice("ABCDE")}) for _ in range(rnd.randint(0, 8))])
+                     for _ in range(size)])
+
+
+def create_estimator(estimator):
+    estimator.register("2-gram", NGram(2))
+    estimator.register("variant", TraceVariant())
+    return estimator
+
+
+class TestMultiLogEstimator(unittest.TestCase):
+    logs = [create_random_log(size, seed) for seed, size in enumerate([1, 3, 20, 150, 400])]
+
+    def test_profiles_equal_single_log_profiles(self):
+        multi = create_estimator(MultiLogEstimator())
+        for i, log in enumerate(self.logs):
+            multi.add_log(i, log, verbose=False)
+        for i, log in enumerate(self.logs):
+            estimator = create_estimator(SpeciesEstimator())
+            estimator.apply(log, verbose=False)
+            for species_id in ["2-gram", "variant"]:
+                for metric, values in multi.profile_arrays(species_id).items():
+                    self.assertAlmostEqual(values[i], estimator.metrics[species_id][metric][-1], places=7,
+                                           msg=species_id + " " + metric)
+
+    def test_shared_vocabulary(self):
+        multi = create_estimator(MultiLogEstimator())
+        labels = np.arange(150) % 3
+        self.assertEqual(multi.add_partitions(self.logs[3], labels, verbose=False), [0, 1, 2])
+
+        incidence = multi.count_matrix("2-gram")
+        self.assertEqual(incidence.shape, (3, len(multi.species("2-gram"))))
+        shared = multi.shared_species_counts("2-gram")
+        self.assertEqual(np.diag(shared).tolist(), np.diff(incidence.indptr).tolist())
+        self.assertEqual(len(multi.shared_species(0, 1, "2-gram")), shared[0, 1])
+        self.assertEqual(len(multi.unique_species(0, 1, "2-gram")), shared[0, 0] - shared[0, 1])
+
+        estimator = create_estimator(SpeciesEstimator())
+        estimator.apply(EventLog(self.logs[3][1::3]), verbose=False)
+        self.assertEqual(dict(zip(multi.species("variant"), multi.count_matrix("variant").toarray()[1])),
+                         {s: estimator.metrics["variant"].reference_sample_incidence.get(s, 0)
+                          for s in multi.species("variant")})
+        self.assertRaises(RuntimeError, multi.add_partitions, self.logs[3], labels, False)
+
+
+class TestBetaDiversity(unittest.TestCase):
+    def test_indices(self):
+        counts, species = align_counts([{"x": 1, "y": 2, "z": 5, "w": 1}, {"x": 1, "y": 1, "z": 3, "v": 2}])
+        self.assertEqual(species, ["x", "y", "z", "w", "v"])
+        sample_size = np.array([10, 8])
+        self.assertEqual(shared_species_observed(counts)[0, 1], 3)
+        self.assertAlmostEqual(sorensen(counts)[0, 1], 0.75)
+        self.assertAlmostEqual(jaccard(counts)[0, 1], 0.6)
+        # 3 shared species, x a singleton in the first log, x and y singletons in the second log, y a doubleton in
+        # the first log, and no doubletons in the second
+        self.assertAlmostEqual(estimate_shared_species_chao(counts, sample_size)[0, 1],
+                               3 + 9 / 10 * 1 / 2 + 7 / 8 * 2 * 1 / 2)
+        u, v = 1, 5 / 7 + 9 / 10 * 1 / 2 * 1 / 7
+        self.assertAlmostEqual(chao_sorensen(counts, sample_size)[0, 1], 2 * u * v / (u + v))
+        self.assertAlmostEqual(chao_jaccard(counts, sample_size)[1, 0], u * v / (u + v - u * v))
+        self.assertAlmostEqual(morisita_horn(counts, corrected=False)[0, 1],
+                               2 * (1 + 2 + 15) / 63 / ((1 + 4 + 25 + 1) / 81 + (1 + 1 + 9 + 4) / 49))
+        self.assertRaises(RuntimeError, beta_diversity, counts, sample_size, "unknown")
+
+    def test_multi_log_matrix(self):
+        multi = create_estimator(MultiLogEstimator())
+        logs = [create_random_log(100, seed) for seed in range(4)]
+        for i, log in enumerate(logs):
+            multi.add_log(i, log, verbose=False)
+        similarity = multi.beta_diversity("2-gram", "chao_jaccard")
+        self.assertEqual(similarity.shape, (4, 4))
+        self.assertTrue(np.allclose(similarity.values, similarity.values.T))
+        self.assertTrue(np.allclose(np.diag(similarity.values), 1))
+
+        estimators = {}
+        for i, log in enumerate(logs[:2]):
+            estimators[i] = create_estimator(SpeciesEstimator())
+            estimators[i].apply(log, verbose=False)
+        comparison = compare_logs(estimators, ["shared_chao"])
+        shared = multi.beta_diversity("variant", "shared_chao")
+        self.assertAlmostEqual(comparison[(comparison["species"] == "variant") & (comparison["log_a"] == 0) &
+                                          (comparison["log_b"] == 1)]["value"].iloc[0], shared.loc[0, 1])
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+from pm4py.objects.log.obj import Trace, Event
+
+from special4pm.estimation.metrics import entropy_exp, simpson_diversity, estimate_species_richness_chao, coverage
+from special4pm.raripolation.coverage import raripolate_coverage_counts, sample_size_for_coverage
+from special4pm.estimation.species_estimator import SpeciesEstimator
+from special4pm.raripolation.rarefaction_extrapolation import raripolate_counts, raripolate_bootstrap, get_locations
+from special4pm.species import NGram
+
+
+class TestRarefactionExtrapolation(unittest.TestCase):
+    reference_sample = {"A": 10, "B": 5, "C": 2, "D": 2, "E": 1, "F": 1}
+
+    def test_reference_sample_size_equals_sample_metrics(self):
+        values = raripolate_counts(self.reference_sample, 10, [0, 1, 2], np.array([10]), abundance=False)
+        self.assertAlmostEqual(values[0, 0], len(self.reference_sample))
+        self.assertAlmostEqual(values[1, 0], entropy_exp(self.reference_sample))
+        self.assertAlmostEqual(values[2, 0], simpson_diversity(self.reference_sample))
+
+    def test_richness_curve_increasing_towards_estimate(self):
+        locations = get_locations(10, points=20, endpoint=1000)
+        values = raripolate_counts(self.reference_sample, 10, [0], locations, abundance=False)[0]
+        self.assertTrue(np.all(np.diff(values) >= 0))
+        self.assertLessEqual(values[-1], estimate_species_richness_chao(self.reference_sample))
+        self.assertAlmostEqual(values[-1], estimate_species_richness_chao(self.reference_sample), places=3)
+
+    def test_abundance_rarefaction_single_observation(self):
+        values = raripolate_counts(self.reference_sample, 21, [0, 1, 2], np.array([1]), abundance=True)
+        self.assertTrue(np.allclose(values, 1.0))
+
+    def test_locations_evaluated_independently(self):
+        locations = get_locations(21, points=15)
+        values = raripolate_counts(self.reference_sample, 21, [0, 1, 2], locations, abundance=True)
+        for col, location in enumerate(locations):
+            self.assertTrue(np.allclose(values[:, col], raripolate_counts(self.reference_sample, 21, [0, 1, 2],
+                                                                          np.array([location]), abundance=True)[:, 0]))
+
+    def test_single_bootstrap_replicate(self):
+        estimator = SpeciesEstimator()
+        estimator.register("1-gram", NGram(1))
+        estimator.apply([Trace([Event({"concept:name": a}) for a in variant]) for variant in ["AB", "A", "BC"]],
+                        verbose=False)
+        self.assertRaises(RuntimeError, estimator.raripolate, "1-gram", bootstrap=1)
+        self.assertEqual(len(estimator.raripolate("1-gram", points=5, bootstrap=2)), 3 * 6)
+
+    def test_bootstrap_parallel(self):
+        locations = get_locations(10, points=5)
+        ci = raripolate_bootstrap(self.reference_sample, 10, [0, 1, 2], locations, abundance=False,
+                                  no_bootstrap_samples=20, workers=2)
+        self.assertEqual(ci.shape, (3, len(locations)))
+        self.assertTrue(np.all(ci >= 0))
+
+
+class TestCoverageBasedRarefactionExtrapolation(unittest.TestCase):
+    reference_sample = {"A": 10, "B": 5, "C": 2, "D": 2, "E": 1, "F": 1, "G": 1}
+
+    def test_reference_sample_size_equals_coverage(self):
+        values = raripolate_coverage_counts(self.reference_sample, 10, np.array([10]))
+        self.assertAlmostEqual(values[0], coverage(self.reference_sample, 10))
+
+    def test_coverage_curve_increasing(self):
+        values = raripolate_coverage_counts(self.reference_sample, 10, np.arange(1, 50))
+        self.assertTrue(np.all(np.diff(values) >= 0))
+
+    def test_sample_size_reaches_target_coverage(self):
+        targets = [0.3, 0.6, 0.95, 0.99]
+        sizes = sample_size_for_coverage(self.reference_sample, 10, targets)
+        reached = raripolate_coverage_counts(self.reference_sample, 10, sizes)
+        below = raripolate_coverage_counts(self.reference_sample, 10, sizes - 1)
+        self.assertTrue(np.all(reached >= np.array(targets) - 1e-9))
+        self.assertTrue(np.all(below[sizes > 1] < np.array(targets)[sizes > 1]))
+
+    def test_full_coverage_unreachable(self):
+        self.assertTrue(np.isnan(sample_size_for_coverage(self.reference_sample, 10, [1.0])[0]))
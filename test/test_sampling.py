@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from pm4py.objects.log.obj import EventLog, Trace, Event
+
+from special4pm.estimation.sampling import reservoir_sample, bernoulli_sample
+from special4pm.estimation.species_estimator import SpeciesEstimator
+from special4pm.species import NGram
+from special4pm.species.vectorized import EncodedLog
+
+
+class TestSampling(unittest.TestCase):
+    def test_reservoir_sample_uniform(self):
+        rng = np.random.default_rng(0)
+        hits = np.zeros(100)
+        for _ in range(2000):
+            sample, total = reservoir_sample(iter(range(100)), 10, rng)
+            self.assertEqual(total, 100)
+            self.assertEqual(len(sample), 10)
+            self.assertEqual(sample, sorted(sample))
+            hits[sample] = hits[sample] + 1
+        # every item is drawn with probability 0.1
+        self.assertLess(np.abs(hits / 2000 - 0.1).max(), 0.03)
+
+    def test_bernoulli_sample(self):
+        sample, total = bernoulli_sample(iter(range(100000)), 0.05, np.random.default_rng(0))
+        self.assertEqual(total, 100000)
+        self.assertAlmostEqual(len(sample) / total, 0.05, delta=0.005)
+        self.assertEqual(sample, sorted(set(sample)))
+
+    def test_encoded_select(self):
+        traces = [["A", "B"], [], ["C"], ["A", "B", "C"]]
+        encoded = EncodedLog.from_log([[{"concept:name": a} for a in tr] for tr in traces])
+        selected = encoded.select([3, 0, 1])
+        self.assertEqual(selected.n_gram_counts(2), EncodedLog.from_log(
+            [[{"concept:name": a} for a in tr] for tr in [traces[3], traces[0], traces[1]]]).n_gram_counts(2))
+
+
+def create_log(size):
+    rng = np.random.default_rng(1)
+    return EventLog([Trace([Event({"concept:name": str(a)}) for a in rng.integers(0, 10, size=rng.integers(1, 6))])
+                     for _ in range(size)])
+
+
+class TestApplySample(unittest.TestCase):
+    log = create_log(1000)
+
+    def profile(self, data, **kwargs):
+        estimator = SpeciesEstimator()
+        estimator.register("2-gram", NGram(2))
+        return estimator, estimator.apply_sample(data, bootstrap=0, verbose=False, **kwargs)
+
+    def test_reproducible(self):
+        estimator, extrapolation = self.profile(self.log, fraction=0.2, seed=3)
+        self.assertEqual(estimator.metrics["2-gram"]["incidence_no_observations"][-1], 200)
+        self.assertEqual(extrapolation["sample_size"].unique().tolist(), [200, 1000])
+        self.assertTrue(extrapolation.equals(self.profile(self.log, fraction=0.2, seed=3)[1]))
+
+    def test_stream(self):
+        estimator, extrapolation = self.profile(iter(self.log), size=100, seed=3)
+        self.assertEqual(estimator.metrics["2-gram"]["incidence_no_observations"][-1], 100)
+        self.assertEqual(extrapolation["sample_size"].max(), 1000)
+
+    def test_dataframe_case_id_key(self):
+        df = pd.DataFrame([{"case": str(i), "concept:name": e["concept:name"]}
+                           for i, trace in enumerate(self.log) for e in trace])
+        estimator, extrapolation = self.profile(df, fraction=0.2, seed=3, case_id_key="case")
+        self.assertEqual(estimator.metrics["2-gram"]["incidence_no_observations"][-1], 200)
+        self.assertEqual(extrapolation["sample_size"].max(), 1000)
@@ -0,0 +1,87 @@
+import unittest
+
+import numpy as np
+
+from special4pm.estimation.species_estimator import SpeciesEstimator, ApproximateMetricManager
+from special4pm.estimation.metrics import get_singletons, get_doubletons, estimate_species_richness_chao
+from special4pm.estimation.sketch import HyperLogLog, HeavyHitters, SpeciesSketch, _hash_species
+
+
+class TestSpeciesSketch(unittest.TestCase):
+    rng = np.random.default_rng(0)
+    observations = (rng.zipf(1.3, size=200000) % 1000000).tolist()
+
+    def exact_counts(self):
+        counts = {}
+        for s in self.observations:
+            counts[s] = counts.get(s, 0) + 1
+        return counts
+
+    def test_exact_below_capacity(self):
+        sketch = SpeciesSketch(capacity=10 ** 6)
+        for s in self.observations:
+            sketch[s] = sketch.get(s, 0) + 1
+        counts = self.exact_counts()
+        self.assertEqual(len(sketch), len(counts))
+        self.assertEqual(sorted(sketch.values()), sorted(counts.values()))
+        self.assertEqual(sketch.error_bounds()["singletons"], 0)
+
+    def test_approximate_within_error_bounds(self):
+        sketch = SpeciesSketch(capacity=2000, heavy_hitters=100)
+        for s in self.observations:
+            sketch.add(s)
+        counts = self.exact_counts()
+        bounds = sketch.error_bounds()
+        self.assertGreater(sketch.level, 0)
+        self.assertLessEqual(len(sketch.sample), 2000)
+        self.assertLess(abs(len(sketch) - len(counts)), 4 * bounds["species"])
+        self.assertLess(abs(get_singletons(sketch) - get_singletons(counts)), 4 * bounds["singletons"])
+        self.assertLess(abs(get_doubletons(sketch) - get_doubletons(counts)), 4 * bounds["doubletons"])
+        self.assertAlmostEqual(estimate_species_richness_chao(sketch) / estimate_species_richness_chao(counts), 1,
+                               delta=0.1)
+
+    def test_reconstruction_consistent(self):
+        sketch = SpeciesSketch(capacity=2000, heavy_hitters=100)
+        for s in self.observations:
+            sketch.add(s)
+        frequencies = sketch.frequencies()
+        values = sketch.values()
+        self.assertGreater(sketch.level, 0)
+        self.assertEqual(len(values), len(sketch))
+        self.assertEqual(sum(frequencies.values()), len(sketch))
+        self.assertEqual(values.count(1), frequencies[1])
+        self.assertEqual(sorted(values), sorted(k for k, f in frequencies.items() for _ in range(f)))
+        self.assertEqual(estimate_species_richness_chao(sketch),
+                         estimate_species_richness_chao(dict(enumerate(values))))
+
+    def test_heavy_hitters_underestimate_by_at_most_error(self):
+        heavy = HeavyHitters(capacity=50)
+        for s in self.observations:
+            heavy.add(s)
+        counts = self.exact_counts()
+        for s, c in counts.items():
+            self.assertLessEqual(heavy.counters.get(s, 0), c)
+            self.assertGreaterEqual(heavy.counters.get(s, 0), c - heavy.error)
+        self.assertLessEqual(heavy.error, len(self.observations) / 51)
+
+    def test_hyperloglog(self):
+        hll = HyperLogLog(precision=12)
+        for s in range(50000):
+            hll.add(_hash_species(s)[0])
+        self.assertAlmostEqual(hll.estimate() / 50000, 1, delta=4 * hll.relative_error())
+
+
+class TestApproximateEstimator(unittest.TestCase):
+    def test_profiles_exact_below_capacity(self):
+        rng = np.random.default_rng(1)
+        traces = [[str(a) for a in rng.integers(0, 20, size=rng.integers(1, 8))] for _ in range(300)]
+        exact = SpeciesEstimator(step_size=50)
+        approximate = SpeciesEstimator(step_size=50, sketch_capacity=10000)
+        for estimator in [exact, approximate]:
+            estimator.register("2-gram", lambda trace: [a + "," + b for a, b in zip(trace, trace[1:])])
+            for trace in traces:
+                estimator.add_observation(trace, "2-gram")
+            estimator.update_metrics("2-gram")
+        self.assertIsInstance(approximate.metrics["2-gram"], ApproximateMetricManager)
+        for metric in ["incidence_estimate_d0", "incidence_estimate_d1", "abundance_c1"]:
+            self.assertAlmostEqual(exact.metrics["2-gram"][metric][-1], approximate.metrics["2-gram"][metric][-1])
@@ -0,0 +1,364 @@
+import unittest
+from datetime import datetime, timedelta
+
+import pandas as pd
+from pm4py.objects.log.obj import EventLog, Trace, Event
+
+from special4pm.estimation.checkpoints import GeometricSchedule
+from special4pm.estimation.postings import PostingLists
+from special4pm.estimation.species_estimator import SpeciesEstimator
+from special4pm.species import NGram, TraceVariant
+
+
+def create_log(variants):
+    log = EventLog()
+    for variant in variants:
+        log.append(Trace([Event({"concept:name": a}) for a in variant]))
+    return log
+
+
+class TestDataTypes(unittest.TestCase):
+    log = create_log(["ABCAB", "A", "", "ABD", "CCCC", "DABCA", "AB", "BBA", "ABD"])
+
+    def test_incidence_only_equals_incidence_part(self):
+        both = SpeciesEstimator(step_size=2)
+        incidence = SpeciesEstimator(step_size=2, abundance=False)
+        for estimator in [both, incidence]:
+            estimator.register("2-gram", NGram(2))
+            estimator.register("variant", lambda trace: [",".join(e["concept:name"] for e in trace)])
+            estimator.apply(self.log, verbose=False)
+
+        for species_id in ["2-gram", "variant"]:
+            self.assertEqual(incidence.metrics[species_id].reference_sample_abundance, {})
+            self.assertFalse(any(key.startswith("abundance") for key in incidence.metrics[species_id].keys()))
+            for key, values in incidence.metrics[species_id].items():
+                self.assertEqual(values, both.metrics[species_id][key])
+        self.assertFalse(incidence.to_dataFrame()["metric"].str.startswith("abundance").any())
+        self.assertRaises(RuntimeError, incidence.raripolate, "2-gram", abundance=True)
+
+    def test_abundance_only(self):
+        abundance = SpeciesEstimator(step_size=None, incidence=False)
+        abundance.register("2-gram", NGram(2))
+        abundance.apply(self.log, verbose=False)
+        self.assertEqual(abundance.metrics["2-gram"].reference_sample_incidence, {})
+        self.assertEqual(abundance.metrics["2-gram"]["abundance_sample_d0"][-1], 8)
+        self.assertNotIn("incidence_estimate_d0_ci", abundance.metrics["2-gram"])
+
+
+class TestMetricRegistry(unittest.TestCase):
+    log = create_log(["ABCAB", "A", "", "ABD", "CCCC", "DABCA", "AB", "BBA", "ABD"])
+
+    def test_custom_metric(self):
+        estimator = SpeciesEstimator(step_size=3)
+        estimator.register_metric("tripletons", lambda stats: stats.counts.count(3))
+        estimator.register("2-gram", NGram(2))
+        estimator.apply(self.log, verbose=False)
+
+        metrics = estimator.metrics["2-gram"]
+        for data_type in ["abundance", "incidence"]:
+            self.assertEqual(len(metrics[data_type + "_tripletons"]), len(metrics[data_type + "_sample_d0"]))
+        self.assertEqual(metrics["abundance_tripletons"][-1],
+                         list(metrics.reference_sample_abundance.values()).count(3))
+        self.assertEqual(metrics["incidence_tripletons"][-1],
+                         list(metrics.reference_sample_incidence.values()).count(3))
+
+
+class TestCheckpoints(unittest.TestCase):
+    log = create_log(["ABCAB", "A", "", "ABD", "CCCC", "DABCA", "AB", "BBA", "ABD"])
+
+    def profile(self, **kwargs):
+        estimator = SpeciesEstimator(**kwargs)
+        estimator.register("2-gram", NGram(2))
+        estimator.register("variant", lambda trace: [",".join(e["concept:name"] for e in trace)])
+        estimator.apply(self.log, verbose=False)
+        return estimator
+
+    def test_schedules(self):
+        for checkpoints, expected in [(GeometricSchedule(start=1, factor=2), [0, 1, 2, 4, 8, 9]),
+                                      ([3, 5, 20], [0, 3, 5, 9]),
+                                      (lambda n: n in (2, 7), [0, 2, 7, 9]),
+                                      (4, [0, 4, 8, 9])]:
+            estimator = self.profile(checkpoints=checkpoints)
+            for species_id in ["2-gram", "variant"]:
+                self.assertEqual(estimator.metrics[species_id]["incidence_no_observations"], expected)
+
+    def test_step_size_equals_step_schedule(self):
+        self.assertEqual(self.profile(step_size=2).to_dataFrame().to_dict(),
+                         self.profile(checkpoints=2).to_dataFrame().to_dict())
+
+
+class TestEarlyStopping(unittest.TestCase):
+    log = create_log(["AB", "AB", "BA", "AB", "BA", "AB", "C", "AB", "BA", "AB"] * 10)
+
+    def test_stop_when(self):
+        estimator = SpeciesEstimator(step_size=5)
+        estimator.register("1-gram", NGram(1))
+        estimator.register("variant", lambda trace: [",".join(e["concept:name"] for e in trace)])
+        estimator.register("2-gram", NGram(2))
+        stopped = estimator.apply(self.log, verbose=False, stop_for=["1-gram", "variant"],
+                                  stop_when={"incidence_c1": 0.95, "incidence_no_observations": 20})
+
+        self.assertEqual(stopped, {"1-gram": 20, "variant": 20})
+        stopped.clear()
+        self.assertEqual(estimator.stopped_at, {"1-gram": 20, "variant": 20})
+        for species_id in ["1-gram", "variant"]:
+            self.assertEqual(estimator.metrics[species_id]["incidence_no_observations"], [0, 5, 10, 15, 20])
+        self.assertEqual(estimator.metrics["2-gram"]["incidence_no_observations"][-1], 100)
+
+        estimator.apply(self.log, verbose=False, stop_when={"incidence_c1": 0})
+        self.assertEqual(estimator.metrics["1-gram"]["incidence_no_observations"][-1], 20)
+
+    def test_generator_read_lazily(self):
+        pulled = []
+
+        def traces():
+            for tr in self.log:
+                pulled.append(tr)
+                yield tr
+
+        estimator = SpeciesEstimator(step_size=5)
+        estimator.MIN_CHUNK_SIZE = 10
+        estimator.register("1-gram", NGram(1))
+        estimator.register("variant", TraceVariant())
+        stopped = estimator.apply(traces(), verbose=False,
+                                  stop_when={"incidence_c1": 0.95, "incidence_no_observations": 20})
+        self.assertEqual(stopped, {"1-gram": 20, "variant": 20})
+        self.assertEqual(len(pulled), 20)
+
+    def test_chunks_equal_whole_log(self):
+        # events of different cases interleave
+        df = pd.DataFrame([{"case:concept:name": str(i), "concept:name": e["concept:name"],
+                            "time:timestamp": datetime(2024, 1, 1) + timedelta(minutes=j)}
+                           for i, trace in enumerate(self.log) for j, e in enumerate(trace)])
+        df = df.sort_values("time:timestamp", kind="stable")
+        whole = SpeciesEstimator(step_size=5)
+        chunked = SpeciesEstimator(step_size=5)
+        chunked.MIN_CHUNK_SIZE = 7
+        for estimator in [whole, chunked]:
+            estimator.register("2-gram", NGram(2))
+            estimator.register("variant", lambda trace: [",".join(e["concept:name"] for e in trace)])
+        whole.apply(df, verbose=False)
+        self.assertEqual(chunked.apply(df, verbose=False, stop_when={"incidence_no_observations": 1000}), {})
+        for species_id in ["2-gram", "variant"]:
+            for key, values in whole.metrics[species_id].items():
+                self.assertEqual(values, chunked.metrics[species_id][key], key)
+
+    def test_requires_checkpoints(self):
+        estimator = SpeciesEstimator()
+        estimator.register("1-gram", NGram(1))
+        self.assertRaises(RuntimeError, estimator.apply, self.log, False, {"incidence_c1": 0.95})
+
+
+class TestTraceIndex(unittest.TestCase):
+    log = create_log(["ABCAB", "A", "", "ABD", "CCCC", "DABCA", "AB", "BBA", "ABD"])
+
+    def test_traces_containing(self):
+        for step_size in [None, 2]:
+            estimator = SpeciesEstimator(step_size=step_size, index_traces=True)
+            estimator.register("2-gram", NGram(2))
+            estimator.register("variant", TraceVariant())
+            estimator.register("1-gram", lambda trace: [e["concept:name"] for e in trace])
+            estimator.apply(self.log, verbose=False)
+
+            self.assertEqual(estimator.traces_containing("2-gram", ["A,B"]).tolist(), [0, 3, 5, 6, 8])
+            self.assertEqual(estimator.traces_containing("2-gram", frequencies=[1]).tolist(), [4, 5, 7])
+            self.assertEqual(estimator.traces_containing("variant", frequencies=[2]).tolist(), [3, 8])
+            self.assertEqual(estimator.traces_containing("1-gram", ["C", "D"]).tolist(), [0, 3, 4, 5, 8])
+            self.assertEqual(estimator.traces_containing("1-gram", ["E"]).tolist(), [])
+
+    def test_not_indexed(self):
+        estimator = SpeciesEstimator()
+        estimator.register("2-gram", NGram(2))
+        estimator.apply(self.log, verbose=False)
+        self.assertRaises(RuntimeError, estimator.traces_containing, "2-gram", ["A,B"])
+
+    def test_posting_lists(self):
+        postings = PostingLists(compact_after=3)
+        for trace_id in [0, 5, 300, 70000, 70001]:
+            postings.add(trace_id, {"a"})
+        postings.add_block(80000, {"a": [0, 2], "b": [1]})
+        self.assertEqual(postings.get("a").tolist(), [0, 5, 300, 70000, 70001, 80000, 80002])
+        self.assertEqual(postings.union(["a", "b"]).tolist(), [0, 5, 300, 70000, 70001, 80000, 80001, 80002])
+
+
+class TestGroupBy(unittest.TestCase):
+    variants = ["ABCAB", "A", "", "ABD", "CCCC", "DABCA", "AB", "BBA", "ABD", "CA", "ABCAB", "DD"]
+
+    def create_log(self):
+        log = create_log(self.variants)
+        for i, trace in enumerate(log):
+            trace.attributes["age"] = 20 + 7 * i
+        return log
+
+    def test_strata_equal_separate_profiles(self):
+        estimator = SpeciesEstimator(step_size=2)
+        estimator.register("2-gram", NGram(2))
+        estimator.register("variant", TraceVariant())
+        estimator.apply(self.create_log(), verbose=False, group_by="age>=60")
+        self.assertEqual(list(estimator.strata.keys()), [False, True])
+
+        for key, variants in [(None, self.variants), (False, self.variants[:6]), (True, self.variants[6:])]:
+            expected = SpeciesEstimator(step_size=2)
+            expected.register("2-gram", NGram(2))
+            expected.register("variant", TraceVariant())
+            expected.apply(create_log(variants), verbose=False)
+            profiled = estimator if key is None else estimator.strata[key]
+            for species_id in ["2-gram", "variant"]:
+                for metric, values in expected.metrics[species_id].items():
+                    self.assertEqual(len(profiled.metrics[species_id][metric]), len(values))
+                    for value, expected_value in zip(profiled.metrics[species_id][metric], values):
+                        self.assertAlmostEqual(value, expected_value)
+        profiles = estimator.to_dataFrame(strata=True)
+        self.assertEqual(set(profiles[~profiles["pooled"]]["stratum"].tolist()), {False, True})
+        self.assertEqual(set(profiles[profiles["pooled"]]["stratum"].tolist()), {None})
+
+    def test_missing_attribute(self):
+        log = self.create_log()
+        del log[0].attributes["age"]
+        estimator = SpeciesEstimator()
+        estimator.register("variant", TraceVariant())
+        estimator.apply(log, verbose=False, group_by="age>=60")
+        self.assertEqual(estimator.strata[None].metrics["variant"]["incidence_no_observations"][-1], 1)
+        profiles = estimator.to_dataFrame(strata=True)
+        self.assertEqual(len(profiles[profiles["stratum"].isna() & ~profiles["pooled"]]),
+                         len(profiles[profiles["pooled"]]))
+
+    def test_group_by_function(self):
+        estimator = SpeciesEstimator()
+        estimator.register("variant", TraceVariant())
+        estimator.apply(self.create_log(), verbose=False, group_by=lambda trace: len(trace) % 2)
+        self.assertEqual(estimator.strata[0].metrics["variant"]["incidence_no_observations"][-1], 5)
+        self.assertRaises(RuntimeError, estimator.apply, self.create_log(), False, {"incidence_c1": .9}, None,
+                          "age")
+
+
+class TestWindows(unittest.TestCase):
+    variants = ["ABCAB", "A", "ABD", "CCCC", "DABCA", "AB", "BBA", "ABD", "CA"]
+    months = [1, 1, 1, 2, 2, 4, 4, 4, 4]
+
+    def create_log(self, indices):
+        log = EventLog()
+        for i in indices:
+            log.append(Trace([Event({"concept:name": a, "time:timestamp": datetime(2024, self.months[i], 1 + j)})
+                              for j, a in enumerate(self.variants[i])]))
+        return log
+
+    def test_windows_equal_separate_profiles(self):
+        estimator = SpeciesEstimator(step_size=2)
+        estimator.register("2-gram", NGram(2))
+        profiles = estimator.apply_windows(iter(self.create_log(range(9))), freq="M", verbose=False,
+                                           keep_windows=True)
+        self.assertEqual(list(estimator.windows.keys()), [pd.Period("2024-01", "M"), pd.Period("2024-02", "M"),
+                                                          pd.Period("2024-04", "M")])
+        # profiles are only updated at the end of each month
+        self.assertEqual(estimator.metrics["2-gram"]["incidence_no_observations"], [0, 3, 5, 9])
+
+        for month, window, cumulative in [(1, [0, 1, 2], [0, 1, 2]), (4, [5, 6, 7, 8], range(9))]:
+            rows = profiles[profiles["window"] == datetime(2024, month, 1)].set_index("metric")
+            for column, indices in [("value", window), ("cumulative", cumulative)]:
+                expected = SpeciesEstimator()
+                expected.register("2-gram", NGram(2))
+                expected.apply(self.create_log(indices), verbose=False)
+                for metric, values in expected.metrics["2-gram"].items():
+                    self.assertAlmostEqual(rows.loc[metric, column], values[-1])
+
+    def test_release_windows(self):
+        estimator = SpeciesEstimator()
+        estimator.register("2-gram", NGram(2))
+        profiles = estimator.apply_windows(self.create_log(range(9)), verbose=False)
+        self.assertEqual(estimator.windows, {})
+        self.assertEqual(len(set(profiles["window"])), 3)
+
+    def test_pending(self):
+        log = [Trace([Event({"concept:name": "A"})]) for _ in range(3)] + list(self.create_log(range(9)))
+        estimator = SpeciesEstimator()
+        estimator.register("2-gram", NGram(2))
+        self.assertRaises(RuntimeError, estimator.apply_windows, log, "M", "first", "time:timestamp", False, False,
+                          2)
+        estimator = SpeciesEstimator()
+        estimator.register("2-gram", NGram(2))
+        profiles = estimator.apply_windows(log, verbose=False, max_pending=3)
+        self.assertEqual(profiles[profiles["metric"] == "incidence_no_observations"]["value"].tolist(), [6, 2, 4])
+
+    def test_unordered(self):
+        estimator = SpeciesEstimator()
+        estimator.register("2-gram", NGram(2))
+        self.assertRaises(RuntimeError, estimator.apply_windows, self.create_log([3, 0]), "M", "first",
+                          "time:timestamp", False)
+
+
+class TestEventStream(unittest.TestCase):
+    variants = ["ABCAB", "A", "", "ABD", "CCCC", "DABCA", "AB", "BBA", "ABD"]
+
+    def create_estimator(self):
+        estimator = SpeciesEstimator()
+        estimator.register("2-gram", NGram(2))
+        estimator.register("variant", TraceVariant())
+        return estimator
+
+    def test_interleaved_events_equal_traces(self):
+        estimator = self.create_estimator()
+        # events of all cases interleaved round robin, each case completing with its last event
+        for j in range(max(len(v) for v in self.variants)):
+            for case, variant in enumerate(self.variants):
+                if j < len(variant):
+                    estimator.push_event(case, variant[j], complete=j == len(variant) - 1)
+        self.assertEqual(estimator.metrics["2-gram"].abundance_sample_size, 18)
+        self.assertEqual(estimator.metrics["2-gram"].incidence_sample_size, 8)
+        self.assertEqual(estimator.flush(), [])
+
+        # the empty case never sends an event, cases complete in order of their length
+        expected = self.create_estimator()
+        expected.apply(create_log(sorted((v for v in self.variants if v != ""), key=len)), verbose=False)
+        for species_id in ["2-gram", "variant"]:
+            self.assertEqual(estimator.metrics[species_id].reference_sample_abundance,
+                             expected.metrics[species_id].reference_sample_abundance)
+            for key, values in expected.metrics[species_id].items():
+                self.assertAlmostEqual(estimator.metrics[species_id][key][-1], values[-1])
+
+    def test_timeout_and_eviction(self):
+        estimator = self.create_estimator()
+        estimator.open_stream(timeout=timedelta(hours=1), max_cases=2)
+        start = datetime(2024, 1, 1)
+        self.assertEqual(estimator.push_event("a", "A", start), [])
+        self.assertEqual(estimator.push_event("b", "B", start + timedelta(minutes=30)), [])
+        self.assertEqual(estimator.push_event("b", "C", start + timedelta(minutes=90)), ["a"])
+        self.assertEqual(estimator.push_event("c", "A", start + timedelta(minutes=100)), [])
+        # the incomplete case b is evicted and dropped, including its 2-gram B,C
+        self.assertEqual(estimator.push_event("d", "B", start + timedelta(minutes=110), lifecycle="complete"), [])
+        self.assertEqual(estimator.evicted_cases, 1)
+        self.assertEqual(estimator.metrics["2-gram"].reference_sample_abundance, {})
+        self.assertEqual(estimator.metrics["2-gram"].abundance_sample_size, 0)
+        self.assertEqual(estimator.open_cases.cases["d"][0]["lifecycle:transition"], "complete")
+        self.assertRaises(RuntimeError, estimator.open_stream)
+
+        estimator.complete_case("c")
+        self.assertRaises(RuntimeError, estimator.complete_case, "c")
+        self.assertEqual(estimator.flush(), ["d"])
+        self.assertEqual(estimator.metrics["variant"].reference_sample_incidence, {"A": 2, "B": 1})
+        self.assertEqual(estimator.metrics["variant"].incidence_sample_size, 3)
+
+    def test_timeout_of_cases_opened_without_timestamp(self):
+        estimator = self.create_estimator()
+        estimator.open_stream(timeout=timedelta(hours=1))
+        start = datetime(2024, 1, 1)
+        estimator.push_event("a", "A")
+        estimator.push_event("b", "B", start)
+        estimator.push_event("c", "C", start + timedelta(minutes=30))
+        # a is considered active since the first timestamp and does not block the timeout of b
+        self.assertEqual(estimator.push_event("c", "D", start + timedelta(minutes=90)), ["a", "b"])
+
+    def test_eviction_with_sketch(self):
+        estimator = SpeciesEstimator(step_size=1, sketch_capacity=5)
+        estimator.register("2-gram", NGram(2))
+        estimator.open_stream(max_cases=2)
+        for i in range(20):
+            for activity in "ABC":
+                estimator.push_event(i, activity + str(i))
+            if i % 2 == 0:
+                estimator.complete_case(i)
+        estimator.flush()
+        # odd cases are evicted by the next but one case, except the last two, which are flushed
+        self.assertEqual(estimator.evicted_cases, 8)
+        self.assertEqual(estimator.metrics["2-gram"].incidence_sample_size, 12)
+        self.assertEqual(estimator.metrics["2-gram"].abundance_sample_size, 24)
@@ -0,0 +1,167 @@
+import os
+import statistics
+import tempfile
+import unittest
+from functools import partial
+
+import numpy as np
+from pm4py.objects.log.obj import EventLog, Trace, Event
+
+from special4pm.estimation.species_estimator import SpeciesEstimator
+from special4pm.bootstrap.bootstrap import generate_nonparametric_bootstrap_samples_incidence, \
+    get_nonparametric_bootstrap_ci_incidence
+from special4pm.estimation.metrics import hill_number_asymptotic, coverage
+from special4pm.species import NGram, HashedTraceVariant, retrieve_species_n_gram_family
+from special4pm.species.matrix import SpeciesMatrix
+
+
+def create_log(variants):
+    return EventLog([Trace([Event({"concept:name": a}) for a in variant]) for variant in variants])
+
+
+def create_estimator():
+    estimator = SpeciesEstimator()
+    estimator.register("2-gram", NGram(2))
+    estimator.register("variant", HashedTraceVariant())
+    estimator.register_family(["1-gram", "3-gram"], partial(retrieve_species_n_gram_family, ns=[1, 3]))
+    return estimator
+
+
+class TestSpeciesMatrix(unittest.TestCase):
+    log = create_log(["ABCAB", "A", "", "ABD", "CCCC", "DABCA", "AB", "BBA", "ABD"])
+
+    def test_counts_equal_reference_samples(self):
+        with tempfile.TemporaryDirectory() as directory:
+            create_estimator().build_matrices(self.log, directory, verbose=False)
+            self.assertTrue(os.path.exists(os.path.join(directory, "2-gram", "indptr.npy")))
+
+            estimator = create_estimator()
+            estimator.apply(self.log, verbose=False)
+            matrices = create_estimator().load_matrices(directory)
+            for species_id, matrix in matrices.items():
+                self.assertIsInstance(matrix.indices, np.memmap)
+                self.assertEqual(len(matrix), len(self.log))
+                abundance, incidence, empty = matrix.counts()
+                self.assertEqual(abundance, estimator.metrics[species_id].reference_sample_abundance)
+                self.assertEqual(incidence, estimator.metrics[species_id].reference_sample_incidence)
+                self.assertEqual(empty, estimator.metrics[species_id].empty_traces)
+            del matrices
+
+    def test_string_labels_unpadded(self):
+        labels = ["A" * 1000, "B", "Ä,B"]
+        with tempfile.TemporaryDirectory() as directory:
+            SpeciesMatrix.from_species_lists([labels, ["B"]]).save(directory)
+            self.assertLess(os.path.getsize(os.path.join(directory, "species.npy")), 1200)
+            matrix = SpeciesMatrix.load(directory)
+            self.assertEqual(matrix.species.tolist(), labels)
+            self.assertEqual(matrix.counts()[1], {"A" * 1000: 1, "B": 2, "Ä,B": 1})
+            del matrix
+
+    def test_select(self):
+        matrix = SpeciesMatrix.from_species_lists([["a", "b", "a"], [], ["c"], ["b", "b"]])
+        self.assertEqual(matrix.abundance_matrix().toarray().tolist(), [[2, 1, 0], [0, 0, 0], [0, 0, 1], [0, 2, 0]])
+        self.assertEqual(matrix.select([False, True, False, True]).counts(), ({"b": 2}, {"b": 1}, 1))
+        self.assertEqual(matrix.select([3, 0]).incidence_matrix().toarray().tolist(), [[0, 1, 0], [1, 1, 0]])
+
+
+class TestNonparametricBootstrap(unittest.TestCase):
+    def test_replicates_resample_traces(self):
+        matrix = SpeciesMatrix.from_species_lists([["a", "b"], ["a"], [], ["c", "a"]])
+        replicates = list(generate_nonparametric_bootstrap_samples_incidence(matrix, 50, seed=0, batch_size=7))
+        self.assertEqual(len(replicates), 50)
+        for counts, sample_size in replicates:
+            # species a occurs in every non-empty trace
+            self.assertEqual(counts[0], sample_size)
+            self.assertLessEqual(sample_size, 4)
+
+    def test_ci_equal_scalar_estimates(self):
+        rng = np.random.default_rng(0)
+        matrix = SpeciesMatrix.from_species_lists([[str(a) for a in rng.zipf(1.5, size=rng.integers(0, 6)) % 50]
+                                                   for _ in range(300)])
+        replicates = list(generate_nonparametric_bootstrap_samples_incidence(matrix, 30, seed=1, batch_size=8))
+        d0 = [hill_number_asymptotic(0, counts, n, abundance=False) for counts, n in replicates]
+        c1 = [coverage(counts, n) for counts, n in replicates]
+        ci = get_nonparametric_bootstrap_ci_incidence(matrix, 30, seed=1, batch_size=8)
+        self.assertAlmostEqual(ci[0], statistics.stdev(d0) * 1.96)
+        self.assertAlmostEqual(ci[4], statistics.stdev(c1) * 1.96)
+
+    def test_estimator(self):
+        rng = np.random.default_rng(0)
+        log = create_log([[str(a) for a in rng.zipf(1.5, size=rng.integers(1, 6)) % 200] for _ in range(500)])
+        estimator = SpeciesEstimator(no_bootstrap_samples=50, bootstrap_method="nonparametric")
+        estimator.register("1-gram", NGram(1))
+        self.assertRaises(RuntimeError, estimator.apply, log, False)
+
+        estimator = SpeciesEstimator(no_bootstrap_samples=50, bootstrap_method="nonparametric")
+        estimator.register("1-gram", NGram(1))
+        estimator.build_matrices(log, verbose=False)
+        estimator.apply(log, verbose=False)
+        self.assertGreater(estimator.metrics["1-gram"]["incidence_estimate_d0_ci"][-1], 0)
+
+        # the matrix of the full log does not match the estimates of a subset of its traces
+        estimator = SpeciesEstimator(no_bootstrap_samples=50, bootstrap_method="nonparametric")
+        estimator.register("1-gram", NGram(1))
+        estimator.build_matrices(log, verbose=False)
+        self.assertRaises(RuntimeError, estimator.apply, log[:100], False)
+
+
+def create_random_log(size, seed):
+    rng = np.random.default_rng(seed)
+    return create_log([[str(a) for a in rng.integers(0, 8, size=rng.integers(1, 6))] for _ in range(size)])
+
+
+class TestPermutationProfiles(unittest.TestCase):
+    log = create_random_log(60, 2)
+
+    def test_apply_matrices_equals_apply(self):
+        estimator = SpeciesEstimator(step_size=7)
+        estimator.register("2-gram", NGram(2))
+        estimator.apply(self.log, verbose=False)
+        derived = estimator.derive()
+        derived.build_matrices(self.log, verbose=False)
+        derived.apply_matrices(verbose=False)
+        for metric in ["incidence_no_observations", "incidence_sample_d0", "abundance_estimate_d1", "incidence_c1"]:
+            np.testing.assert_allclose(derived.metrics["2-gram"][metric], estimator.metrics["2-gram"][metric])
+
+    def test_permutation_profiles(self):
+        estimator = SpeciesEstimator(checkpoints=[10, 20, 40])
+        estimator.register("2-gram", NGram(2))
+        profiles = estimator.permutation_profiles(self.log, k=8, seed=0, verbose=False)
+        self.assertEqual(estimator.metrics["2-gram"]["incidence_no_observations"], [0])
+
+        sizes = profiles[profiles["metric"] == "incidence_no_observations"]
+        self.assertEqual(sizes["mean"].tolist(), [0, 10, 20, 40, 60])
+        richness = profiles[profiles["metric"] == "incidence_sample_d0"]
+        # the species of the full log do not depend on the order of traces
+        self.assertEqual(richness["lower"].iloc[-1], richness["upper"].iloc[-1])
+        self.assertLess(richness["lower"].iloc[1], richness["upper"].iloc[1])
+        self.assertTrue(profiles.equals(estimator.permutation_profiles(k=8, seed=0, verbose=False)))
+
+
+class TestProfileSubset(unittest.TestCase):
+    log = create_random_log(50, 3)
+
+    def test_subset_equals_sub_log(self):
+        for i, trace in enumerate(self.log):
+            trace.attributes["concept:name"] = "case " + str(i)
+        estimator = create_estimator()
+        estimator.build_matrices(self.log, verbose=False)
+
+        mask = np.arange(50) % 3 == 0
+        expected = create_estimator()
+        expected.apply(create_log([[e["concept:name"] for e in trace] for trace in self.log[::3]]), verbose=False)
+        for selection in [mask, np.flatnonzero(mask), ["case " + str(i) for i in range(0, 50, 3)]]:
+            subset = estimator.profile_subset(selection)
+            self.assertEqual(subset.matrix_case_ids[1], "case 3")
+            for species_id in ["2-gram", "variant", "1-gram", "3-gram"]:
+                for metric in ["incidence_no_observations", "abundance_sample_d0", "incidence_estimate_d1"]:
+                    self.assertAlmostEqual(subset.metrics[species_id][metric][-1],
+                                           expected.metrics[species_id][metric][-1])
+        self.assertEqual(estimator.metrics["2-gram"]["incidence_no_observations"], [0])
+        self.assertRaises(RuntimeError, estimator.profile_subset, ["unknown case"])
+
+    def test_checkpoints(self):
+        estimator = create_estimator()
+        estimator.build_matrices(self.log, verbose=False)
+        subset = estimator.profile_subset(np.arange(20), checkpoints=5)
+        self.assertEqual(subset.metrics["1-gram"]["incidence_no_observations"], [0, 5, 10, 15, 20])
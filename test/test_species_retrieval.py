@@ -0,0 +1,248 @@
+import os
+import pickle
+import tempfile
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pm4py
+from pm4py.objects.log.obj import EventLog, Trace, Event
+
+from special4pm.estimation.species_estimator import SpeciesEstimator
+from special4pm.species.species_retrieval import retrieve_species_n_gram, retrieve_species_n_gram_family, \
+    retrieve_species_prefix_family, retrieve_timed_activity, retrieve_timed_activity_dataframe, \
+    retrieve_timed_activity_exponential, retrieve_timed_activity_exponential_dataframe
+from special4pm.species.hashing import VariantTable
+from special4pm.species.specs import NGram, AttributeNGram, TraceVariant, HashedTraceVariant, TimedActivity, \
+    EncodedSpeciesSpec, compile_species
+from special4pm.species.vectorized import EncodedLog
+
+
+def create_log(variants):
+    log = EventLog()
+    for variant in variants:
+        log.append(Trace([Event({"concept:name": a}) for a in variant]))
+    return log
+
+
+class TestVectorizedNGrams(unittest.TestCase):
+    log = create_log(["ABCAB", "A", "", "ABD", "CCCC", "DABCA", "AB", "BBA"])
+
+    def test_counts_equal_trace_wise_retrieval(self):
+        encoded = EncodedLog.from_log(self.log)
+        for n in range(1, 6):
+            abundance, incidence, empty = encoded.n_gram_counts(n, 1, 7)
+            species = [retrieve_species_n_gram(tr, n) for tr in self.log[1:7]]
+            self.assertEqual(abundance, dict(Counter(s for trace_species in species for s in trace_species)))
+            self.assertEqual(incidence, dict(Counter(s for trace_species in species for s in set(trace_species))))
+            self.assertEqual(empty, sum(1 for trace_species in species if len(trace_species) == 0))
+
+    def test_missing_activity(self):
+        df = pd.DataFrame({"case:concept:name": ["1", "1", "1"], "concept:name": ["a", np.nan, "b"]})
+        abundance, _, _ = EncodedLog.from_dataframe(df).n_gram_counts(1)
+        self.assertEqual(abundance, {"a": 1, "nan": 1, "b": 1})
+
+    def test_estimator_profiles_equal_trace_wise_retrieval(self):
+        vectorized = SpeciesEstimator(step_size=3)
+        vectorized.register("2-gram", partial(retrieve_species_n_gram, n=2))
+        trace_wise = SpeciesEstimator(step_size=3)
+        trace_wise.register("2-gram", lambda trace: retrieve_species_n_gram(trace, 2))
+
+        vectorized.apply(self.log, verbose=False)
+        trace_wise.apply(self.log, verbose=False)
+        self.assertEqual(vectorized.metrics["2-gram"].reference_sample_incidence,
+                         trace_wise.metrics["2-gram"].reference_sample_incidence)
+        self.assertEqual(vectorized.metrics["2-gram"]["incidence_no_observations"],
+                         trace_wise.metrics["2-gram"]["incidence_no_observations"])
+        for metric in ["incidence_sample_d0", "incidence_estimate_d0", "incidence_c1"]:
+            for a, b in zip(vectorized.metrics["2-gram"][metric], trace_wise.metrics["2-gram"][metric]):
+                self.assertAlmostEqual(a, b)
+
+
+class TestSpeciesFamilies(unittest.TestCase):
+    log = create_log(["ABCAB", "A", "ABD", "CCCC", "DABCA", "AB", "BBA"])
+
+    def test_n_gram_family_equals_single_n_grams(self):
+        for trace in self.log:
+            self.assertEqual(retrieve_species_n_gram_family(trace, [3, 1, 2]),
+                             [retrieve_species_n_gram(trace, n) for n in [3, 1, 2]])
+
+    def test_prefix_family(self):
+        self.assertEqual(retrieve_species_prefix_family(self.log[0], [1, 3, 6]), [["A"], ["A,B,C"], []])
+
+    def test_family_registration_equals_single_registrations(self):
+        family = SpeciesEstimator(step_size=2)
+        family.register_family(["1-gram", "2-gram"], lambda trace: retrieve_species_n_gram_family(trace, [1, 2]))
+        single = SpeciesEstimator(step_size=2)
+        single.register("1-gram", lambda trace: retrieve_species_n_gram(trace, 1))
+        single.register("2-gram", lambda trace: retrieve_species_n_gram(trace, 2))
+
+        family.apply(self.log, verbose=False)
+        single.apply(self.log, verbose=False)
+        for species_id in ["1-gram", "2-gram"]:
+            self.assertEqual(family.metrics[species_id].reference_sample_abundance,
+                             single.metrics[species_id].reference_sample_abundance)
+            self.assertEqual(family.metrics[species_id]["incidence_no_observations"],
+                             single.metrics[species_id]["incidence_no_observations"])
+            self.assertEqual(family.metrics[species_id]["incidence_sample_d0"],
+                             single.metrics[species_id]["incidence_sample_d0"])
+
+
+class TestTimedActivityLifecycle(unittest.TestCase):
+    @staticmethod
+    def create_lifecycle_log(traces):
+        log = EventLog()
+        for case, events in enumerate(traces):
+            log.append(Trace([Event({"concept:name": a, "lifecycle:transition": lc,
+                                     "time:timestamp": datetime(2024, 1, 1) + timedelta(hours=h)})
+                              for a, lc, h in events], attributes={"concept:name": str(case)}))
+        return log
+
+    log = create_lifecycle_log([
+        [("A", "start", 0), ("A", "start", 1), ("B", "start", 2), ("A", "complete", 4), ("A", "complete", 9),
+         ("B", "complete", 10)],
+        [("A", "complete", 0), ("A", "start", 3), ("B", "complete", 5), ("A", "complete", 7)],
+        [("A", "complete", 0), ("A", "complete", 2)]
+    ])
+
+    def test_starts_and_completes_matched_first_in_first_out(self):
+        self.assertEqual(retrieve_timed_activity(self.log[0], 1), ["A_4", "A_8", "B_8"])
+        self.assertEqual(retrieve_timed_activity(self.log[1], 1), ["A_1", "B_2", "A_4"])
+        self.assertEqual(retrieve_timed_activity(self.log[2], 1), ["A_1", "A_2"])
+
+    def test_dataframe_variants_equal_trace_wise_retrieval(self):
+        df = pm4py.convert_to_dataframe(self.log)
+        for interval_size in [1, 2.5]:
+            species = retrieve_timed_activity_dataframe(df, interval_size)
+            for trace in self.log:
+                self.assertEqual(species[trace.attributes["concept:name"]],
+                                 retrieve_timed_activity(trace, interval_size))
+        species = retrieve_timed_activity_exponential_dataframe(df)
+        for trace in self.log:
+            self.assertEqual(species[trace.attributes["concept:name"]], retrieve_timed_activity_exponential(trace))
+
+
+class TestSpeciesSpecs(unittest.TestCase):
+    log = TestTimedActivityLifecycle.log
+    specs = {"2-gram": NGram(2), "lifecycle 2-gram": AttributeNGram("lifecycle:transition", 2), "variant": TraceVariant(),
+             "timed": TimedActivity(2), "timed exponential": TimedActivity()}
+
+    def test_specs_hashable_and_picklable(self):
+        self.assertEqual(pickle.loads(pickle.dumps(self.specs)), self.specs)
+        self.assertEqual(len({NGram(2), NGram(2), NGram(3)}), 2)
+        self.assertEqual(compile_species(partial(retrieve_species_n_gram, n=2)), NGram(2))
+        self.assertEqual(compile_species(partial(retrieve_timed_activity, interval_size=2)), TimedActivity(2))
+
+    def test_incomplete_spec_not_instantiable(self):
+        class Incomplete(EncodedSpeciesSpec):
+            def __call__(self, trace) -> list:
+                return []
+
+            def encoded_counts(self, encoded, start, stop):
+                return {}, {}, 0
+
+        self.assertRaises(TypeError, Incomplete)
+
+    def test_backends_equal_trace_wise_retrieval(self):
+        estimators = [SpeciesEstimator(step_size=2) for _ in range(3)]
+        for species_id, spec in self.specs.items():
+            estimators[0].register(species_id, spec)
+            estimators[1].register(species_id, spec)
+            estimators[2].register(species_id, lambda trace, spec=spec: spec(trace))
+        estimators[0].apply(pm4py.convert_to_dataframe(self.log), verbose=False)
+        estimators[1].apply(self.log, verbose=False)
+        estimators[2].apply(self.log, verbose=False)
+        for species_id in self.specs.keys():
+            for estimator in estimators[:2]:
+                self.assertEqual(estimator.metrics[species_id].reference_sample_abundance,
+                                 estimators[2].metrics[species_id].reference_sample_abundance)
+                self.assertEqual(estimator.metrics[species_id]["incidence_sample_d0"],
+                                 estimators[2].metrics[species_id]["incidence_sample_d0"])
+
+    def test_memoized_retrieval_equals_retrieval(self):
+        log = [self.log[0], self.log[1], self.log[0], self.log[2], self.log[0]]
+        memoized = SpeciesEstimator(step_size=1, cache_size=2)
+        plain = SpeciesEstimator(step_size=1)
+        for species_id, spec in self.specs.items():
+            memoized.register(species_id, spec)
+            plain.register(species_id, spec)
+        for trace in log:
+            memoized.apply(trace)
+            plain.apply(trace)
+        for species_id in self.specs.keys():
+            self.assertEqual(memoized.metrics[species_id].reference_sample_incidence,
+                             plain.metrics[species_id].reference_sample_incidence)
+            self.assertEqual(memoized.metrics[species_id]["incidence_sample_d1"],
+                             plain.metrics[species_id]["incidence_sample_d1"])
+        self.assertEqual(memoized.species_cache.hits, 2 * len(self.specs))
+        self.assertEqual(len(memoized.species_cache.entries[NGram(2)]), 2)
+
+    def test_variant_compressed_ingestion_equals_trace_wise_retrieval(self):
+        log = EventLog([self.log[0], self.log[1], self.log[0], self.log[2], self.log[0], self.log[1]])
+        compressed = SpeciesEstimator(step_size=None)
+        trace_wise = SpeciesEstimator(step_size=None)
+        for species_id, spec in self.specs.items():
+            compressed.register(species_id, spec)
+            trace_wise.register(species_id, lambda trace, spec=spec: spec(trace))
+        compressed.apply(log, verbose=False)
+        trace_wise.apply(log, verbose=False)
+        for species_id in self.specs.keys():
+            self.assertEqual(compressed.metrics[species_id].reference_sample_abundance,
+                             trace_wise.metrics[species_id].reference_sample_abundance)
+            self.assertEqual(compressed.metrics[species_id].reference_sample_incidence,
+                             trace_wise.metrics[species_id].reference_sample_incidence)
+            for metric in ["incidence_no_observations", "abundance_no_observations", "incidence_estimate_d0"]:
+                self.assertAlmostEqual(compressed.metrics[species_id][metric][-1],
+                                       trace_wise.metrics[species_id][metric][-1])
+        self.assertEqual(EncodedLog.from_log(log).compress().multiplicities.tolist(), [3, 2, 1])
+
+
+class TestHashedTraceVariants(unittest.TestCase):
+    log = create_log(["ABCAB", "A", "", "ABD", "A", "ABCAB", "AB", "BBA"])
+
+    def test_hashed_variants_equal_variants(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "variants.db")
+            estimator = SpeciesEstimator(step_size=3)
+            estimator.register("variant", TraceVariant())
+            estimator.register("hashed", HashedTraceVariant(side_table=path))
+            estimator.register("hashed 128", lambda trace: HashedTraceVariant(bits=128)(trace))
+            estimator.apply(self.log, verbose=False)
+            HashedTraceVariant(side_table=path).close()
+
+            variants = estimator.metrics["variant"].reference_sample_incidence
+            hashed = estimator.metrics["hashed"].reference_sample_incidence
+            with VariantTable(path) as table:
+                self.assertEqual(table.lookup(list(hashed.keys())),
+                                 {h: v for h, v in zip(hashed.keys(), variants.keys())})
+            self.assertEqual(list(hashed.values()), list(variants.values()))
+            self.assertEqual(estimator.metrics["hashed 128"]["incidence_sample_d1"],
+                             estimator.metrics["variant"]["incidence_sample_d1"])
+
+    def test_collision_detected(self):
+        with tempfile.TemporaryDirectory() as directory:
+            table = VariantTable(os.path.join(directory, "variants.db"))
+            table.record({1: "A,B", 2: "B"})
+            table.record({1: "A,B"})
+            self.assertEqual(len(table), 2)
+            self.assertRaises(RuntimeError, table.record, {2: "C"})
+            table.close()
+
+    def test_trace_wise_equal_encoded(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "variants.db")
+            spec = HashedTraceVariant(side_table=path)
+            counts = spec.encoded_counts(EncodedLog.from_log(self.log), 0, len(self.log))[0]
+            expected = {}
+            for trace in self.log:
+                h = spec(trace)[0]
+                expected[h] = expected.get(h, 0) + 1
+            self.assertEqual(counts, expected)
+            spec.close()
+            with VariantTable(path, batch_size=3) as table:
+                table.stage({1: "A,B", 2: "B"})
+                self.assertRaises(RuntimeError, table.stage, {1: "C"})
+                self.assertEqual(len(table), len(expected) + 2)